@@ -0,0 +1,99 @@
+"""
+Aggregated formulation benchmark.
+
+A waiting list is generated as the optimizers would pass it to the models:
+blocks of a weekly master with one or two equipes, patients of the equipes
+with an urgency class (urgency weight and maximum waiting days), days already
+waited and a predicted nominal duration. The list is scheduled by
+StandardImplementor and by AggregatedImplementor (matrix backend for both),
+reporting the number of variables, the number of patient classes, the solve
+time and the objective. Both are solved with a time limit, so on large lists
+the standard model stops with a gap.
+
+Usage:
+    python benchmarks/aggregated_formulation.py --patients 1000 --resolution 15
+    python benchmarks/aggregated_formulation.py --patients 5000 --skip-standard
+"""
+
+# Python STL
+import argparse
+import time
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, AggregatedImplementor
+
+
+# Urgency class: (urgency weight u, maximum waiting days)
+URGENCY_CLASSES = [(3., 30.), (2., 60.), (1., 180.)]
+
+
+def waiting_list_data(n_days: int, n_rooms: int, n_pats: int, n_equipes: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    n_blocks = n_days * n_rooms
+
+    block_equipes = [set(rng.choice(n_equipes, size=rng.integers(1, 3), replace=False)) for _ in range(n_blocks)]
+    equipes = rng.integers(0, n_equipes, n_pats)
+    urgency = rng.integers(0, len(URGENCY_CLASSES), n_pats)
+    u = np.array([URGENCY_CLASSES[c][0] for c in urgency])
+    l = np.array([URGENCY_CLASSES[c][1] for c in urgency])
+    w = np.floor(rng.uniform(0, 1.1, n_pats) * l)
+    durations = np.exp(rng.normal(np.log(90) + 0.3 * equipes / n_equipes, 0.4))
+
+    data = {
+        'n_days': {None: n_days},
+        'n_rooms': {None: n_rooms},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: float(rng.choice([240, 360, 480])) for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): int(equipes[i] in block_equipes[b]) for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: durations[i] for i in range(n_pats)},
+        'u': {i + 1: u[i] for i in range(n_pats)},
+        'w': {i + 1: w[i] for i in range(n_pats)},
+        'l': {i + 1: l[i] for i in range(n_pats)},
+    }
+    return {None: data}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--rooms', type=int, default=6)
+    parser.add_argument('--patients', type=int, default=1_000)
+    parser.add_argument('--equipes', type=int, default=6)
+    parser.add_argument('--resolution', type=float, default=15.)
+    parser.add_argument('--time-limit', type=float, default=60.)
+    parser.add_argument('--skip-standard', action='store_true')
+    args = parser.parse_args()
+
+    data = waiting_list_data(args.days, args.rooms, args.patients, args.equipes)
+
+    implementors = [('aggregated', AggregatedImplementor(duration_resolution=args.resolution, backend='matrix'))]
+    if not args.skip_standard:
+        implementors.insert(0, ('standard', StandardImplementor(backend='matrix')))
+
+    for name, implementor in implementors:
+        implementor.instance_data = data
+
+        start = time.perf_counter()
+        model = implementor.build()
+        solution = model.solve(time_limit=args.time_limit)
+        elapsed = time.perf_counter() - start
+
+        if name == 'aggregated':
+            classes = f"{implementor.classes.num_of_classes:6d} classes"
+            objective = implementor.classes.objective(solution.value('n'))
+        else:
+            classes = " " * 14
+            objective = solution.obj()
+        print(f"{name:10s} {model.num_of_columns:8d} variables {classes}  {elapsed:8.2f} s  "
+              f"gap {solution.statistics['mip_gap']:8.2e}  objective {objective:.4f}")
+
+
+if __name__ == '__main__':
+    main()
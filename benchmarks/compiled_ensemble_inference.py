@@ -0,0 +1,73 @@
+"""
+Inference benchmark of the compiled tree ensembles.
+
+An NGBoost model is fitted on a synthetic history, then the distributions of a
+large batch of patients are predicted with NGBRegressor.pred_dist and with the
+CompiledEnsemble of the same model. Times and the largest difference of the
+predicted parameters are reported.
+
+Usage:
+    python benchmarks/compiled_ensemble_inference.py --inference 100000
+    python benchmarks/compiled_ensemble_inference.py --model NGBNormal --max-depth 5
+"""
+
+# Python STL
+import argparse
+import time
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty import predictive_model
+
+
+def synthetic_patients(quantity: int, num_of_features: int, seed: int = 0) -> list[Patient]:
+    rng = np.random.default_rng(seed)
+    features = np.hstack([rng.uniform(0, 1, (quantity, 3)),
+                          rng.integers(0, 2, (quantity, num_of_features - 3))]).astype(float)
+    target = np.exp(4.2 + features[:, 0] + 0.5 * features[:, 3] + rng.normal(0, 0.2 + 0.3 * features[:, 1], quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=0, features=features[id], target=target[id])
+            for id in range(quantity)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', choices=['NGBLogNormal', 'NGBNormal'], default='NGBLogNormal')
+    parser.add_argument('--training', type=int, default=3_000)
+    parser.add_argument('--inference', type=int, default=100_000)
+    parser.add_argument('--features', type=int, default=20)
+    parser.add_argument('--n-estimators', type=int, default=500)
+    parser.add_argument('--max-depth', type=int, default=3)
+    args = parser.parse_args()
+
+    model_class = getattr(predictive_model, args.model)
+    model = model_class(patients=synthetic_patients(args.training, args.features),
+                        hyperparameters={'n_estimators': args.n_estimators, 'max_depth': args.max_depth})
+    features = model._extract_features(synthetic_patients(args.inference, args.features, seed=1))
+
+    start = time.perf_counter()
+    expected = model._model.pred_dist(features).params
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.compile()
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = model._compiled.pred_dist(features).params
+    compiled_time = time.perf_counter() - start
+
+    difference = max(np.max(np.abs(compiled[name] - expected[name]) / np.maximum(np.abs(expected[name]), 1))
+                     for name in expected)
+
+    print(f"{model._compiled.num_of_trees} trees of depth {model._compiled.depth}, {args.inference} patients")
+    print(f"pred_dist           {reference_time:8.2f} s")
+    print(f"compile             {compile_time:8.2f} s")
+    print(f"compiled pred_dist  {compiled_time:8.2f} s   speedup {reference_time / compiled_time:5.1f}x")
+    print(f"max relative difference {difference:.2e}")
+
+
+if __name__ == '__main__':
+    main()
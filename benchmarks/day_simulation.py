@@ -0,0 +1,95 @@
+"""
+Day simulation benchmark.
+
+A week of blocks (rooms with a morning and an afternoon block every day, each
+of an equipe drawn from a few) is filled with patients of the block equipe,
+with lognormal duration profiles, and simulated by DaySimulator. For comparison the same scenarios are simulated
+one at a time with Python scalars, surgery by surgery.
+
+Usage:
+    python benchmarks/day_simulation.py --rooms 6 --scenarios 10000
+    python benchmarks/day_simulation.py --scenarios 2000 --loop
+"""
+
+# Python STL
+import argparse
+import time
+import types
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.block import ScheduleBlock
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.uncertainty_profile import LogNormalDistribution, sample_profiles
+from surgeryschedulingunderuncertainty.simulation import DaySimulator
+
+
+def week_schedule(n_rooms: int, n_equipes: int, seed: int = 0) -> types.SimpleNamespace:
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for weekday in range(1, 6):
+        for room in range(n_rooms):
+            for half, duration in enumerate([300., 240.]):
+                equipe = f'E{rng.integers(n_equipes)}'
+                block = ScheduleBlock(duration=duration, equipes=[equipe], room=f'R{room}', weekday=weekday,
+                                      order_in_day=2 * room + half, order_in_week=0, order_in_schedule=len(blocks))
+                scheduled = 0.
+                while True:
+                    mean = float(rng.uniform(45, 150))
+                    if scheduled + mean > duration:
+                        break
+                    scheduled += mean
+                    block.add_patient(Patient(id=len(blocks) * 100 + block.get_num_of_patients(),
+                                              equipe=equipe, urgency=1, days_waiting=0,
+                                              uncertainty_profile=LogNormalDistribution(param_s=0.3 * mean, param_scale=mean)))
+                blocks.append(block)
+    return types.SimpleNamespace(blocks=blocks)
+
+
+def loop_simulation(simulator: DaySimulator, durations: np.ndarray) -> float:
+    """ Scenario by scenario, surgery by surgery: returns the cancellation rate. """
+    surgeries = simulator.surgeries
+    closing = simulator._closing
+    plan = list(zip(surgeries['room_day'], surgeries['equipe_day'], surgeries['block_start'], surgeries['nominal_duration']))
+    cancellations = 0
+    for scenario in durations:
+        room_free, equipe_free = {}, {}
+        for s, (room_day, equipe_day, block_start, nominal_duration) in enumerate(plan):
+            begin = max(room_free.get(room_day, 0.), equipe_free.get(equipe_day, 0.), block_start)
+            if begin + nominal_duration > closing[room_day]:
+                cancellations += 1
+                continue
+            room_free[room_day] = equipe_free[equipe_day] = begin + scenario[s]
+    return cancellations / durations.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=6)
+    parser.add_argument('--equipes', type=int, default=8)
+    parser.add_argument('--scenarios', type=int, default=10_000)
+    parser.add_argument('--loop', action='store_true', help="also time the scenario by scenario simulation")
+    args = parser.parse_args()
+
+    schedule = week_schedule(args.rooms, args.equipes)
+    simulator = DaySimulator(schedule, seed=0)
+    print(f"{len(schedule.blocks)} blocks, {len(simulator.surgeries)} surgeries, {args.scenarios} scenarios of the week")
+
+    start = time.perf_counter()
+    simulator.run(n_scenarios=args.scenarios)
+    print(f"simulator            {time.perf_counter() - start:8.2f} s")
+    for name, value in simulator.summary.items():
+        print(f"    {name:32s} {value:12.4f}")
+
+    if args.loop:
+        np.random.seed(0)
+        durations = sample_profiles(simulator._profiles, args.scenarios)
+        start = time.perf_counter()
+        cancellation_rate = loop_simulation(simulator, durations)
+        print(f"scenario by scenario {time.perf_counter() - start:8.2f} s  (cancellation rate {cancellation_rate:.4f})")
+
+
+if __name__ == '__main__':
+    main()
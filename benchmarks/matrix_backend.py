@@ -0,0 +1,90 @@
+"""
+Model generation benchmark of the matrix backend of the implementors.
+
+Random instance data of the given size is built for StandardImplementor, then
+the model is generated by Pyomo (create_instance, which builds the constraint
+expressions) and by the matrix backend (sparse arrays assembled from the
+instance data). With --solve both models are also solved and the objectives
+compared; use a small instance for that.
+
+Usage:
+    python benchmarks/matrix_backend.py --blocks 200 --patients 1000 --realizations 5
+    python benchmarks/matrix_backend.py --blocks 10 --patients 40 --solve
+"""
+
+# Python STL
+import argparse
+import time
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor
+
+
+def instance_data(n_blocks: int, n_pats: int, n_realizations: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    compatibility = rng.random((n_blocks, n_pats)) < 0.3
+    data = {
+        'n_days': {None: max(1, n_blocks // 4)},
+        'n_rooms': {None: 4},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: n_realizations},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: int(rng.choice([240, 360, 480])) for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): int(compatibility[b, i]) for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: float(rng.uniform(30, 150)) for i in range(n_pats)},
+        'u': {i + 1: float(rng.integers(1, 4)) for i in range(n_pats)},
+        'w': {i + 1: float(rng.integers(0, 30)) for i in range(n_pats)},
+        'l': {i + 1: float(rng.integers(1, 60)) for i in range(n_pats)},
+        'eps': {(i + 1, k + 1): float(rng.uniform(0, 30)) for i in range(n_pats) for k in range(n_realizations)},
+    }
+    return {None: data}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=100)
+    parser.add_argument('--patients', type=int, default=1_000)
+    parser.add_argument('--realizations', type=int, default=5)
+    parser.add_argument('--solve', action='store_true')
+    args = parser.parse_args()
+
+    data = instance_data(args.blocks, args.patients, args.realizations)
+
+    pyomo_implementor = StandardImplementor()
+    pyomo_implementor.instance_data = data
+    start = time.perf_counter()
+    pyomo_implementor.build()
+    pyomo_time = time.perf_counter() - start
+
+    matrix_implementor = StandardImplementor(backend='matrix')
+    matrix_implementor.instance_data = data
+    start = time.perf_counter()
+    model = matrix_implementor.build()
+    matrix_time = time.perf_counter() - start
+
+    print(f"{args.blocks} blocks, {args.patients} patients, {args.realizations} realizations: "
+          f"{model.num_of_rows} rows, {model.num_of_columns} columns")
+    print(f"pyomo create_instance  {pyomo_time:8.2f} s")
+    print(f"matrix assembly        {matrix_time:8.2f} s   speedup {pyomo_time / matrix_time:5.1f}x")
+
+    if args.solve:
+        start = time.perf_counter()
+        expected = pyo.value(pyomo_implementor.solve().obj)
+        pyomo_solve = time.perf_counter() - start
+
+        start = time.perf_counter()
+        objective = matrix_implementor.solve().obj()
+        matrix_solve = time.perf_counter() - start
+
+        print(f"pyomo solve            {pyomo_solve:8.2f} s   objective {expected:.4f}")
+        print(f"matrix solve           {matrix_solve:8.2f} s   objective {objective:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark of XGBQuantile against NGBLogNormal.
+
+Both models are fitted on the same synthetic history and compared on fit time,
+predict time, negative log likelihood and calibration of the quantiles used by
+the chance constraints (fraction of test targets below the predicted quantile).
+
+Usage:
+    python benchmarks/quantile_vs_ngboost.py --training 20000 --test 20000
+"""
+
+# Python STL
+import argparse
+import time
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal, XGBQuantile
+
+
+def synthetic_patients(quantity: int, num_of_features: int, seed: int = 0) -> list[Patient]:
+    rng = np.random.default_rng(seed)
+    features = np.hstack([rng.uniform(0, 1, (quantity, 3)),
+                          rng.integers(0, 2, (quantity, num_of_features - 3))]).astype(float)
+    # Skewed durations, the spread depends on the features
+    target = np.exp(4.2 + features[:, 0] + 0.5 * features[:, 3] + rng.normal(0, 0.2 + 0.3 * features[:, 1], quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=0, features=features[id], target=target[id])
+            for id in range(quantity)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--training', type=int, default=20_000)
+    parser.add_argument('--test', type=int, default=20_000)
+    parser.add_argument('--features', type=int, default=20)
+    parser.add_argument('--levels', type=float, nargs='+', default=[0.5, 0.8, 0.9, 0.95])
+    args = parser.parse_args()
+
+    training = synthetic_patients(args.training, args.features, seed=0)
+    test = synthetic_patients(args.test, args.features, seed=1)
+    target = np.array([patient.target for patient in test])
+
+    print(f"{'model':<14}{'fit s':>10}{'predict s':>12}{'nll':>9}" + ''.join(f"{'cov ' + str(x):>11}" for x in args.levels))
+
+    for model_class in [XGBQuantile, NGBLogNormal]:
+        start = time.perf_counter()
+        model = model_class(patients=training)
+        fit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = model.predict_batch(test)
+        predict_time = time.perf_counter() - start
+
+        coverages = [np.mean(target <= batch.percent_point_function(level)) for level in args.levels]
+        nll = model.negative_log_likelihood(test)
+
+        print(f"{model_class.__name__:<14}{fit_time:>10.2f}{predict_time:>12.2f}{nll:>9.3f}" 
+              + ''.join(f"{x:>11.3f}" for x in coverages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""
+End-to-end benchmark suite.
+
+For each scale a synthetic history and master schedule are generated (see
+surgeryschedulingunderuncertainty.synthetic), the waiting list and the training
+set are provided by PatientsFromHistoricalDataProvider, an NGBLogNormal model is
+trained and predicts the durations of the waiting list, then the run method of
+every optimizer is run:
+    vanilla                 VanillaImplementor with StandardImplementor
+    vanilla-cc              VanillaImplementor with ChanceConstraintsImplementor
+    implementor-adversary   ImplementorAdversary with StandardImplementor
+    budget-set              BudgetSet with BSImplementor
+The stages (provider, training, prediction, calibration, instance build, model
+build, solve, schedule extraction, adversary) are timed by the spans of the
+instrumentation (see surgeryschedulingunderuncertainty.instrumentation), see
+STAGE_SPANS: each stage records its calls, wall and CPU time and, with
+--tracemalloc, its traced memory peak. Each run records its objective, its
+scheduled patients and the resident set peak of the process. With --trace the
+spans and counters are also written as a Chrome trace file. Results are
+written as JSON, with the versions of the code and of the main packages, to be
+compared across versions.
+
+Scales (patients in the waiting list, training patients, blocks, equipes):
+    xs   50      200    10   3
+    s    200     1000   25   4
+    m    1000    3000   60   6
+    l    5000    10000  200  10
+    xl   20000   20000  500  20
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales xs s --output benchmark.json
+    python benchmarks/run_benchmarks.py --scales m l --backend matrix --time-limit 120
+    python benchmarks/run_benchmarks.py --optimizers vanilla budget-set --tracemalloc
+    python benchmarks/run_benchmarks.py --scales s --trace benchmark-trace.json
+"""
+
+# Python STL
+import argparse
+import datetime
+import importlib.metadata
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+from surgeryschedulingunderuncertainty.synthetic import synthetic_history, synthetic_master, URGENCY_TO_MAX_WAITING_DAYS
+from surgeryschedulingunderuncertainty.patients_provider import PatientsFromHistoricalDataProvider
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal
+from surgeryschedulingunderuncertainty.master import Master
+from surgeryschedulingunderuncertainty.task import Task
+from surgeryschedulingunderuncertainty.schedule import Schedule
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, ChanceConstraintsImplementor, BSImplementor
+from surgeryschedulingunderuncertainty.optimizer import VanillaImplementor, ImplementorAdversary, BudgetSet
+from surgeryschedulingunderuncertainty.instrumentation import Profiler
+from surgeryschedulingunderuncertainty import instrumentation
+
+
+SCALES = {
+    'xs': {'patients': 50, 'training': 200, 'blocks': 10, 'equipes': 3},
+    's': {'patients': 200, 'training': 1_000, 'blocks': 25, 'equipes': 4},
+    'm': {'patients': 1_000, 'training': 3_000, 'blocks': 60, 'equipes': 6},
+    'l': {'patients': 5_000, 'training': 10_000, 'blocks': 200, 'equipes': 10},
+    'xl': {'patients': 20_000, 'training': 20_000, 'blocks': 500, 'equipes': 20},
+}
+
+OPTIMIZERS = ['vanilla', 'vanilla-cc', 'implementor-adversary', 'budget-set']
+
+PACKAGES = ['numpy', 'pandas', 'scipy', 'scikit-learn', 'ngboost', 'pyomo', 'highspy']
+
+
+# The spans of each stage: the benchmark ones and those of the instrumented methods called by run
+STAGE_SPANS = {
+    'provider': ['benchmark.provider'],
+    'training': ['benchmark.training'],
+    'prediction': ['benchmark.prediction'],
+    'calibration': ['BudgetSet.calibrate'],
+    'instance_build': ['VanillaImplementor.create_instance', 'ImplementorAdversary.create_instance',
+                       'BudgetSet.create_instance'],
+    'model_build': ['Implementor.build'],
+    'solve': ['Implementor.solve'],
+    'schedule_extraction': ['Schedule.__init__'],
+    'adversary': ['EquiprobableVertex.run'],
+}
+
+SPAN_TO_STAGE = {span: stage for stage, spans in STAGE_SPANS.items() for span in spans}
+
+
+def stage_times(spans: list[dict]) -> dict:
+    """
+    Calls, wall and CPU time (summed) and traced memory peak (maximized, if
+    traced) of each stage over its spans.
+    """
+    stages = {}
+    for span in spans:
+        stage_name = SPAN_TO_STAGE.get(span['name'])
+        if stage_name is None:
+            continue
+        stage = stages.setdefault(stage_name, {'seconds': 0., 'cpu_seconds': 0., 'calls': 0})
+        stage['seconds'] += span['wall']
+        stage['cpu_seconds'] += span['cpu']
+        stage['calls'] += 1
+        if 'traced_peak_mb' in span:
+            stage['traced_peak_mb'] = max(stage.get('traced_peak_mb', 0.), span['traced_peak_mb'])
+    return stages
+
+
+def _reset_peak_rss():
+    """ Reset the resident set high-water mark of the process (Linux only). """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """ Resident set high-water mark of the process, in MB. """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux, never reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def objective(solved_instance) -> float:
+    """ Objective of a solved instance, of the Pyomo or of the matrix backend. """
+    if isinstance(solved_instance.obj, pyo.Objective):
+        return float(pyo.value(solved_instance.obj))
+    return float(solved_instance.obj())
+
+
+def make_task(scale: dict, patients: list, master: Master, args) -> Task:
+    """ A new task, and no adversary realizations on the patients. """
+    for patient in patients:
+        patient.adversary_realization = []
+    task = Task(name='benchmark', num_of_weeks=1, num_of_patients=scale['patients'],
+                robustness_risk=args.robustness_risk, robustness_overtime=args.robustness_overtime,
+                urgency_to_max_waiting_days=URGENCY_TO_MAX_WAITING_DAYS)
+    task.patients = patients
+    task.master_schedule = master
+    return task
+
+
+def run_optimizer(name: str, task: Task, args) -> dict:
+    """ Run an optimizer with its run method. """
+    options = {'time_limit': args.time_limit} if args.time_limit else {}
+    result = {}
+
+    if name in ('vanilla', 'vanilla-cc'):
+        if name == 'vanilla':
+            implementor = StandardImplementor(backend=args.backend)
+        else:
+            implementor = ChanceConstraintsImplementor(task=task, backend=args.backend)
+        implementor.solver_options = options
+        optimizer = VanillaImplementor(task=task, implementor=implementor)
+        # The run method of the vanilla implementor returns the solved instance
+        schedule = Schedule(task=task, solved_instance=optimizer.run())
+
+    elif name == 'implementor-adversary':
+        implementor = StandardImplementor(backend=args.backend)
+        implementor.solver_options = options
+        optimizer = ImplementorAdversary(task=task, implementor=implementor, adversary=None)
+        schedule = optimizer.run(max_loops=args.max_loops)
+        last = optimizer.report.iloc[-1]
+        result.update(iterations=len(optimizer.report), robust=bool(last['robust']),
+                      fragile_blocks=int(last['fragile_blocks']))
+
+    elif name == 'budget-set':
+        implementor = BSImplementor(task=task, backend=args.backend)
+        implementor.solver_options = options
+        optimizer = BudgetSet(task=task, implementor=implementor)
+        schedule = optimizer.run()
+
+    else:
+        raise ValueError(f"Unknown optimizer {name}.")
+
+    result.update(solver=implementor.solver_statistics(),
+                  objective=objective(implementor.instance),
+                  scheduled_patients=int(sum(block.get_num_of_patients() for block in schedule.blocks)))
+    return result
+
+
+def run_scale(scale_name: str, args, profiler: Profiler) -> list[dict]:
+    scale = SCALES[scale_name]
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    history = synthetic_history(2 * (scale['patients'] + scale['training']), num_of_equipes=scale['equipes'],
+                                seed=args.seed)
+    master = Master(table=synthetic_master(scale['blocks'], num_of_equipes=scale['equipes'], seed=args.seed))
+
+    first_span = len(profiler.spans)
+    _reset_peak_rss()
+    with instrumentation.span('benchmark.provider'):
+        provider = PatientsFromHistoricalDataProvider(historical_data=history)
+        patients, training = provider.provide_sets(quantity=scale['patients'], quantity_training=scale['training'])
+    with instrumentation.span('benchmark.training'):
+        model = NGBLogNormal(patients=training)
+    with instrumentation.span('benchmark.prediction'):
+        patients = model.predict(patients)
+    shared = stage_times(profiler.spans[first_span:])
+    shared_peak_rss = _peak_rss_mb()
+
+    results = []
+    for name in args.optimizers:
+        record = {'scale': scale_name, **scale, 'optimizer': name, 'backend': args.backend}
+        first_span = len(profiler.spans)
+        _reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            task = make_task(scale, patients, master, args)
+            record.update(run_optimizer(name, task, args))
+            record['status'] = 'ok'
+        except Exception as error:
+            record.update(status='error', error=f"{type(error).__name__}: {error}")
+        record['seconds'] = time.perf_counter() - start
+        record['peak_rss_mb'] = max(shared_peak_rss, _peak_rss_mb())
+        record['stages'] = {**shared, **stage_times(profiler.spans[first_span:])}
+        results.append(record)
+
+        objective_text = f"{record['objective']:.2f}" if 'objective' in record else record.get('error', '')
+        print(f"{scale_name:3s} {name:22s} {record['seconds']:9.2f} s  {record['status']:5s}  {objective_text}",
+              flush=True)
+
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(), 'packages': versions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['xs', 's'])
+    parser.add_argument('--optimizers', nargs='+', choices=OPTIMIZERS, default=OPTIMIZERS)
+    parser.add_argument('--backend', choices=['pyomo', 'matrix'], default='pyomo')
+    parser.add_argument('--time-limit', type=float, default=None, help="time limit of each solve, in seconds")
+    parser.add_argument('--max-loops', type=int, default=3, help="iterations of the implementor adversary")
+    parser.add_argument('--robustness-risk', type=float, default=0.2)
+    parser.add_argument('--robustness-overtime', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true', help="also trace the memory of the stages (slow)")
+    parser.add_argument('--trace', default=None, help="Chrome trace file of the instrumentation spans")
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'arguments': vars(args),
+        'environment': environment(),
+        'results': [],
+    }
+    # The stages are timed by the spans: the profiler is always active
+    with Profiler(trace_memory=args.tracemalloc) as profiler:
+        for scale_name in args.scales:
+            report['results'].extend(run_scale(scale_name, args, profiler))
+    report['counters'] = profiler.counters
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
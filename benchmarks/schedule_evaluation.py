@@ -0,0 +1,89 @@
+"""
+Schedule evaluation benchmark.
+
+A schedule of blocks filled with patients with lognormal duration profiles is
+evaluated by ScheduleEvaluator, reporting the time of the Monte Carlo
+simulation and the metrics of the whole schedule. For comparison, the same
+number of scenarios is simulated block by block, sampling every patient
+separately as the adversary does.
+
+Usage:
+    python benchmarks/schedule_evaluation.py --blocks 200 --scenarios 100000
+    python benchmarks/schedule_evaluation.py --blocks 50 --scenarios 10000 --loop
+"""
+
+# Python STL
+import argparse
+import time
+import types
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.block import ScheduleBlock
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.uncertainty_profile import LogNormalDistribution
+from surgeryschedulingunderuncertainty.evaluation import ScheduleEvaluator
+
+
+def random_schedule(n_blocks: int, seed: int = 0) -> types.SimpleNamespace:
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for b in range(n_blocks):
+        duration = float(rng.choice([240, 360, 480]))
+        block = ScheduleBlock(duration=duration, equipes=['A'], room=f'R{b % 6}', weekday=b % 5, order_in_day=0,
+                              order_in_week=0, order_in_schedule=b)
+        scheduled = 0.
+        while True:
+            mean = float(rng.uniform(45, 150))
+            if scheduled + mean > duration:
+                break
+            scheduled += mean
+            block.add_patient(Patient(id=len(blocks) * 100 + block.get_num_of_patients(), equipe='A',
+                                      urgency=int(rng.integers(0, 3)), days_waiting=0,
+                                      uncertainty_profile=LogNormalDistribution(param_s=0.3 * mean, param_scale=mean)))
+        blocks.append(block)
+    return types.SimpleNamespace(blocks=blocks)
+
+
+def loop_overtime_probability(schedule, n_scenarios: int) -> float:
+    """ Block by block, patient by patient, as in EquiprobableVertex. """
+    probabilities = []
+    for block in schedule.blocks:
+        if block.get_num_of_patients() == 0:
+            continue
+        total = sum(patient.uncertainty_profile.sample(size=n_scenarios) for patient in block.patients)
+        probabilities.append(np.mean(total > block.duration))
+    return float(np.mean(probabilities))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--scenarios', type=int, default=100_000)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--loop', action='store_true', help="also time the block by block simulation")
+    args = parser.parse_args()
+
+    schedule = random_schedule(args.blocks)
+    n_patients = sum(block.get_num_of_patients() for block in schedule.blocks)
+    print(f"{args.blocks} blocks, {n_patients} patients, {args.scenarios} scenarios")
+
+    evaluator = ScheduleEvaluator(schedule, n_scenarios=args.scenarios, chunk_size=args.chunk_size, seed=0)
+    start = time.perf_counter()
+    blocks = evaluator.run()
+    print(f"evaluator      {time.perf_counter() - start:8.2f} s")
+    for name, value in evaluator.summary.items():
+        print(f"    {name:32s} {value:12.4f}")
+    print(f"    {'mean_block_utilization_q90':32s} {blocks['utilization_q90'].mean():12.4f}")
+
+    if args.loop:
+        start = time.perf_counter()
+        probability = loop_overtime_probability(schedule, args.scenarios)
+        print(f"block by block {time.perf_counter() - start:8.2f} s  "
+              f"(mean block overtime probability {probability:.4f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Memory benchmark of the sparse one-hot features mode.
+
+A synthetic history with high cardinality categorical columns is processed by
+PatientsFromHistoricalDataProvider with sparse_features=True, a training set is
+extracted and an NGBLogNormal model is fitted on it. Peak memory of every stage is
+measured with tracemalloc and compared with the size the dense layout would need.
+
+Usage:
+    python benchmarks/sparse_features_memory.py --rows 500000 --categories 2000
+    python benchmarks/sparse_features_memory.py --rows 50000 --categories 500 --dense
+"""
+
+# Python STL
+import argparse
+import random
+import time
+import tracemalloc
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+from surgeryschedulingunderuncertainty.patients_provider import PatientsFromHistoricalDataProvider
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal
+
+
+def synthetic_history(rows: int, categories: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'equipe': rng.choice([f'E{x}' for x in range(20)], rows),
+        'procedure': rng.choice([f'P{x}' for x in range(categories)], rows),
+        'surgeon': rng.choice([f'S{x}' for x in range(categories // 4)], rows),
+        'age': rng.integers(18, 95, rows),
+        'urgency': rng.integers(0, 5, rows),
+        'days_waiting': rng.integers(0, 365, rows),
+        'target': rng.lognormal(4.5, 0.4, rows),
+    })
+
+
+def measure(label, function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} {elapsed:8.2f} s   peak {peak / 2**20:10.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--categories', type=int, default=2_000)
+    parser.add_argument('--training', type=int, default=1_000)
+    parser.add_argument('--fit', action='store_true', help="also fit NGBLogNormal on the training set")
+    parser.add_argument('--dense', action='store_true', help="also run the dense layout (needs a lot of memory)")
+    args = parser.parse_args()
+
+    history = synthetic_history(args.rows, args.categories)
+    modes = [True, False] if args.dense else [True]
+
+    for sparse in modes:
+        mode = 'sparse' if sparse else 'dense'
+        random.seed(0)
+
+        provider = measure(f"[{mode}] provider construction",
+                           lambda: PatientsFromHistoricalDataProvider(historical_data=history, sparse_features=sparse))
+        training = measure(f"[{mode}] provide {args.training} patients",
+                           lambda: provider.provide_patient_training(quantity=args.training))
+
+        if args.fit:
+            measure(f"[{mode}] NGBLogNormal fit", lambda: NGBLogNormal(patients=training))
+
+        if sparse:
+            encoded = provider._encoded_features
+            stored = encoded.data.nbytes + encoded.indices.nbytes + encoded.indptr.nbytes
+            print(f"encoded matrix {encoded.shape}: CSR {stored / 2**20:.1f} MiB, "
+                  f"dense would be {encoded.shape[0] * encoded.shape[1] * 8 / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
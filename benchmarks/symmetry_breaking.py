@@ -0,0 +1,80 @@
+"""
+Symmetry breaking benchmark.
+
+A symmetric instance is built for StandardImplementor: every day has the same
+rooms with blocks of the same duration, compatible with all the patients, and
+patients are drawn from a few classes of (duration, urgency), all with the same
+waiting days. It is solved without symmetry breaking and with each kind of it,
+reporting solve time, branch and bound nodes and objective.
+
+Usage:
+    python benchmarks/symmetry_breaking.py --days 5 --rooms 4 --patients 70 --seed 3
+    python benchmarks/symmetry_breaking.py --backends pyomo matrix
+"""
+
+# Python STL
+import argparse
+import time
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor
+from surgeryschedulingunderuncertainty.symmetry import symmetry_pairs
+
+
+def symmetric_instance_data(n_days: int, n_rooms: int, n_pats: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    n_blocks = n_days * n_rooms
+    durations = rng.choice([60., 90., 150.], n_pats)
+    urgencies = rng.choice([1., 3.], n_pats)
+    data = {
+        'n_days': {None: n_days},
+        'n_rooms': {None: n_rooms},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: 240 for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): 1 for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: durations[i] for i in range(n_pats)},
+        'u': {i + 1: urgencies[i] for i in range(n_pats)},
+        'w': {i + 1: 0. for i in range(n_pats)},
+        'l': {i + 1: 3. for i in range(n_pats)},
+    }
+    return {None: data}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--patients', type=int, default=70)
+    parser.add_argument('--seed', type=int, default=3)
+    parser.add_argument('--backends', nargs='+', choices=['pyomo', 'matrix'], default=['matrix'])
+    args = parser.parse_args()
+
+    data = symmetric_instance_data(args.days, args.rooms, args.patients, args.seed)
+    block_pairs, patient_pairs = symmetry_pairs(data)
+    print(f"{args.days * args.rooms} blocks, {args.patients} patients: "
+          f"{len(block_pairs)} block pairs, {len(patient_pairs)} patient pairs")
+
+    for backend in args.backends:
+        for symmetry_breaking in [False, 'blocks', 'patients', True]:
+            implementor = StandardImplementor(backend=backend, symmetry_breaking=symmetry_breaking)
+            implementor.instance_data = data
+
+            start = time.perf_counter()
+            solution = implementor.run()
+            elapsed = time.perf_counter() - start
+
+            objective = solution.obj()
+            statistics = implementor.solver_statistics()
+            print(f"{backend:7s} symmetry breaking {str(symmetry_breaking):8s}  {elapsed:8.2f} s  "
+                  f"{statistics['node_count']:8d} nodes  objective {objective:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Python STL
+import hashlib
+import json
+import os
+
+# Packages
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def dataframe_fingerprint(data: pd.DataFrame, salt: str = "") -> str:
+    """
+    Content hash of a dataframe: values, index, column names and dtypes are all
+    part of the key, so any change in the data produces a different fingerprint.
+    The optional salt allows to separate caches built with different settings.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(salt.encode())
+    hasher.update(repr(list(data.columns)).encode())
+    hasher.update(repr([str(dtype) for dtype in data.dtypes]).encode())
+    hasher.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return hasher.hexdigest()
+
+
+def _cache_paths(cache_dir: str, key: str):
+    return (os.path.join(cache_dir, f"{key}_encoded.npy"),
+            os.path.join(cache_dir, f"{key}_encoding.json"))
+
+
+def _save_array(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def save_encoded(cache_dir: str, key: str, matrix, metadata: dict):
+    """
+    Store an encoded feature matrix as .npy and its metadata (feature names,
+    encoder categories, ...) as json. Sparse matrices are stored as their three
+    CSR arrays. Files are written under a temporary name and then renamed, so a
+    crash never leaves a half written entry behind.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    matrix_path, metadata_path = _cache_paths(cache_dir, key)
+    metadata = dict(metadata)
+
+    if sp.issparse(matrix):
+        matrix = sp.csr_matrix(matrix)
+        for name in ['data', 'indices', 'indptr']:
+            _save_array(matrix_path.replace('.npy', f'_{name}.npy'), getattr(matrix, name))
+        metadata['sparse_shape'] = list(matrix.shape)
+    else:
+        _save_array(matrix_path, matrix)
+
+    # Metadata is written last: its presence marks a complete entry
+    tmp_metadata_path = metadata_path + ".tmp"
+    with open(tmp_metadata_path, "w") as file:
+        json.dump(metadata, file)
+    os.replace(tmp_metadata_path, metadata_path)
+
+
+def load_encoded(cache_dir: str, key: str):
+    """
+    Return (matrix, metadata) for a cached entry, or None if there is no entry.
+    The arrays are memory-mapped read only, not copied in memory.
+    """
+    matrix_path, metadata_path = _cache_paths(cache_dir, key)
+
+    if not os.path.exists(metadata_path):
+        return None
+
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+
+    if 'sparse_shape' in metadata:
+        arrays = [np.load(matrix_path.replace('.npy', f'_{name}.npy'), mmap_mode='r') 
+                  for name in ['data', 'indices', 'indptr']]
+        return sp.csr_matrix(tuple(arrays), shape=tuple(metadata['sparse_shape']), copy=False), metadata
+
+    return np.load(matrix_path, mmap_mode='r'), metadata
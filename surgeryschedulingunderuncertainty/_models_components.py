@@ -77,3 +77,38 @@ def dualDefinitionRule(model, b, i):
 
 
 
+
+# Symmetry breaking - on pairs of consecutive equivalent blocks and patients
+
+def blockOrderingRule(model, b1, b2): # the first block has the larger load
+    return sum(model.t[i] * model.x[b1,i] for i in model.I) >= sum(model.t[i] * model.x[b2,i] for i in model.I)
+
+def patientScheduledOrderingRule(model, i1, i2): # the second patient is scheduled only if the first is
+    return sum(model.x[b,i1] for b in model.B) >= sum(model.x[b,i2] for b in model.B)
+
+def patientDayOrderingRule(model, i1, i2): # and not before the first
+    return model.y[i1] <= model.y[i2]
+
+# Aggregated formulation - numbers n of patients of each class in each block
+
+def ObjRule_aggregated(model):
+    return sum(model.cost[b, c] * model.n[b, c] for b in model.B for c in model.C) + model.constant
+
+def classSizeRule(model, c):
+    return sum(model.n[b, c] for b in model.B) <= model.size[c]
+
+def aggregatedCompatibilityRule(model, b, c):
+    return model.n[b, c] <= model.size[c] * model.a[b, c]
+
+def aggregatedCapacityRule(model, b):
+    return sum(model.t[c] * model.n[b, c] for c in model.C) <= model.g[b]
+
+def aggregatedCapacityOvertimeRule(model, b, k):
+    return sum((model.t[c] + model.eps[c, k]) * model.n[b, c] for c in model.C) <= model.g[b]
+
+def aggregatedChanceConstraintRule(robustness_overtime):
+    def internalRule(model, b): 
+        if all(model.f[c] == 0 for c in model.C): # instances without chance constraints
+            return pyo.Constraint.Skip
+        return sum(model.f[c] * model.n[b, c] for c in model.C) <= model.g[b] + robustness_overtime
+    return internalRule
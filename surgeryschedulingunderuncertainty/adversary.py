@@ -11,6 +11,7 @@ from .predictive_model import PredictiveModel
 from .schedule import Schedule
 from .task import Task
 from ._probability_utils import equiprobability_allocation_from_sampling
+from . import instrumentation
 
 
 class Adversary(ABC): 
@@ -62,6 +63,7 @@ class EquiprobableVertex(Adversary):
         super().__init__(schedule, task, description)
      
         
+    @instrumentation.traced
     def run(self):
         
         # robustness_flag variable for correctness. If the risk of overtime is too high, this variable turns false
@@ -0,0 +1,207 @@
+# Python STL
+
+# Packages
+import numpy as np
+
+# Modules
+from .matrix_model import MatrixModel, instance_arrays
+from .symmetry import block_days
+
+
+class PatientClasses():
+    """
+    Patients of an instance grouped in classes, for the aggregated formulation
+    in which the variables are the numbers n[b, c] of patients of each class
+    scheduled in each block, instead of a binary for each patient and block.
+
+    Patients are in the same class when they have the same compatible blocks,
+    the same urgency weight u, the same slack l - w and the same duration once
+    rounded up to duration_resolution. Slacks above n_days + 1 are all the same
+    (those patients are never delayed), so the objective of the standard model
+    is exactly a cost for each (block, class) pair:
+        u (day(b) + c_delay max(0, day(b) - slack) - c_exclusion)
+    compared with leaving the patient out. Durations, chance constraint
+    coefficients f and adversary realizations of a class are the largest of its
+    members, so the schedule of the individual patients is feasible.
+
+    Attributes
+    ----------
+    _data: dict
+        The arrays of the instance data.
+    _members: list[np.ndarray]
+        The patients (indexes from 0) of each class, by decreasing waiting time.
+    _size: np.ndarray
+        Number of patients of each class.
+    _t: np.ndarray
+        Duration of each class.
+    _f: np.ndarray
+        Chance constraint coefficient of each class, if the instance has f.
+    _eps: np.ndarray
+        Adversary realizations of each class, shape (classes, realizations).
+    _a: np.ndarray
+        Compatibility of blocks and classes.
+    _cost: np.ndarray
+        Cost of scheduling a patient of each class in each block, shape (blocks, classes).
+    _constant: float
+        Objective with no patient scheduled.
+    """
+
+    def __init__(self, instance_data: dict, duration_resolution: float = 10., robustness_overtime: float = None):
+        """
+        Parameters
+        ----------
+        instance_data: dict
+            The Pyomo instance data of a patient-level model.
+        duration_resolution: float, optional
+            Durations are rounded up to a multiple of it to form the classes.
+            If None, only patients with the same duration are grouped.
+        robustness_overtime: float, optional
+            Overtime of the chance constraints, for instances with f. Classes
+            with f above the duration of a block plus the overtime are not
+            compatible with it.
+        """
+        self._data = data = instance_arrays(instance_data)
+        n_blocks, n_pats, n_days = data['n_blocks'], data['n_pats'], data['n_days']
+
+        durations = data['t'] if not duration_resolution else \
+            np.ceil(np.round(data['t'] / duration_resolution, 9)) * duration_resolution
+        slack = np.minimum(data['l'] - data['w'], n_days + 1)
+
+        keys = np.hstack([data['a'].T, data['u'][:, None], slack[:, None], durations[:, None]])
+        _, first, classes = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        classes = classes.ravel()
+
+        # Classes in order of their first patient
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        classes = rank[classes]
+        n_classes = len(order)
+
+        # Members by decreasing waiting time, then by index
+        self._members = [np.flatnonzero(classes == c) for c in range(n_classes)]
+        self._members = [members[np.argsort(-data['w'][members], kind='stable')] for members in self._members]
+
+        self._size = np.bincount(classes, minlength=n_classes)
+        representative = np.array([members[0] for members in self._members], dtype=int)
+
+        self._t = durations[representative]
+        self._a = data['a'][:, representative]
+
+        u = data['u'][representative]
+        slack = slack[representative]
+
+        self._f = None
+        if 'f' in data:
+            self._f = np.zeros(n_classes)
+            np.maximum.at(self._f, classes, data['f'])
+            if robustness_overtime is not None:
+                self._a = self._a * (self._f[None, :] <= data['g'][:, None] + robustness_overtime)
+
+        self._eps = np.zeros((n_classes, data['n_realizations']))
+        if 'eps' in data and data['n_realizations'] > 0:
+            totals = np.full((n_classes, data['n_realizations']), -np.inf)
+            np.maximum.at(totals, classes, data['t'][:, None] + data['eps'])
+            self._eps = np.maximum(totals - self._t[:, None], 0.)
+
+        # Objective of the standard model: day and delay if scheduled, n_days + 1 and exclusion otherwise
+        days = block_days(n_blocks, n_days).astype(float)[:, None]
+        scheduled = days + data['c_delay'] * np.maximum(days - slack[None, :], 0.)
+        excluded = n_days + 1 + data['c_delay'] * np.maximum(n_days + 1 - slack, 0.) + data['c_exclusion']
+        self._cost = u[None, :] * (scheduled - excluded[None, :])
+        self._constant = float(np.sum(self._size * u * excluded))
+
+    # Getters and setters
+    def get_num_of_classes(self):
+        return len(self._size)
+    num_of_classes = property(get_num_of_classes)
+
+    def get_size(self):
+        return self._size
+    size = property(get_size)
+
+    def get_members(self):
+        return self._members
+    members = property(get_members)
+
+    # Specific methods
+    def instance_data(self) -> dict:
+        """ The Pyomo instance data of the aggregated model. """
+        n_blocks, n_classes = self._data['n_blocks'], self.num_of_classes
+        blocks, classes = range(n_blocks), range(n_classes)
+
+        data = {
+            'n_blocks': {None: n_blocks},
+            'n_classes': {None: n_classes},
+            'n_realizations': {None: self._eps.shape[1]},
+            'g': {b + 1: self._data['g'][b] for b in blocks},
+            'a': {(b + 1, c + 1): int(self._a[b, c]) for b in blocks for c in classes},
+            'size': {c + 1: int(self._size[c]) for c in classes},
+            't': {c + 1: self._t[c] for c in classes},
+            'eps': {(c + 1, k + 1): self._eps[c, k] for c in classes for k in range(self._eps.shape[1])},
+            'cost': {(b + 1, c + 1): self._cost[b, c] for b in blocks for c in classes},
+            'constant': {None: self._constant},
+        }
+        if self._f is not None:
+            data['f'] = {c + 1: self._f[c] for c in classes}
+
+        return {None: data}
+
+    def matrix_model(self, robustness_overtime: float = None) -> MatrixModel:
+        """ The aggregated model as a MatrixModel, with the variables n. """
+        n_blocks, n_classes, n_realizations = self._data['n_blocks'], self.num_of_classes, self._eps.shape[1]
+        g = self._data['g']
+
+        model = MatrixModel()
+        n = model.add_variable('n', (n_blocks, n_classes), upper=self._size[None, :] * self._a, integer=True)
+        model.add_cost('n', self._cost)
+        model.offset = self._constant
+
+        blocks = np.broadcast_to(np.arange(n_blocks)[:, None], n.shape)
+
+        # Each class at most its size
+        model.add_constraints(rows = np.broadcast_to(np.arange(n_classes), n.shape), columns = n, values = 1.,
+                              upper = self._size.astype(float))
+
+        # Capacity, and capacity with the adversary realizations
+        model.add_constraints(rows = blocks, columns = n, values = np.broadcast_to(self._t, n.shape), upper = g)
+        for k in range(n_realizations):
+            model.add_constraints(rows = blocks, columns = n, values = np.broadcast_to(self._t + self._eps[:, k], n.shape),
+                                  upper = g)
+
+        # Chance constraints: sum of f of the patients within duration plus overtime
+        if self._f is not None and robustness_overtime is not None:
+            model.add_constraints(rows = blocks, columns = n, values = np.broadcast_to(self._f, n.shape),
+                                  upper = g + robustness_overtime)
+
+        return model
+
+    def disaggregate(self, counts: np.ndarray) -> np.ndarray:
+        """
+        The assignment of the patients from the numbers of patients of each
+        class in each block: in each class, the patients waiting the longest get
+        the blocks of the earliest days.
+
+        Parameters
+        ----------
+        counts: np.ndarray
+            Patients of each class in each block, shape (blocks, classes).
+
+        Returns
+        -------
+        np.ndarray
+            x[b, i], 1 if patient i is scheduled in block b, shape (blocks, patients).
+        """
+        counts = np.rint(counts).astype(int)
+        x = np.zeros((self._data['n_blocks'], self._data['n_pats']))
+        blocks = np.argsort(block_days(self._data['n_blocks'], self._data['n_days']), kind='stable')
+
+        for c, members in enumerate(self._members):
+            assigned = np.repeat(blocks, counts[blocks, c])
+            x[assigned, members[:len(assigned)]] = 1.
+
+        return x
+
+    def objective(self, counts: np.ndarray) -> float:
+        """ Objective of the standard model for the given numbers of patients. """
+        return float(np.sum(self._cost * np.rint(counts)) + self._constant)
@@ -2,9 +2,11 @@
 from abc import ABC, abstractmethod
 
 # Packages
+import numpy as np
 
 # Modules
 from .patient import Patient
+from .uncertainty_profile import sample_profiles
 
 class Block(ABC):
     
@@ -132,9 +134,15 @@ class ScheduleBlock(Block):
         return True
     
 
-    def proportion_urgency(self):
-        pass
+    def proportion_urgency(self) -> dict:
+        """ Share of the patients of the block with each urgency. """
+        urgencies = [patient.urgency for patient in self._patients]
+        return {urgency: urgencies.count(urgency) / len(urgencies) for urgency in sorted(set(urgencies))}
 
-    def metric_undertime(self):
-        pass
+    def metric_undertime(self, size: int = 10000) -> float:
+        """ Expected idle minutes of the block, sampling the durations of its patients. """
+        if not self._patients:
+            return float(self.duration)
+        totals = sample_profiles([patient.uncertainty_profile for patient in self._patients], size).sum(axis=1)
+        return float(np.mean(np.maximum(self.duration - totals, 0.)))
 
@@ -0,0 +1,211 @@
+# Python STL
+
+# Packages
+import numpy as np
+import scipy.sparse as sp
+from sklearn.tree import DecisionTreeRegressor
+
+# Modules
+
+
+class CompiledEnsemble():
+    """
+    Fitted NGBoost model flattened into arrays, for fast inference on large
+    batches. Every decision tree (one for each boosting iteration and
+    distribution parameter) is stored as a perfect binary tree of the depth of
+    the deepest one, in heap order: leaves above that depth are padded with
+    splits whose two children hold the same value. Splits and leaves of all the
+    trees are in the same arrays, so a chunk of rows is evaluated on all the
+    trees at once:
+     - all the splits are tested with a single comparison between the feature
+       rows (features transposed) and the thresholds;
+     - the trees are descended one level at a time, selecting the outcome of the
+       split of the current position, without indexing the nodes row by row.
+
+    The prediction is the same of NGBRegressor.pred_dist: leaf values are scaled
+    by learning rate and scaling of their iteration and summed to the initial
+    parameters, which are converted by the distribution class of the model.
+
+    Attributes
+    ----------
+    _split_feature: np.ndarray
+        Column of the input tested by each split, shape (trees, 2^depth - 1).
+    _split_threshold: np.ndarray
+        Threshold of each split, rows with value <= threshold go to the left child.
+    _missing_left: np.ndarray
+        Whether missing values go to the left child of each split.
+    _leaf_value: np.ndarray
+        Contribution of each leaf to the parameter of its tree, shape (trees, 2^depth).
+    _tree_param: np.ndarray
+        The distribution parameter each tree contributes to, trees are sorted by it.
+    _init_params: np.ndarray
+        Initial parameters of the boosting.
+    _depth: int
+        Depth of the trees.
+    _dist: type
+        The NGBoost distribution class.
+    """
+
+    # Levels below are descended by indexing the split of each row, not by selection
+    SELECT_MAX_DEPTH = 3
+
+    # Perfect trees of larger depth would not fit in memory
+    MAX_DEPTH = 14
+
+    def __init__(self, split_feature, split_threshold, missing_left, leaf_value, tree_param, init_params, depth, dist):
+        self._split_feature = split_feature
+        self._split_threshold = split_threshold
+        self._missing_left = missing_left
+        self._leaf_value = leaf_value
+        self._tree_param = tree_param
+        self._init_params = init_params
+        self._depth = depth
+        self._dist = dist
+
+    # Getters and setters
+    def get_num_of_trees(self):
+        return len(self._tree_param)
+    num_of_trees = property(get_num_of_trees)
+
+    def get_depth(self):
+        return self._depth
+    depth = property(get_depth)
+
+    # Class methods
+    @classmethod
+    def from_ngboost(cls, regressor):
+        """
+        Flatten a fitted NGBRegressor whose base learners are sklearn decision trees.
+        """
+        if not regressor.base_models:
+            raise ValueError("The NGBoost model is not fitted.")
+
+        trees = []
+        for models, scaling, col_idx in zip(regressor.base_models, regressor.scalings, regressor.col_idxs):
+            # The trees see the columns of X[:, col_idx]
+            columns = np.arange(regressor.n_features)[col_idx]
+            for param, model in enumerate(models):
+                if not isinstance(model, DecisionTreeRegressor):
+                    raise ValueError("Only decision tree base learners can be compiled.")
+                trees.append((param, model.tree_, columns, -regressor.learning_rate * scaling))
+
+        # Trees of the same parameter are contiguous, in boosting order
+        trees.sort(key = lambda tree: tree[0])
+
+        depth = max(max(tree.max_depth for _, tree, _, _ in trees), 1)
+        if depth > cls.MAX_DEPTH:
+            raise ValueError(f"Trees deeper than {cls.MAX_DEPTH} levels cannot be compiled.")
+
+        num_of_splits = 2**depth - 1
+        split_feature = np.zeros((len(trees), num_of_splits), dtype=np.intp)
+        split_threshold = np.full((len(trees), num_of_splits), np.inf)
+        missing_left = np.zeros((len(trees), num_of_splits), dtype=bool)
+        leaf_value = np.zeros((len(trees), 2**depth))
+
+        for number, (_, tree, columns, factor) in enumerate(trees):
+            missing = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool))
+
+            # Visit the tree keeping the heap position of each node
+            stack = [(0, 0, 0)]
+            while stack:
+                node, level, position = stack.pop()
+                heap = 2**level - 1 + position
+
+                if tree.children_left[node] == -1:
+                    # The leaf covers all the positions below it at the last level
+                    width = 2**(depth - level)
+                    leaf_value[number, position * width:(position + 1) * width] = factor * tree.value[node, 0, 0]
+                    continue
+
+                split_feature[number, heap] = columns[tree.feature[node]]
+                split_threshold[number, heap] = tree.threshold[node]
+                missing_left[number, heap] = bool(missing[node])
+                stack.append((tree.children_left[node], level + 1, 2 * position))
+                stack.append((tree.children_right[node], level + 1, 2 * position + 1))
+
+        return cls(split_feature = split_feature,
+                   split_threshold = split_threshold,
+                   missing_left = missing_left,
+                   leaf_value = leaf_value,
+                   tree_param = np.array([param for param, _, _, _ in trees], dtype=np.intp),
+                   init_params = np.asarray(regressor.init_params, dtype=np.float64),
+                   depth = depth,
+                   dist = regressor.Dist)
+
+    # Specific methods
+    def pred_param(self, X, chunk_elements: int = 2**20) -> np.ndarray:
+        """
+        The internal distribution parameters, as NGBRegressor.pred_param.
+
+        Parameters
+        ----------
+        X: np.ndarray or scipy.sparse matrix
+            A row of features for each patient.
+        chunk_elements: int, optional
+            Rows are evaluated in chunks of about chunk_elements (rows x tested
+            splits) comparisons, to bound the memory used.
+        """
+        num_of_rows = X.shape[0]
+        params = np.empty((num_of_rows, len(self._init_params)))
+        tested = 2**min(self._depth, self.SELECT_MAX_DEPTH) - 1 + max(0, self._depth - self.SELECT_MAX_DEPTH)
+        chunk_rows = max(1, chunk_elements // (self.num_of_trees * tested))
+
+        for start in range(0, num_of_rows, chunk_rows):
+            chunk = X[start:start + chunk_rows]
+            chunk = chunk.toarray() if sp.issparse(chunk) else np.asarray(chunk)
+            params[start:start + len(chunk)] = self._pred_param_chunk(chunk)
+
+        return params
+
+    def pred_dist(self, X):
+        """ The predicted distributions, as NGBRegressor.pred_dist. """
+        return self._dist(self.pred_param(X).T)
+
+    def _pred_param_chunk(self, X: np.ndarray) -> np.ndarray:
+        # sklearn trees compare the features as float32; rows are contiguous per feature
+        features = np.ascontiguousarray(np.asarray(X, dtype=np.float32).T)
+        num_of_trees, num_of_rows = self.num_of_trees, features.shape[1]
+        has_missing = np.isnan(features).any()
+
+        # Outcome of every split of the first levels, shape (trees, splits, rows)
+        select_levels = min(self._depth, self.SELECT_MAX_DEPTH)
+        num_of_selected = 2**select_levels - 1
+
+        values = features[self._split_feature[:, :num_of_selected].ravel()]
+        go_left = values <= self._split_threshold[:, :num_of_selected].reshape(-1, 1)
+        if has_missing:
+            go_left |= np.isnan(values) & self._missing_left[:, :num_of_selected].reshape(-1, 1)
+        go_left = go_left.reshape(num_of_trees, num_of_selected, num_of_rows)
+
+        # Position of each row at the current level of each tree
+        position = np.zeros((num_of_trees, num_of_rows), dtype=np.min_scalar_type(2**select_levels))
+
+        for level in range(select_levels):
+            first = 2**level - 1
+            left = np.zeros((num_of_trees, num_of_rows), dtype=bool)
+            for offset in range(2**level):
+                left |= (position == offset) & go_left[:, first + offset]
+            position = 2 * position + ~left
+
+        # Deeper levels: only the split at the position of each row is tested
+        if self._depth > select_levels:
+            trees = (np.arange(num_of_trees) * self._split_feature.shape[1])[:, None]
+            rows = np.arange(num_of_rows)
+            position = position.astype(np.intp)
+            for level in range(select_levels, self._depth):
+                split = trees + 2**level - 1 + position
+                values = features.ravel()[self._split_feature.ravel()[split] * num_of_rows + rows]
+                left = values <= self._split_threshold.ravel()[split]
+                if has_missing:
+                    left |= np.isnan(values) & self._missing_left.ravel()[split]
+                position = 2 * position + ~left
+
+        leaves = position.astype(np.intp) + (np.arange(num_of_trees) * 2**self._depth)[:, None]
+        contributions = self._leaf_value.ravel()[leaves]
+
+        # Trees are sorted by parameter
+        params = np.tile(self._init_params, (num_of_rows, 1))
+        bounds = np.searchsorted(self._tree_param, np.arange(len(self._init_params) + 1))
+        for param in range(len(self._init_params)):
+            params[:, param] += contributions[bounds[param]:bounds[param + 1]].sum(axis=0)
+        return params
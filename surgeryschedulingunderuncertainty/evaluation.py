@@ -0,0 +1,193 @@
+# Python STL
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+from .schedule import Schedule
+from .uncertainty_profile import sample_profiles
+
+
+# Bins of the utilization histograms (total duration over block duration):
+# quantiles are computed with this resolution, utilizations above the last
+# edge fall in the last bin.
+UTILIZATION_EDGES = np.linspace(0., 3., 301)
+UTILIZATION_QUANTILES = [0.1, 0.5, 0.9]
+
+
+class ScheduleEvaluator():
+    """
+    Monte Carlo evaluation of a schedule: the durations of all the scheduled
+    patients are sampled from their uncertainty profiles and summed in the
+    blocks, giving realizations of the total duration of every block as one
+    (scenarios, blocks) array. Scenarios are processed in chunks, so the
+    (scenarios, blocks) arrays never exceed chunk_size rows and the metrics of
+    the blocks are accumulated in fixed size arrays and histograms. The
+    quantiles of the overtime and undertime of the whole schedule are exact:
+    their two values of every scenario are kept, so that memory grows with
+    n_scenarios (16 bytes each), not with the number of blocks.
+
+    Attributes
+    ----------
+    _schedule: Schedule
+        The evaluated schedule.
+    _n_scenarios: int
+        Number of realizations of the schedule.
+    _overtime_tolerance: float
+        Minutes over the block duration that are not counted as overtime, as
+        the robustness overtime of the task.
+    _chunk_size: int
+        Number of scenarios sampled at once.
+    _seed: int
+        Seed of numpy global random state, which the profiles sample from.
+    _blocks: pd.DataFrame
+        The metrics of each block, after run.
+    _summary: dict
+        The metrics of the whole schedule, after run.
+    """
+
+    def __init__(self, schedule: Schedule, n_scenarios: int = 10_000, overtime_tolerance: float = 0.,
+                 chunk_size: int = 10_000, seed: int = None):
+        self._schedule = schedule
+        self._n_scenarios = n_scenarios
+        self._overtime_tolerance = overtime_tolerance
+        self._chunk_size = chunk_size
+        self._seed = seed
+
+        self._blocks = None
+        self._summary = None
+
+    # Getters and setters
+    def get_schedule(self):
+        return self._schedule
+    def set_schedule(self, new: Schedule):
+        self._schedule = new
+        self._blocks = None
+        self._summary = None
+    schedule = property(get_schedule, set_schedule)
+
+    def get_n_scenarios(self):
+        return self._n_scenarios
+    n_scenarios = property(get_n_scenarios)
+
+    def get_blocks(self):
+        return self._blocks
+    blocks = property(get_blocks)
+
+    def get_summary(self):
+        return self._summary
+    summary = property(get_summary)
+
+    # Specific methods
+    def run(self) -> pd.DataFrame:
+        """
+        Simulate the schedule and compute its metrics.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each block (in the order of the schedule) with: block
+            (order in schedule), duration, num_of_patients, overtime_probability,
+            expected_overtime and expected_undertime (minutes), utilization_mean
+            and the utilization quantiles. The metrics of the whole schedule are
+            in the summary property: overtime_probability (of any block), 
+            mean_block_overtime_probability, expected_overtime, overtime_q90, 
+            expected_undertime, undertime_q90 (exact quantiles, minutes), 
+            utilization_mean and the utilization quantiles (from histograms).
+        """
+        if self._seed is not None:
+            np.random.seed(self._seed)
+
+        blocks = self._schedule.blocks
+        durations = np.array([block.duration for block in blocks], dtype=float)
+        n_blocks = len(blocks)
+
+        # Patients sorted by block, with the start of each non empty block
+        patients = [patient for block in blocks for patient in block.patients]
+        profiles = [patient.uncertainty_profile for patient in patients]
+        sizes = np.array([block.get_num_of_patients() for block in blocks], dtype=int)
+        filled = np.flatnonzero(sizes)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])[filled]
+
+        # Accumulators over the scenarios, and the overtime and undertime of the schedule in every scenario
+        overtime_count = np.zeros(n_blocks)
+        overtime_sum = np.zeros(n_blocks)
+        undertime_sum = np.zeros(n_blocks)
+        utilization_sum = np.zeros(n_blocks)
+        histograms = np.zeros((n_blocks, len(UTILIZATION_EDGES) - 1), dtype=np.int64)
+        any_overtime_count = 0
+        schedule_overtime, schedule_undertime = [], []
+        schedule_utilization = np.zeros(len(UTILIZATION_EDGES) - 1, dtype=np.int64)
+
+        for first in range(0, self._n_scenarios, self._chunk_size):
+            size = min(self._chunk_size, self._n_scenarios - first)
+
+            totals = np.zeros((size, n_blocks))
+            if len(patients) > 0:
+                totals[:, filled] = np.add.reduceat(sample_profiles(profiles, size), starts, axis=1)
+
+            over = totals > durations + self._overtime_tolerance
+            overtime = np.maximum(totals - durations, 0.)
+            undertime = np.maximum(durations - totals, 0.)
+            utilization = totals / np.where(durations > 0, durations, np.inf)
+
+            overtime_count += over.sum(axis=0)
+            overtime_sum += overtime.sum(axis=0)
+            undertime_sum += undertime.sum(axis=0)
+            utilization_sum += utilization.sum(axis=0)
+            histograms += _histograms(utilization)
+            any_overtime_count += int(np.any(over, axis=1).sum())
+
+            schedule_overtime.append(overtime.sum(axis=1))
+            schedule_undertime.append(undertime.sum(axis=1))
+            schedule_utilization += _histograms(totals.sum(axis=1, keepdims=True) / max(durations.sum(), 1e-12))[0]
+
+        n = self._n_scenarios
+        self._blocks = pd.DataFrame({
+            'block': [block.order_in_schedule for block in blocks],
+            'duration': durations,
+            'num_of_patients': sizes,
+            'overtime_probability': overtime_count / n,
+            'expected_overtime': overtime_sum / n,
+            'expected_undertime': undertime_sum / n,
+            'utilization_mean': utilization_sum / n,
+            **{f'utilization_q{int(round(q * 100))}': _histogram_quantiles(histograms, q)
+               for q in UTILIZATION_QUANTILES},
+        })
+
+        schedule_overtime = np.concatenate(schedule_overtime)
+        schedule_undertime = np.concatenate(schedule_undertime)
+        self._summary = {
+            'n_scenarios': n,
+            'overtime_probability': any_overtime_count / n,
+            'mean_block_overtime_probability': float(np.mean(overtime_count / n)) if n_blocks else 0.,
+            'expected_overtime': float(schedule_overtime.mean()),
+            'overtime_q90': float(np.quantile(schedule_overtime, 0.9)),
+            'expected_undertime': float(schedule_undertime.mean()),
+            'undertime_q90': float(np.quantile(schedule_undertime, 0.9)),
+            'utilization_mean': float(np.sum(self._blocks['utilization_mean'] * durations) / max(durations.sum(), 1e-12)),
+            **{f'utilization_q{int(round(q * 100))}': float(_histogram_quantiles(schedule_utilization[None, :], q)[0])
+               for q in UTILIZATION_QUANTILES},
+        }
+
+        return self._blocks
+
+
+
+def _histograms(values: np.ndarray) -> np.ndarray:
+    """ Counts of the values of each column (block) in the UTILIZATION_EDGES bins, shape (columns, bins). """
+    # Edges are evenly spaced from 0: the bin is found by a division
+    n_bins = len(UTILIZATION_EDGES) - 1
+    bins = np.clip(values * (n_bins / UTILIZATION_EDGES[-1]), 0, n_bins - 1).astype(np.int64)
+    columns = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    counts = np.bincount((columns * n_bins + bins).ravel(), minlength=values.shape[1] * n_bins)
+    return counts.reshape(values.shape[1], n_bins)
+
+
+def _histogram_quantiles(histograms: np.ndarray, probability: float) -> np.ndarray:
+    """ Quantile of each histogram (row), as the upper edge of the bin where it falls. """
+    cumulative = np.cumsum(histograms, axis=1)
+    totals = cumulative[:, -1:]
+    bins = np.argmax(cumulative >= probability * totals, axis=1)
+    return UTILIZATION_EDGES[1:][bins]
@@ -0,0 +1,236 @@
+# Python STL
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import itertools
+import os
+import time
+
+# Packages
+import pandas as pd
+
+# Modules
+from .scheduler import Scheduler
+from .schedule import Schedule
+from .evaluation import ScheduleEvaluator
+
+
+# Parameters that a grid can vary, seed is the optimization seed of the scheduler
+GRID_PARAMETERS = ('robustness_risk', 'robustness_overtime', 'num_of_weeks', 'gamma_max', 'optimizer_type', 'seed')
+
+# The scheduler of the worker process, the scenarios of the evaluation and the fingerprint of the
+# experiment, set by _initialize_worker
+_worker_scheduler = None
+_worker_scenarios = 0
+_worker_fingerprint = ''
+
+
+class ExperimentRunner():
+    """
+    Runner of the scheduler on every cell of a grid of parameters, e.g. to compare
+    the optimizers over robustness risks and seeds.
+
+    The patients, the fitted predictive model and the predictions are prepared
+    once by the scheduler and sent once to each worker process, with the master
+    schedule (see Scheduler.prepared_copy): a cell only creates its task and
+    runs its optimizer. Each worker limits HiGHS to solver_threads threads, so
+    that max_workers * solver_threads cores are used.
+
+    Results are written to output after every cell, as Parquet if its extension
+    is .parquet (requires pyarrow), as CSV otherwise. When output already exists
+    the cells it holds with status 'ok' are not run again, so an interrupted
+    experiment resumes where it stopped; failed cells are run again. The key of
+    a cell also holds the fingerprint of the experiment (the scheduler without
+    the grid parameters and the scenarios of the evaluation): the results of a
+    scheduler with other data, patients or model are never taken for its cells,
+    and are removed from output by run.
+
+    Attributes
+    ----------
+    _scheduler: Scheduler
+        The scheduler with the parameters not in the grid.
+    _grid: dict
+        The values of each parameter of the grid, see GRID_PARAMETERS.
+    _output: str
+        The results file.
+    _max_workers: int
+        Number of worker processes; with 1 the cells run in this process.
+    _solver_threads: int
+        Threads of HiGHS in each worker.
+    _n_scenarios: int
+        Scenarios of the ScheduleEvaluator of each schedule, 0 to skip the evaluation.
+    _fingerprint: str
+        Key of the parameters of the experiment not in the grid, part of the key of each cell.
+    """
+
+    def __init__(self,
+                 scheduler: Scheduler,
+                 grid: dict,
+                 output: str,
+                 max_workers: int = 1,
+                 solver_threads: int = 1,
+                 n_scenarios: int = 1000):
+
+        unknown = set(grid) - set(GRID_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown grid parameters {', '.join(sorted(unknown))}, use {', '.join(GRID_PARAMETERS)}.")
+
+        self._scheduler = scheduler
+        self._grid = {name: list(values) for name, values in grid.items()}
+        self._output = output
+        self._max_workers = max_workers
+        self._solver_threads = solver_threads
+        self._n_scenarios = n_scenarios
+
+        # The grid seed is the optimization seed of the scheduler
+        excluded = tuple('optimization_seed' if name == 'seed' else name for name in self._grid)
+        self._fingerprint = cell_key({'scheduler': scheduler.fingerprint(exclude=excluded),
+                                      'n_scenarios': n_scenarios})
+
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # Getters and setters
+    def get_grid(self):
+        return self._grid
+    grid = property(get_grid)
+
+    def get_output(self):
+        return self._output
+    output = property(get_output)
+
+    def get_fingerprint(self):
+        return self._fingerprint
+    fingerprint = property(get_fingerprint)
+
+    def get_cells(self):
+        """ The parameters of each cell of the grid, the last parameter varying fastest. """
+        names = list(self._grid)
+        return [dict(zip(names, values)) for values in itertools.product(*self._grid.values())]
+    cells = property(get_cells)
+
+    # Specific methods
+    def run(self) -> pd.DataFrame:
+        """
+        Run the cells not already completed in output.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each cell, in the order of cells: cell (a key of its
+            parameters), the parameters, status ('ok' or 'error'), error, seconds,
+            scheduled_patients, scheduled_minutes (nominal), iterations and robust
+            (implementor adversary only) and the summary of the ScheduleEvaluator.
+        """
+        keys = {cell_key(cell, self._fingerprint) for cell in self.cells}
+        previous = self.read()
+        if len(previous) > 0:
+            # The rows of other experiments (another grid or fingerprint) are dropped from output
+            previous = previous[(previous['status'] == 'ok') & previous['cell'].isin(keys)]
+        completed = set(previous['cell']) if len(previous) > 0 else set()
+        pending = [cell for cell in self.cells if cell_key(cell, self._fingerprint) not in completed]
+
+        rows = previous.to_dict('records') if len(previous) > 0 else []
+        if not pending:
+            return self._ordered(rows)
+
+        shared = self._scheduler.prepared_copy()
+        shared.solver_options = {**shared.solver_options, 'threads': self._solver_threads}
+
+        if self._max_workers == 1:
+            _initialize_worker(shared, self._n_scenarios, self._fingerprint)
+            for cell in pending:
+                rows.append(_run_cell(cell))
+                self._write(rows)
+        else:
+            with ProcessPoolExecutor(max_workers=self._max_workers, initializer=_initialize_worker,
+                                     initargs=(shared, self._n_scenarios, self._fingerprint)) as executor:
+                futures = [executor.submit(_run_cell, cell) for cell in pending]
+                for future in as_completed(futures):
+                    rows.append(future.result())
+                    self._write(rows)
+
+        return self._ordered(rows)
+
+    def read(self) -> pd.DataFrame:
+        """ The results in output, empty if there are none. """
+        if not os.path.exists(self._output):
+            return pd.DataFrame()
+        if self._output.endswith('.parquet'):
+            _require_pyarrow()
+            return pd.read_parquet(self._output)
+        return pd.read_csv(self._output)
+
+    def _write(self, rows: list[dict]):
+        """ Write all the results, under a temporary name and then renamed: output is never half written. """
+        results = self._ordered(rows)
+        tmp_path = self._output + '.tmp'
+        if self._output.endswith('.parquet'):
+            _require_pyarrow()
+            results.to_parquet(tmp_path, index=False)
+        else:
+            results.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self._output)
+
+    def _ordered(self, rows: list[dict]) -> pd.DataFrame:
+        """ The rows in the order of the cells. """
+        order = {cell_key(cell, self._fingerprint): position for position, cell in enumerate(self.cells)}
+        rows = sorted(rows, key=lambda row: order.get(row['cell'], len(order)))
+        return pd.DataFrame(rows)
+
+
+def cell_key(cell: dict, fingerprint: str = '') -> str:
+    """ Key of the parameters of a cell in the experiment of the given fingerprint. """
+    return hashlib.sha256(repr((fingerprint, sorted(cell.items()))).encode()).hexdigest()[:16]
+
+
+def schedule_metrics(schedule: Schedule) -> dict:
+    """ Number of scheduled patients and their nominal minutes of surgery. """
+    patients = [patient for block in schedule.blocks for patient in block.patients]
+    return {'scheduled_patients': len(patients),
+            'scheduled_minutes': float(sum(patient.uncertainty_profile.nominal_value for patient in patients))}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError("Parquet results require the pyarrow package.") from error
+
+
+def _initialize_worker(scheduler: Scheduler, n_scenarios: int, fingerprint: str = ''):
+    """ Keep the prepared scheduler in the worker process. """
+    global _worker_scheduler, _worker_scenarios, _worker_fingerprint
+    _worker_scheduler = scheduler
+    _worker_scenarios = n_scenarios
+    _worker_fingerprint = fingerprint
+
+
+def _run_cell(cell: dict) -> dict:
+    """ Run the scheduler of the worker process with the parameters of a cell. """
+    scheduler = _worker_scheduler
+    for name, value in cell.items():
+        if name == 'seed':
+            scheduler.optimization_seed = value
+        else:
+            setattr(scheduler, name, value)
+
+    row = {'cell': cell_key(cell, _worker_fingerprint), **cell}
+    start = time.perf_counter()
+    try:
+        schedule = scheduler.run()
+        row.update(status='ok', **schedule_metrics(schedule))
+        if scheduler.report is not None:
+            row.update(iterations=len(scheduler.report), robust=bool(scheduler.report['robust'].iloc[-1]))
+        if _worker_scenarios:
+            evaluator = ScheduleEvaluator(schedule, n_scenarios=_worker_scenarios, seed=cell.get('seed', 0))
+            evaluator.run()
+            row.update(evaluator.summary)
+    except Exception as error:
+        row.update(status='error', error=f"{type(error).__name__}: {error}")
+    row['seconds'] = time.perf_counter() - start
+
+    # The instances and schedules of the cells are not reused
+    scheduler.clear_cache(['instance', 'schedule'])
+
+    return row
@@ -0,0 +1,217 @@
+# Python STL
+import json
+import os
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+
+
+class HistoricalDataStore():
+    """
+    Columnar on-disk store of historical surgery data, for datasets that do not
+    fit comfortably in memory. Each column is a .npy file opened as a read only
+    memory map, so rows are read from disk only when they are used.
+    Numerical columns are stored as float64, categorical columns (object type) as
+    int32 codes pointing to the sorted list of their categories.
+
+    The store is built with build(), which reads a CSV or Parquet file in chunks:
+    the first pass counts the rows and collects the categories of each categorical
+    column (incremental fit of the one-hot encoder), the second pass writes the
+    columns.
+
+    Attributes
+    ----------
+    _path: str
+        Directory of the store.
+    _num_of_rows: int
+        Number of rows in the store.
+    _columns: list[str]
+        Names of the columns, in the order of the source file.
+    _categories: dict
+        Mapping from each categorical column to the sorted list of its categories.
+    _data: dict
+        Mapping from each column to its memory-mapped array.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open an existing store.
+
+        Parameters
+        ----------
+        path: str
+            Directory of the store, as created by build().
+        """
+        self._path = path
+
+        with open(os.path.join(path, 'metadata.json')) as file:
+            metadata = json.load(file)
+
+        self._num_of_rows = metadata['num_of_rows']
+        self._columns = metadata['columns']
+        self._categories = metadata['categories']
+
+        self._data = {column: np.load(os.path.join(path, f'column_{position}.npy'), mmap_mode='r')
+                      for position, column in enumerate(self._columns)}
+
+    # Getters and setters
+    def get_num_of_rows(self):
+        return self._num_of_rows
+    num_of_rows = property(get_num_of_rows)
+
+    def get_columns(self):
+        return self._columns
+    columns = property(get_columns)
+
+    def get_categories(self):
+        return self._categories
+    categories = property(get_categories)
+
+    def get_categorical_columns(self):
+        return [column for column in self._columns if column in self._categories]
+    categorical_columns = property(get_categorical_columns)
+
+    def get_feature_names(self):
+        """
+        Names of the features, in the same layout used by PatientsFromHistoricalDataProvider:
+        numerical columns (without target and urgency) followed by the one-hot encoded
+        categorical columns, first category dropped.
+        """
+        numerical = self._numerical_feature_columns()
+        encoded = [f'{column}_{category}'
+                   for column in self.categorical_columns
+                   for category in self._categories[column][1:]]
+        return numerical + encoded
+    feature_names = property(get_feature_names)
+
+    # Class methods
+    @classmethod
+    def build(cls, source: str, path: str, chunksize: int = 100_000, **read_options):
+        """
+        Build a store from a CSV or Parquet file, reading it in chunks.
+
+        Parameters
+        ----------
+        source: str
+            The CSV or Parquet (.parquet extension) file.
+        path: str
+            Directory where the store is written.
+        chunksize: int, optional
+            Number of rows read at once.
+        read_options: optional
+            Further arguments given to pandas.read_csv (e.g. sep).
+
+        Returns
+        -------
+        HistoricalDataStore
+            The opened store.
+        """
+
+        # First pass: count rows, find categorical columns and collect their categories
+        num_of_rows = 0
+        columns = None
+        categories = {}
+
+        for chunk in _iter_chunks(source, chunksize, **read_options):
+            if columns is None:
+                columns = list(chunk.columns)
+            num_of_rows += len(chunk)
+
+            for column in chunk.select_dtypes(include=['object']).columns:
+                categories.setdefault(column, set()).update(chunk[column].dropna().astype(str).unique())
+
+        if columns is None:
+            raise ValueError("The source file does not contain any row.")
+
+        categories = {column: sorted(values) for column, values in categories.items()}
+
+        # Second pass: write the columns
+        os.makedirs(path, exist_ok=True)
+
+        arrays = {}
+        for position, column in enumerate(columns):
+            dtype = np.int32 if column in categories else np.float64
+            arrays[column] = np.lib.format.open_memmap(os.path.join(path, f'column_{position}.npy'),
+                                                       mode='w+', dtype=dtype, shape=(num_of_rows,))
+
+        start = 0
+        for chunk in _iter_chunks(source, chunksize, **read_options):
+            stop = start + len(chunk)
+            for column in columns:
+                if column in categories:
+                    values = chunk[column].astype('string')
+                    arrays[column][start:stop] = pd.Categorical(values, categories=categories[column]).codes
+                else:
+                    arrays[column][start:stop] = pd.to_numeric(chunk[column]).to_numpy(dtype=np.float64)
+            start = stop
+
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        # Metadata is written last: its presence marks a complete store
+        with open(os.path.join(path, 'metadata.json'), 'w') as file:
+            json.dump({'num_of_rows': num_of_rows,
+                       'columns': columns,
+                       'categories': categories},
+                      file)
+
+        return cls(path)
+
+    # Specific methods
+    def column(self, name: str) -> np.ndarray:
+        """ The memory-mapped array of a column (codes for categorical columns). """
+        return self._data[name]
+
+    def value(self, name: str, position: int):
+        """ The value of a column in a row, categories are decoded. """
+        value = self._data[name][position]
+        if name in self._categories:
+            return self._categories[name][value] if value >= 0 else None
+        return value
+
+    def code_of(self, name: str, category: str) -> int:
+        """ The code of a category of a categorical column, -1 if it is unknown. """
+        try:
+            return self._categories[name].index(str(category))
+        except ValueError:
+            return -1
+
+    def features(self, position: int):
+        """
+        Build the features of a single row: numerical columns followed by the one-hot
+        encoding of the categorical ones, as a dense vector.
+        """
+        numerical = [self._data[column][position] for column in self._numerical_feature_columns()]
+
+        encoded = []
+        for column in self.categorical_columns:
+            block = np.zeros(len(self._categories[column]) - 1)
+            code = self._data[column][position]
+            # The first category is dropped
+            if code > 0:
+                block[code - 1] = 1.0
+            encoded.append(block)
+
+        return np.concatenate([np.array(numerical, dtype=np.float64)] + encoded)
+
+    def _numerical_feature_columns(self):
+        return [column for column in self._columns
+                if column not in self._categories and column not in ['target', 'urgency']]
+
+
+def _iter_chunks(source: str, chunksize: int, **read_options):
+    """ Yield the source file as pandas dataframes of at most chunksize rows. """
+    if source.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError("Reading Parquet files requires the pyarrow package.") from error
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunksize, **read_options)
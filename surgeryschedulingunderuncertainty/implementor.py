@@ -2,12 +2,19 @@
 
 # Python STL
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
 
 # Packages
+import numpy as np
 import pyomo.environ as pyo
 
 # Modules
 from .task import Task
+from . import matrix_model
+from . import instrumentation
+from .aggregation import PatientClasses
+from .symmetry import symmetry_pairs
 from ._models_components import (
     ObjRule_standard,
     ObjRule_count,
@@ -21,7 +28,16 @@ from ._models_components import (
     assignmentExistRule,
     chanceConstraintRule,
     dualCapacityRule,
-    dualDefinitionRule
+    dualDefinitionRule,
+    blockOrderingRule,
+    patientScheduledOrderingRule,
+    patientDayOrderingRule,
+    ObjRule_aggregated,
+    classSizeRule,
+    aggregatedCompatibilityRule,
+    aggregatedCapacityRule,
+    aggregatedCapacityOvertimeRule,
+    aggregatedChanceConstraintRule
     
 )
 
@@ -30,10 +46,58 @@ from ._models_components import (
 
 
 class Implementor(ABC):
+    """
+    Pyomo model of a scheduling problem. The parameters describing patients and
+    blocks (t, w, l, u, f, eps, g) are mutable: when reuse_instances is set, the
+    instances already built are kept by their structure (number of days, rooms,
+    blocks, patients and realizations, compatibility matrix, objective
+    coefficients), and data with the same structure, e.g. a new planning day,
+    only updates the parameters of the cached instance before solving it again.
+
+    With backend 'matrix' the model is not built by Pyomo: the constraint matrix
+    is assembled directly from the arrays of the instance data (see
+    matrix_model) and passed to HiGHS, and the solution is read as a solved
+    Pyomo instance (x[b, i]() and obj()).
+
+    With symmetry_breaking, equivalent blocks (same day, compatibility and
+    parameters) are ordered by load, and interchangeable patients (same
+    compatibility and parameters) are scheduled in order of index, so that the
+    branch and bound does not explore solutions that only differ by a swap of
+    equivalent blocks or patients. 'blocks' or 'patients' add only one of the
+    two orderings: which one pays off depends on the instance, patients pay off
+    when many of them are identical.
+
+    Attributes
+    ----------
+    _reuse_instances: bool
+        Whether built instances are cached and reused.
+    _instances: OrderedDict
+        The cached (instance, solver) pairs by structure key, least recently used first.
+    _backend: str
+        'pyomo' or 'matrix'.
+    _symmetry_breaking: bool or str
+        Symmetry breaking constraints added: True for all, 'blocks', 'patients' or False.
+    _solver_options: dict
+        Further options of HiGHS, e.g. time_limit.
+    """
+
+    # Number of instances kept when reuse_instances is set
+    MAX_CACHED_INSTANCES = 4
     
-    def __init__(self, description = "", task:Task = None):
+    def __init__(self, description = "", task:Task = None, reuse_instances: bool = False, backend: str = 'pyomo',
+                 symmetry_breaking = False):
+        if backend not in ('pyomo', 'matrix'):
+            raise ValueError(f"Unknown backend {backend}, use 'pyomo' or 'matrix'.")
+        if symmetry_breaking not in (True, False, 'blocks', 'patients'):
+            raise ValueError(f"Unknown symmetry breaking {symmetry_breaking}, use True, False, 'blocks' or 'patients'.")
+
         self._description = description
         self._task = task
+        self._reuse_instances = reuse_instances
+        self._backend = backend
+        self._symmetry_breaking = symmetry_breaking
+        self._instances = OrderedDict()
+        self._solver_options = {}
         
         #self._instance_data = None
 
@@ -46,30 +110,245 @@ class Implementor(ABC):
         self._description = new
     description = property(get_description, set_description)
 
+    def get_reuse_instances(self):
+        return self._reuse_instances
+    def set_reuse_instances(self, new: bool):
+        self._reuse_instances = new
+        if not new:
+            self._instances.clear()
+    reuse_instances = property(get_reuse_instances, set_reuse_instances)
+
+    def get_backend(self):
+        return self._backend
+    backend = property(get_backend)
+
+    def get_instance(self):
+        """ The last built or solved instance: a Pyomo instance, or a MatrixSolution with the matrix backend. """
+        return getattr(self, '_instance', None)
+    instance = property(get_instance)
+
+    def get_symmetry_breaking(self):
+        return self._symmetry_breaking
+    symmetry_breaking = property(get_symmetry_breaking)
+
+    def get_solver_options(self):
+        return self._solver_options
+    def set_solver_options(self, new: dict):
+        self._solver_options = dict(new)
+        # Solvers already created get the options too
+        for _, solver in self._instances.values():
+            solver.highs_options.update(self._solver_options)
+        if getattr(self, '_solver', None) is not None:
+            self._solver.highs_options.update(self._solver_options)
+    solver_options = property(get_solver_options, set_solver_options)
+
     # Abstract methods
+    def _matrix_model(self, data: dict) -> matrix_model.MatrixModel:
+        """ The model as a MatrixModel, from the arrays of the instance data. """
+        raise NotImplementedError(f"{type(self).__name__} does not support the matrix backend.")
 
     # General methods
     def run(self):
-        # Instance creation
-        self._instance = self._model.create_instance(self.instance_data)
-
-        # Solver configuration
-        self._solver = pyo.SolverFactory('appsi_highs')
+        # Instance creation and solver configuration
+        self.build()
 
         # Solver launching
-        solver_result = self._solver.solve(self._instance, tee=False)
-        
-        # Saving data of the solution
-        self._instance.solutions.store_to(solver_result)
-        
-        return self._instance 
+        return self.solve()
+
+    @instrumentation.traced
+    def build(self):
+        """ 
+        Create the instance from instance_data and the solver that will hold it.
+        If reuse_instances is set and an instance with the same structure was
+        already built, only its mutable parameters are updated.
+        """
+        instance_data = self.instance_data
+        if self._symmetry_breaking:
+            block_pairs, patient_pairs = symmetry_pairs(instance_data)
+            if self._symmetry_breaking == 'patients':
+                block_pairs = []
+            if self._symmetry_breaking == 'blocks':
+                patient_pairs = []
+            instance_data = {None: {**instance_data[None], 
+                                    'BlockPairs': {None: block_pairs}, 
+                                    'PatientPairs': {None: patient_pairs}}}
+
+        if self._backend == 'matrix':
+            # Cheap to assemble: built again every time, the last solution is kept as MIP start
+            with instrumentation.span('matrix.assemble'):
+                data = matrix_model.instance_arrays(instance_data)
+                self._matrix = self._matrix_model(data)
+                if self._symmetry_breaking:
+                    matrix_model.block_ordering(block_pairs)(self._matrix, data)
+                    matrix_model.patient_ordering(patient_pairs)(self._matrix, data)
+            self._solver = None
+            return self._matrix
+
+        if not self._reuse_instances:
+            with instrumentation.span('pyomo.create_instance'):
+                self._instance = self._model.create_instance(instance_data)
+            self._solver = self._make_solver()
+            return self._instance
+
+        # The pairs depend on mutable parameters too: they are part of the structure
+        key = self._structure_key(instance_data)
+
+        if key in self._instances:
+            self._instances.move_to_end(key)
+            self._instance, self._solver = self._instances[key]
+            instrumentation.count('implementor.reused_instances')
+            self.update_parameters({name: data for name, data in instance_data[None].items()
+                                    if name in self._mutable_parameters()})
+        else:
+            with instrumentation.span('pyomo.create_instance'):
+                self._instance = self._model.create_instance(instance_data)
+            self._solver = self._make_solver()
+            self._instances[key] = (self._instance, self._solver)
+            while len(self._instances) > self.MAX_CACHED_INSTANCES:
+                self._instances.popitem(last=False)
+
+        return self._instance
+
+    @instrumentation.traced
+    def solve(self, warmstart: bool = False):
+        """
+        Solve the current instance. The solver is persistent: solving the same 
+        instance again only sends the changes, e.g. of the mutable parameters.
+
+        Parameters
+        ----------
+        warmstart: bool, optional
+            Use the current values of the variables (the last solution) as MIP start.
+        """
+        if self._backend == 'matrix':
+            previous = getattr(self, '_instance', None)
+            start = None
+            if warmstart and isinstance(previous, matrix_model.MatrixSolution) \
+                    and len(previous.columns) == self._matrix.num_of_columns:
+                start = previous.columns
+            self._instance = self._matrix.solve(start = start, options = self._highs_options())
+        else:
+            solver_result = self._solver.solve(self._instance, tee=False, warmstart=warmstart)
+
+            # Saving data of the solution
+            self._instance.solutions.store_to(solver_result)
+
+        if instrumentation.enabled():
+            self._count_solve()
+
+        return self._instance
+
+    def set_start(self, values: dict):
+        """
+        Set the MIP start of the next solve with warmstart: the values of some
+        variables of the current instance, the others start from 0.
+
+        Parameters
+        ----------
+        values: dict
+            Mapping from the name of a variable to a {index: value} dictionary,
+            indexes starting from 1 as in the model.
+        """
+        if self._backend == 'matrix':
+            start = np.zeros(self._matrix.num_of_columns)
+            for name, data in values.items():
+                columns = self._matrix.columns(name)
+                for index, value in data.items():
+                    index = index if isinstance(index, tuple) else (index,)
+                    start[columns[tuple(position - 1 for position in index)]] = value
+            # Kept as the last solution, which solve uses as MIP start
+            self._instance = matrix_model.MatrixSolution(variables = {}, objective = None, columns = start)
+            return
+
+        for name, data in values.items():
+            variable = getattr(self._instance, name)
+            for index in variable:
+                variable[index].value = data.get(index, 0.)
+
+    def update_parameters(self, values: dict):
+        """
+        Set new values of mutable parameters of the instance.
+
+        Parameters
+        ----------
+        values: dict
+            Mapping from the name of a parameter to a {index: value} dictionary.
+        """
+        if self._backend == 'matrix':
+            # The instance data is updated and the matrices assembled again
+            data = self.instance_data[None]
+            self.instance_data = {None: {**data, **{name: {**data.get(name, {}), **values[name]} for name in values}}}
+            self.build()
+            return
+
+        for name, data in values.items():
+            parameter = getattr(self._instance, name)
+            for index, value in data.items():
+                parameter[index] = value
+
+    def solver_statistics(self) -> dict:
+        """ Statistics of the last solve: number of branch and bound nodes and MIP gap. """
+        if self._backend == 'matrix':
+            return dict(self._instance.statistics)
+        info = self._solver._solver_model.getInfo()
+        return {'node_count': int(info.mip_node_count), 'mip_gap': float(info.mip_gap)}
+
+    def model_size(self) -> tuple[int, int]:
+        """ Number of variables (columns) and of constraints (rows) of the current instance. """
+        if self._backend == 'matrix':
+            return self._matrix.num_of_columns, self._matrix.num_of_rows
+        return self._instance.nvariables(), self._instance.nconstraints()
+
+    def _count_solve(self):
+        """ Counters of the active profiler: solves, variables and constraints, nodes of the last solve. """
+        variables, constraints = self.model_size()
+        instrumentation.count('implementor.solves')
+        instrumentation.count('implementor.variables', variables)
+        instrumentation.count('implementor.constraints', constraints)
+        instrumentation.count('implementor.nodes', self.solver_statistics().get('node_count', 0))
+
+    def _make_solver(self):
+        solver = pyo.SolverFactory('appsi_highs')
+        solver.highs_options.update(self._highs_options())
+        return solver
+
+    def _highs_options(self) -> dict:
+        """ 
+        Options of HiGHS. With the symmetry breaking constraints the symmetry 
+        detection of HiGHS is disabled: the two are alternatives, and together
+        they can prune the optimal solutions. The solver_options are added last.
+        """
+        options = {'mip_detect_symmetry': False} if self._symmetry_breaking else {}
+        return {**options, **self._solver_options}
+
+    def _add_symmetry_breaking(self):
+        """ Sets of pairs of equivalent blocks and patients, with their ordering constraints. """
+        self._model.BlockPairs = pyo.Set(dimen=2)
+        self._model.PatientPairs = pyo.Set(dimen=2)
+
+        self._model.blockOrdering = pyo.Constraint(self._model.BlockPairs, rule=blockOrderingRule)
+        self._model.patientScheduledOrdering = pyo.Constraint(self._model.PatientPairs, rule=patientScheduledOrderingRule)
+        self._model.patientDayOrdering = pyo.Constraint(self._model.PatientPairs, rule=patientDayOrderingRule)
+
+    def _mutable_parameters(self) -> set[str]:
+        return {parameter.name for parameter in self._model.component_objects(pyo.Param) if parameter.mutable}
+
+    def _structure_key(self, instance_data: dict) -> str:
+        """ Hash of the data of the immutable parameters, which define the constraints. """
+        mutable = self._mutable_parameters()
+        hasher = hashlib.sha256()
+        for name, data in sorted(instance_data[None].items()):
+            if name not in mutable:
+                hasher.update(repr((name, sorted(data.items(), key=repr))).encode())
+        return hasher.hexdigest()
 
 
 
 class StandardImplementor(Implementor):
 
-    def __init__(self, description="", task:Task = None):
-        super().__init__(description, task)
+    def __init__(self, description="", task:Task = None, reuse_instances: bool = False, backend: str = 'pyomo',
+                 symmetry_breaking = False):
+        super().__init__(description, task, reuse_instances, backend, symmetry_breaking)
 
         # Sets
         self._model.n_days = pyo.Param(within=pyo.NonNegativeIntegers)
@@ -82,15 +361,15 @@ class StandardImplementor(Implementor):
         self._model.I = pyo.RangeSet(1, self._model.n_pats)
         self._model.K = pyo.RangeSet(1, self._model.n_realizations)
 
-        # Parameters
-        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        # Parameters, the mutable ones can be changed on the instance without building it again
+        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
 
-        self._model.eps = pyo.Param(self._model.I, self._model.K, within=pyo.NonNegativeReals)
+        self._model.eps = pyo.Param(self._model.I, self._model.K, within=pyo.NonNegativeReals, mutable=True)
 
-        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers)
+        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers, mutable=True)
         self._model.a = pyo.Param(self._model.B, self._model.I, within=pyo.Binary)
 
         self._model.c_exclusion = pyo.Param(within=pyo.NonNegativeReals)
@@ -112,14 +391,33 @@ class StandardImplementor(Implementor):
         self._model.capacity = pyo.Constraint(self._model.B, rule=capacityRule)
         self._model.capacityOvertime = pyo.Constraint(self._model.B, self._model.K, rule=capacityOvertimeRule)
         self._model.compatibility = pyo.Constraint(self._model.B, self._model.I, rule=compatibilityRule)
+
+        if self._symmetry_breaking:
+            self._add_symmetry_breaking()
+
+    def _matrix_model(self, data: dict) -> matrix_model.MatrixModel:
+        model = matrix_model.MatrixModel()
+        matrix_model.add_assignment_variables(model, data)
+
+        matrix_model.objective_standard(model, data)
+
+        for constraints in [matrix_model.delay_detector,
+                            matrix_model.one_surgery,
+                            matrix_model.y_definition,
+                            matrix_model.capacity,
+                            matrix_model.capacity_overtime]:
+            constraints(model, data)
+
+        return model
         
     
      
         
 class ChanceConstraintsImplementor(Implementor):
 
-    def __init__(self, task:Task, description = "", ): # TODO robustness_overtime non può essere None...
-        super().__init__(description, task)
+    def __init__(self, task:Task, description = "", reuse_instances: bool = False, backend: str = 'pyomo',
+                 symmetry_breaking = False): # TODO robustness_overtime non può essere None...
+        super().__init__(description, task, reuse_instances, backend, symmetry_breaking)
 
         # Sets
         self._model.n_days = pyo.Param(within=pyo.NonNegativeIntegers)
@@ -132,18 +430,18 @@ class ChanceConstraintsImplementor(Implementor):
         self._model.I = pyo.RangeSet(1, self._model.n_pats)
         self._model.K = pyo.RangeSet(1, self._model.n_realizations)
 
-        # Parameters
-        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        # Parameters, the mutable ones can be changed on the instance without building it again
+        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
         
-        self._model.f = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        self._model.f = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
 
 
-        self._model.eps = pyo.Param(self._model.I, self._model.K, within=pyo.NonNegativeReals)
+        self._model.eps = pyo.Param(self._model.I, self._model.K, within=pyo.NonNegativeReals, mutable=True)
 
-        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers)
+        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers, mutable=True)
         self._model.a = pyo.Param(self._model.B, self._model.I, within=pyo.Binary)
 
         self._model.c_exclusion = pyo.Param(within=pyo.NonNegativeReals)
@@ -175,8 +473,9 @@ class ChanceConstraintsImplementor(Implementor):
 
 class ChanceConstraintsImplementor(Implementor):
 
-    def __init__(self, task:Task, description = "", ): # TODO robustness_overtime non può essere None...
-        super().__init__(description, task)
+    def __init__(self, task:Task, description = "", reuse_instances: bool = False, backend: str = 'pyomo',
+                 symmetry_breaking = False): # TODO robustness_overtime non può essere None...
+        super().__init__(description, task, reuse_instances, backend, symmetry_breaking)
 
         # Sets
         self._model.n_days = pyo.Param(within=pyo.NonNegativeIntegers)
@@ -189,18 +488,18 @@ class ChanceConstraintsImplementor(Implementor):
         self._model.I = pyo.RangeSet(1, self._model.n_pats)
         self._model.K = pyo.RangeSet(1, self._model.n_realizations)
 
-        # Parameters
-        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        # Parameters, the mutable ones can be changed on the instance without building it again
+        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
         
-        self._model.f = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        self._model.f = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
 
         # TODO questo si potrebbe togliere
         #self._model.eps = pyo.Param(self._model.I, self._model.K, within=pyo.NonNegativeReals)
 
-        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers)
+        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers, mutable=True)
         self._model.a = pyo.Param(self._model.B, self._model.I, within=pyo.Binary)
 
         self._model.c_exclusion = pyo.Param(within=pyo.NonNegativeReals)
@@ -228,13 +527,36 @@ class ChanceConstraintsImplementor(Implementor):
         self._model.assignmentExist = pyo.Constraint(self._model.B, self._model.I, rule=assignmentExistRule)
         
         self._model.chanceConstraint = pyo.Constraint(self._model.B, self._model.I, rule=chanceConstraintRule(self._task.robustness_overtime))
+
+        if self._symmetry_breaking:
+            self._add_symmetry_breaking()
+
+    def _matrix_model(self, data: dict) -> matrix_model.MatrixModel:
+        model = matrix_model.MatrixModel()
+        matrix_model.add_assignment_variables(model, data)
+        matrix_model.add_fraction_variables(model, data)
+
+        matrix_model.objective_standard(model, data)
+
+        for constraints in [matrix_model.delay_detector,
+                            matrix_model.one_surgery,
+                            matrix_model.y_definition,
+                            matrix_model.capacity,
+                            matrix_model.capacity_overtime,
+                            matrix_model.fraction_sum_one,
+                            matrix_model.assignment_exist,
+                            matrix_model.chance_constraint(self._task.robustness_overtime)]:
+            constraints(model, data)
+
+        return model
  
 
 
 class BSImplementor(Implementor): # Budget Set
 
-    def __init__(self, task:Task, description = "", ): # TODO robustness_overtime non può essere None...
-        super().__init__(description, task)
+    def __init__(self, task:Task, description = "", reuse_instances: bool = False, backend: str = 'pyomo',
+                 symmetry_breaking = False): # TODO robustness_overtime non può essere None...
+        super().__init__(description, task, reuse_instances, backend, symmetry_breaking)
 
         # Sets
         self._model.n_days = pyo.Param(within=pyo.NonNegativeIntegers)
@@ -246,17 +568,17 @@ class BSImplementor(Implementor): # Budget Set
         self._model.B = pyo.RangeSet(1, self._model.n_blocks)
         self._model.I = pyo.RangeSet(1, self._model.n_pats)
 
-        # Parameters
-        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
-        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals)
+        # Parameters, the mutable ones can be changed on the instance without building it again
+        self._model.t = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.w = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.l = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
+        self._model.u = pyo.Param(self._model.I, within=pyo.NonNegativeReals, mutable=True)
         
-        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers)
+        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeIntegers, mutable=True)
         self._model.a = pyo.Param(self._model.B, self._model.I, within=pyo.Binary)
         
-        self._model.gamma = pyo.Param(self._model.B, within=pyo.NonNegativeReals)
-        self._model.time_increment = pyo.Param(self._model.B, within=pyo.NonNegativeReals)
+        self._model.gamma = pyo.Param(self._model.B, within=pyo.NonNegativeReals, mutable=True)
+        self._model.time_increment = pyo.Param(self._model.B, within=pyo.NonNegativeReals, mutable=True)
         
         self._model.c_exclusion = pyo.Param(within=pyo.NonNegativeReals)
         self._model.c_delay = pyo.Param(within=pyo.NonNegativeReals)
@@ -283,4 +605,131 @@ class BSImplementor(Implementor): # Budget Set
         self._model.compatibility = pyo.Constraint(self._model.B, self._model.I, rule=compatibilityRule)
 
         self._model.dualCapacity = pyo.Constraint(self._model.B, rule=dualCapacityRule)
-        self._model.dualDefinition = pyo.Constraint(self._model.B, self._model.I, rule=dualDefinitionRule)  
+        self._model.dualDefinition = pyo.Constraint(self._model.B, self._model.I, rule=dualDefinitionRule)
+
+        if self._symmetry_breaking:
+            self._add_symmetry_breaking()
+
+    def _matrix_model(self, data: dict) -> matrix_model.MatrixModel:
+        model = matrix_model.MatrixModel()
+        matrix_model.add_assignment_variables(model, data)
+        matrix_model.add_fraction_variables(model, data)
+        matrix_model.add_dual_variables(model, data)
+
+        matrix_model.objective_standard(model, data)
+
+        for constraints in [matrix_model.delay_detector,
+                            matrix_model.one_surgery,
+                            matrix_model.y_definition,
+                            matrix_model.capacity,
+                            matrix_model.dual_capacity,
+                            matrix_model.dual_definition]:
+            constraints(model, data)
+
+        return model
+  
+
+
+
+class AggregatedImplementor(Implementor): # Patient classes
+
+    def __init__(self, task:Task = None, description = "", duration_resolution: float = 10., backend: str = 'pyomo'):
+        """
+        Aggregated formulation of StandardImplementor (of ChanceConstraintsImplementor 
+        if the task has a robustness overtime): patients are grouped in classes (see PatientClasses) 
+        and the variables are the numbers n[b, c] of patients of each class in each 
+        block. The solution is disaggregated to the patients, so it is read as the 
+        one of the patient-level models (x[b, i]() and obj()).
+
+        Parameters
+        ----------
+        task: Task, optional
+            Needed only for instances with chance constraints (robustness overtime).
+        duration_resolution: float, optional
+            Durations are rounded up to a multiple of it to form the classes.
+        """
+        super().__init__(description, task, backend = backend)
+
+        self._duration_resolution = duration_resolution
+        self._classes = None
+
+        # Sets
+        self._model.n_blocks = pyo.Param(within=pyo.NonNegativeIntegers)
+        self._model.n_classes = pyo.Param(within=pyo.NonNegativeIntegers)
+        self._model.n_realizations = pyo.Param(within=pyo.NonNegativeIntegers)
+
+        self._model.B = pyo.RangeSet(1, self._model.n_blocks)
+        self._model.C = pyo.RangeSet(1, self._model.n_classes)
+        self._model.K = pyo.RangeSet(1, self._model.n_realizations)
+
+        # Parameters
+        self._model.size = pyo.Param(self._model.C, within=pyo.NonNegativeIntegers)
+        self._model.t = pyo.Param(self._model.C, within=pyo.NonNegativeReals)
+        self._model.f = pyo.Param(self._model.C, within=pyo.NonNegativeReals, default=0)
+        self._model.eps = pyo.Param(self._model.C, self._model.K, within=pyo.NonNegativeReals, default=0)
+
+        self._model.g = pyo.Param(self._model.B, within=pyo.NonNegativeReals)
+        self._model.a = pyo.Param(self._model.B, self._model.C, within=pyo.Binary)
+
+        self._model.cost = pyo.Param(self._model.B, self._model.C, within=pyo.Reals)
+        self._model.constant = pyo.Param(within=pyo.Reals)
+
+        # Variables
+        self._model.n = pyo.Var(self._model.B, self._model.C, within=pyo.NonNegativeIntegers)
+
+        # Objective function
+        self._model.obj = pyo.Objective(rule=ObjRule_aggregated, sense=pyo.minimize)
+
+        # Constraints
+        self._model.classSize = pyo.Constraint(self._model.C, rule=classSizeRule)
+        self._model.compatibility = pyo.Constraint(self._model.B, self._model.C, rule=aggregatedCompatibilityRule)
+        self._model.capacity = pyo.Constraint(self._model.B, rule=aggregatedCapacityRule)
+        self._model.capacityOvertime = pyo.Constraint(self._model.B, self._model.K, rule=aggregatedCapacityOvertimeRule)
+        if self._robustness_overtime() is not None:
+            self._model.chanceConstraint = pyo.Constraint(self._model.B, rule=aggregatedChanceConstraintRule(self._robustness_overtime()))
+
+    # Getters and setters
+    def get_classes(self):
+        return self._classes
+    classes = property(get_classes)
+
+    # General methods
+    @instrumentation.traced
+    def build(self):
+        """ Group the patients of instance_data in classes and create the aggregated instance. """
+        self._classes = PatientClasses(self.instance_data, 
+                                       duration_resolution = self._duration_resolution,
+                                       robustness_overtime = self._robustness_overtime())
+
+        if self._backend == 'matrix':
+            self._matrix = self._classes.matrix_model(robustness_overtime = self._robustness_overtime())
+            self._solver = None
+            return self._matrix
+
+        with instrumentation.span('pyomo.create_instance'):
+            self._instance = self._model.create_instance(self._classes.instance_data())
+        self._solver = self._make_solver()
+        return self._instance
+
+    def solve(self, warmstart: bool = False) -> matrix_model.MatrixSolution:
+        """ Solve the aggregated instance and assign the patients of each class. """
+        solved = super().solve(warmstart)
+
+        if self._backend == 'matrix':
+            counts = solved.value('n')
+        else:
+            counts = np.array([[solved.n[b + 1, c + 1].value or 0. for c in range(self._classes.num_of_classes)]
+                               for b in range(self._instance.n_blocks.value)])
+
+        return matrix_model.MatrixSolution(variables = {'x': self._classes.disaggregate(counts), 'n': counts},
+                                           objective = self._classes.objective(counts),
+                                           columns = counts.ravel())
+
+    def update_parameters(self, values: dict):
+        """ Classes depend on all the parameters: the instance is built again. """
+        data = self.instance_data[None]
+        self.instance_data = {None: {**data, **{name: {**data.get(name, {}), **values[name]} for name in values}}}
+        self.build()
+
+    def _robustness_overtime(self):
+        return getattr(self._task, 'robustness_overtime', None) if self._task is not None else None
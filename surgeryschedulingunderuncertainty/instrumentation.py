@@ -0,0 +1,288 @@
+# Python STL
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Packages
+import pandas as pd
+
+# Modules
+
+
+# The profiler recording the spans and counters, None when the instrumentation is disabled
+_active = None
+
+
+class Profiler():
+    """
+    Recorder of the spans (timed sections, with wall and CPU time) and of the
+    counters of a run. Used as a context manager it becomes the active profiler:
+    the sections of the package instrumented with span, count and traced are
+    recorded while it is active, and cost a single check otherwise.
+
+    The records can be summarized by span name, written as a structured log (one
+    JSON object per line) or as a Chrome trace file, to be opened with
+    chrome://tracing or https://ui.perfetto.dev. Only the spans of the process
+    and of the threads that run while the profiler is active are recorded.
+
+    Attributes
+    ----------
+    _trace_memory: bool
+        Whether each span records the peak of the memory traced by tracemalloc
+        above the traced memory at its start. Much slower.
+    _spans: list[dict]
+        The closed spans: name, category, thread, depth, parent, start and wall
+        (seconds from the start of the profiler), cpu (process time in seconds),
+        traced_peak_mb if memory is traced, and the attributes of the span.
+    _counters: dict
+        Total of each counter.
+    _counter_events: list[tuple]
+        Time and new total of each counter update.
+    _snapshots: list[dict]
+        Label, time and top allocations of each memory snapshot.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self._trace_memory = trace_memory
+        self._spans = []
+        self._counters = {}
+        self._counter_events = []
+        self._snapshots = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._previous = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        _active = self
+        return self
+
+    def __exit__(self, *exception):
+        global _active
+        _active = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    # Getters and setters
+    def get_spans(self):
+        return self._spans
+    spans = property(get_spans)
+
+    def get_counters(self):
+        return self._counters
+    counters = property(get_counters)
+
+    def get_snapshots(self):
+        return self._snapshots
+    snapshots = property(get_snapshots)
+
+    # Specific methods
+    def span(self, name: str, category: str = None, **attributes) -> '_Span':
+        """ A context manager recording the section it wraps as a span. """
+        return _Span(self, name, category or name.split('.', 1)[0], attributes)
+
+    def count(self, name: str, value: float = 1):
+        """ Add value to the counter name. """
+        with self._lock:
+            total = self._counters.get(name, 0) + value
+            self._counters[name] = total
+            self._counter_events.append((time.perf_counter() - self._origin, name, total))
+
+    def snapshot(self, label: str, top: int = 10):
+        """ Record the lines allocating most of the memory traced by tracemalloc now. """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory snapshots require the profiler to trace memory.")
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        self._snapshots.append({
+            'label': label,
+            'time': time.perf_counter() - self._origin,
+            'top': [{'location': str(statistic.traceback), 'size_mb': statistic.size / 2**20, 'count': statistic.count}
+                    for statistic in statistics],
+        })
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Calls, total, mean and maximum wall time and total CPU time of each span
+        name, slowest first. Time of nested spans is also counted in their parents.
+        """
+        columns = ['name', 'calls', 'wall', 'wall_mean', 'wall_max', 'cpu']
+        if not self._spans:
+            return pd.DataFrame(columns=columns)
+        spans = pd.DataFrame(self._spans)
+        aggregations = {'calls': ('wall', 'size'), 'wall': ('wall', 'sum'), 'wall_mean': ('wall', 'mean'),
+                        'wall_max': ('wall', 'max'), 'cpu': ('cpu', 'sum')}
+        if 'traced_peak_mb' in spans:
+            aggregations['traced_peak_mb'] = ('traced_peak_mb', 'max')
+        table = spans.groupby('name', sort=False).agg(**aggregations).reset_index()
+        return table.sort_values('wall', ascending=False, kind='stable').reset_index(drop=True)
+
+    def records(self) -> list[dict]:
+        """ The spans, counter updates and snapshots as structured records, in order of time. """
+        records = [{'type': 'span', **span} for span in self._spans]
+        records += [{'type': 'counter', 'time': moment, 'name': name, 'value': total}
+                    for moment, name, total in self._counter_events]
+        records += [{'type': 'snapshot', **snapshot} for snapshot in self._snapshots]
+        return sorted(records, key=lambda record: record.get('start', record.get('time')))
+
+    def write_log(self, path: str):
+        """ Write the records as JSON lines. """
+        with open(path, 'w') as file:
+            for record in self.records():
+                file.write(json.dumps(record, default=str) + '\n')
+
+    def chrome_trace(self) -> dict:
+        """ The spans and counters in the Chrome trace event format, times in microseconds. """
+        pid = os.getpid()
+        events = []
+        for span in self._spans:
+            arguments = {key: value for key, value in span.items()
+                         if key not in ('name', 'category', 'thread', 'start', 'wall', 'depth', 'parent')}
+            events.append({'name': span['name'], 'cat': span['category'], 'ph': 'X', 'pid': pid, 'tid': span['thread'],
+                           'ts': span['start'] * 1e6, 'dur': span['wall'] * 1e6, 'args': arguments})
+        for moment, name, total in self._counter_events:
+            events.append({'name': name, 'ph': 'C', 'pid': pid, 'ts': moment * 1e6, 'args': {name: total}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path: str):
+        """ Write the Chrome trace file. """
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file, default=str)
+
+    def _stack(self) -> list:
+        """ The open spans of the current thread, innermost last. """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+class _Span():
+    """ A section recorded by a profiler. Attributes can be added while it is open with set. """
+
+    __slots__ = ('_profiler', '_record', '_wall', '_cpu', '_traced', '_peak')
+
+    def __init__(self, profiler: Profiler, name: str, category: str, attributes: dict):
+        self._profiler = profiler
+        self._record = {'name': name, 'category': category, **attributes}
+
+    def __enter__(self):
+        profiler = self._profiler
+        stack = profiler._stack()
+        self._record.update(thread=threading.get_ident(), depth=len(stack),
+                            parent=stack[-1]._record['name'] if stack else None)
+        if profiler._trace_memory:
+            # The peak is reset for this span: the open spans keep the peak reached so far
+            current, peak = tracemalloc.get_traced_memory()
+            for span in stack:
+                span._peak = max(span._peak, peak)
+            tracemalloc.reset_peak()
+            self._traced, self._peak = current, current
+        stack.append(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exception):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        profiler = self._profiler
+        stack = profiler._stack()
+        stack.pop()
+        self._record.update(start=self._wall - profiler._origin, wall=wall, cpu=cpu)
+        if profiler._trace_memory:
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+            self._record['traced_peak_mb'] = (self._peak - self._traced) / 2**20
+        if exception[0] is not None:
+            self._record['error'] = exception[0].__name__
+        with profiler._lock:
+            profiler._spans.append(self._record)
+        return False
+
+    def set(self, **attributes):
+        """ Add attributes to the span. """
+        self._record.update(attributes)
+
+
+class _NullSpan():
+    """ The span returned when no profiler is active: it records nothing. """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enabled() -> bool:
+    """ Whether a profiler is active. Expensive measures should be taken only if it is. """
+    return _active is not None
+
+
+def active_profiler() -> Profiler:
+    """ The active profiler, None if the instrumentation is disabled. """
+    return _active
+
+
+def span(name: str, category: str = None, **attributes):
+    """
+    A context manager recording the section it wraps as a span of the active
+    profiler, if any.
+
+    Parameters
+    ----------
+    name: str
+        Name of the span, e.g. 'pyomo.create_instance'.
+    category: str, optional
+        Category of the span in the Chrome trace, by default the part of the name before the first dot.
+    attributes:
+        Attributes of the span, e.g. the iteration of a loop.
+    """
+    if _active is None:
+        return _NULL_SPAN
+    return _active.span(name, category, **attributes)
+
+
+def count(name: str, value: float = 1):
+    """ Add value to the counter name of the active profiler, if any. """
+    if _active is not None:
+        _active.count(name, value)
+
+
+def traced(function):
+    """
+    Decorator recording each call of function as a span of the active profiler,
+    named after its qualified name (e.g. Implementor.solve) with the module as
+    category.
+    """
+    name = function.__qualname__
+    category = function.__module__.rsplit('.', 1)[-1]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _active is None:
+            return function(*args, **kwargs)
+        with _active.span(name, category):
+            return function(*args, **kwargs)
+
+    return wrapper
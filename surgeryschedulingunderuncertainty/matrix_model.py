@@ -0,0 +1,487 @@
+# Python STL
+
+# Packages
+import highspy
+import numpy as np
+import scipy.sparse as sp
+
+# Modules
+
+
+class MatrixModel():
+    """
+    Mixed integer linear model assembled directly as sparse arrays, without
+    building Pyomo expressions, and solved by HiGHS through highspy.
+    Variables are added as arrays of columns; constraints as blocks of rows
+    given in coordinate format (row, column, coefficient), with their lower and
+    upper bounds. The objective is minimized.
+
+    Attributes
+    ----------
+    _variables: dict
+        Mapping from the name of each variable to the array of its columns.
+    _cost: list
+        Objective coefficients of the columns, one array for each variable.
+    _lower: list
+        Lower bounds of the columns.
+    _upper: list
+        Upper bounds of the columns.
+    _integer: list
+        Whether the columns are integer.
+    _blocks: list
+        The blocks of constraints, as (rows, columns, values) arrays.
+    _row_lower: list
+        Lower bounds of the rows, one array for each block.
+    _row_upper: list
+        Upper bounds of the rows.
+    _offset: float
+        Constant term of the objective.
+    """
+
+    def __init__(self):
+        self._variables = {}
+        self._cost = []
+        self._lower = []
+        self._upper = []
+        self._integer = []
+        self._num_of_columns = 0
+
+        self._blocks = []
+        self._row_lower = []
+        self._row_upper = []
+        self._num_of_rows = 0
+
+        self._offset = 0.
+
+    # Getters and setters
+    def get_num_of_columns(self):
+        return self._num_of_columns
+    num_of_columns = property(get_num_of_columns)
+
+    def get_num_of_rows(self):
+        return self._num_of_rows
+    num_of_rows = property(get_num_of_rows)
+
+    def get_offset(self):
+        return self._offset
+    def set_offset(self, new: float):
+        self._offset = float(new)
+    offset = property(get_offset, set_offset)
+
+    # Specific methods
+    def columns(self, name: str) -> np.ndarray:
+        """ The columns of a variable, with its shape. """
+        return self._variables[name]
+
+    def add_variable(self, name: str, shape: tuple, lower = 0., upper = np.inf, integer: bool = False) -> np.ndarray:
+        """
+        Add an array of variables.
+
+        Parameters
+        ----------
+        name: str
+            Name of the variable, used to read its values in the solution.
+        shape: tuple
+            Shape of the array of variables.
+        lower, upper: float or np.ndarray, optional
+            Bounds of the variables, scalars or arrays of the given shape.
+        integer: bool, optional
+            Whether the variables are integer.
+
+        Returns
+        -------
+        np.ndarray
+            The columns of the variables, with the given shape.
+        """
+        size = int(np.prod(shape))
+        columns = np.arange(self._num_of_columns, self._num_of_columns + size).reshape(shape)
+
+        self._variables[name] = columns
+        self._cost.append(np.zeros(size))
+        self._lower.append(np.broadcast_to(np.asarray(lower, dtype=float), shape).ravel())
+        self._upper.append(np.broadcast_to(np.asarray(upper, dtype=float), shape).ravel())
+        self._integer.append(np.full(size, integer))
+        self._num_of_columns += size
+
+        return columns
+
+    def add_cost(self, name: str, cost):
+        """ Add to the objective coefficients of a variable, a scalar or an array of its shape. """
+        number = list(self._variables).index(name)
+        self._cost[number] = self._cost[number] + np.broadcast_to(np.asarray(cost, dtype=float), 
+                                                                  self._variables[name].shape).ravel()
+
+    def add_constraints(self, rows, columns, values, lower = -np.inf, upper = np.inf) -> np.ndarray:
+        """
+        Add a block of constraints lower <= A x <= upper.
+
+        Parameters
+        ----------
+        rows: np.ndarray
+            Row of each coefficient, numbered from 0 within the block.
+        columns: np.ndarray
+            Column of each coefficient, as returned by add_variable.
+        values: np.ndarray
+            The coefficients; a scalar is used for all of them.
+        lower, upper: float or np.ndarray, optional
+            Bounds of the rows, scalars or one for each row.
+
+        Returns
+        -------
+        np.ndarray
+            The indexes of the rows of the block in the model.
+        """
+        shape = np.shape(rows)
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        columns = np.asarray(columns, dtype=np.int64).ravel()
+        values = np.broadcast_to(np.asarray(values, dtype=float), shape).ravel()
+
+        num_of_rows = max(int(rows.max()) + 1 if len(rows) else 0,
+                          np.size(lower) if np.ndim(lower) else 0,
+                          np.size(upper) if np.ndim(upper) else 0)
+
+        self._blocks.append((rows + self._num_of_rows, columns, values))
+        self._row_lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (num_of_rows,)).ravel())
+        self._row_upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (num_of_rows,)).ravel())
+        self._num_of_rows += num_of_rows
+
+        return np.arange(self._num_of_rows - num_of_rows, self._num_of_rows)
+
+    def matrix(self) -> sp.csc_matrix:
+        """ The constraint matrix, by columns. """
+        if self._blocks:
+            rows, columns, values = (np.concatenate(arrays) for arrays in zip(*self._blocks))
+        else:
+            rows = columns = np.empty(0, dtype=np.int64)
+            values = np.empty(0)
+        return sp.coo_matrix((values, (rows, columns)), shape=(self._num_of_rows, self._num_of_columns)).tocsc()
+
+    def solve(self, start: np.ndarray = None, time_limit: float = None, options: dict = None) -> 'MatrixSolution':
+        """
+        Solve the model with HiGHS.
+
+        Parameters
+        ----------
+        start: np.ndarray, optional
+            Values of all the columns used as MIP start.
+        time_limit: float, optional
+            Time limit of the solver, in seconds.
+        options: dict, optional
+            Further HiGHS options, by name.
+        """
+        matrix = self.matrix()
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = self._num_of_columns
+        lp.num_row_ = self._num_of_rows
+        lp.col_cost_ = np.concatenate(self._cost) if self._cost else np.empty(0)
+        lp.col_lower_ = np.concatenate(self._lower) if self._lower else np.empty(0)
+        lp.col_upper_ = np.concatenate(self._upper) if self._upper else np.empty(0)
+        lp.row_lower_ = np.concatenate(self._row_lower) if self._row_lower else np.empty(0)
+        lp.row_upper_ = np.concatenate(self._row_upper) if self._row_upper else np.empty(0)
+        lp.offset_ = self._offset
+
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = matrix.indptr.astype(np.int32)
+        lp.a_matrix_.index_ = matrix.indices.astype(np.int32)
+        lp.a_matrix_.value_ = matrix.data
+        lp.a_matrix_.num_col_ = self._num_of_columns
+        lp.a_matrix_.num_row_ = self._num_of_rows
+
+        integer = np.concatenate(self._integer) if self._integer else np.empty(0, dtype=bool)
+        if integer.any():
+            lp.integrality_ = [highspy.HighsVarType.kInteger if flag else highspy.HighsVarType.kContinuous
+                               for flag in integer]
+
+        solver = highspy.Highs()
+        solver.setOptionValue('output_flag', False)
+        if time_limit is not None:
+            solver.setOptionValue('time_limit', float(time_limit))
+        for name, value in (options or {}).items():
+            solver.setOptionValue(name, value)
+        solver.passModel(lp)
+
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = list(np.asarray(start, dtype=float))
+            solution.value_valid = True
+            solver.setSolution(solution)
+
+        solver.run()
+
+        status = solver.getModelStatus()
+        if status not in (highspy.HighsModelStatus.kOptimal, highspy.HighsModelStatus.kTimeLimit) \
+                or solver.getInfo().primal_solution_status == 0:
+            raise RuntimeError(f"HiGHS did not find a solution: {solver.modelStatusToString(status)}.")
+
+        values = np.asarray(solver.getSolution().col_value)
+        # Integer columns are rounded, as they are read by equality with 0 and 1
+        values = np.where(integer, np.round(values), values)
+
+        info = solver.getInfo()
+        return MatrixSolution(variables = {name: values[columns] for name, columns in self._variables.items()},
+                              objective = info.objective_function_value,
+                              columns = values,
+                              statistics = {'node_count': int(info.mip_node_count), 'mip_gap': float(info.mip_gap)})
+
+
+class MatrixSolution():
+    """
+    Solution of a MatrixModel, read as a solved Pyomo instance: the value of a
+    variable is solution.x[b, i](), with indexes starting from 1, and the value
+    of the objective is solution.obj().
+    """
+
+    def __init__(self, variables: dict, objective: float, columns: np.ndarray, statistics: dict = None):
+        """
+        Parameters
+        ----------
+        variables: dict
+            Mapping from the name of each variable to the array of its values.
+        objective: float
+            Value of the objective.
+        columns: np.ndarray
+            Values of all the columns, e.g. to start the next solve.
+        statistics: dict, optional
+            Statistics of the solver, e.g. the number of branch and bound nodes.
+        """
+        self._variables = variables
+        self._objective = objective
+        self._columns = columns
+        self._statistics = statistics or {}
+
+    def __getattr__(self, name):
+        variables = self.__dict__.get('_variables', {})
+        if name not in variables:
+            raise AttributeError(name)
+        return _IndexedValues(variables[name])
+
+    # Getters and setters
+    def get_columns(self):
+        return self._columns
+    columns = property(get_columns)
+
+    def get_statistics(self):
+        return self._statistics
+    statistics = property(get_statistics)
+
+    # Specific methods
+    def obj(self) -> float:
+        return self._objective
+
+    def value(self, name: str) -> np.ndarray:
+        """ The values of a variable, as an array. """
+        return self._variables[name]
+
+
+class _IndexedValues():
+    """ Values of an array of variables indexed from 1, each returned by a call as in Pyomo. """
+
+    def __init__(self, values: np.ndarray):
+        self._values = values
+
+    def __getitem__(self, index):
+        index = tuple(number - 1 for number in (index if isinstance(index, tuple) else (index,)))
+        value = float(self._values[index])
+        return lambda: value
+
+    def __len__(self):
+        return self._values.size
+
+
+def instance_array(data: dict, shape: tuple, fill: float = 0.) -> np.ndarray:
+    """ A parameter of the Pyomo instance data, {index: value} with indexes from 1, as an array. """
+    array = np.full(shape, fill, dtype=float)
+    if data:
+        indexes = np.array([index if isinstance(index, tuple) else (index,) for index in data], dtype=np.int64) - 1
+        array[tuple(indexes.T)] = np.fromiter(data.values(), dtype=float, count=len(data))
+    return array
+
+
+# Objective function and constraints, as the rules of _models_components, on
+# the arrays of the instance data (see instance_arrays). Variables are indexed
+# from 0: block b of the arrays is block b+1 of the Pyomo model.
+
+def instance_arrays(instance_data: dict) -> dict:
+    """ The parameters of the Pyomo instance data as scalars and arrays. """
+    data = instance_data[None]
+    arrays = {name: data[name][None] for name in ['n_days', 'n_blocks', 'n_pats', 'c_exclusion', 'c_delay']}
+    arrays['n_realizations'] = data.get('n_realizations', {None: 0})[None]
+
+    n_blocks, n_pats, n_realizations = arrays['n_blocks'], arrays['n_pats'], arrays['n_realizations']
+    shapes = {'t': (n_pats,), 'w': (n_pats,), 'l': (n_pats,), 'u': (n_pats,), 'f': (n_pats,),
+              'g': (n_blocks,), 'gamma': (n_blocks,), 'time_increment': (n_blocks,),
+              'a': (n_blocks, n_pats), 'eps': (n_pats, n_realizations)}
+
+    for name, shape in shapes.items():
+        if name in data:
+            arrays[name] = instance_array(data[name], shape)
+
+    return arrays
+
+
+def add_assignment_variables(model: MatrixModel, data: dict):
+    """ Variables x, y and z; compatibility (x <= a) is the upper bound of x. """
+    model.add_variable('x', (data['n_blocks'], data['n_pats']), upper=data['a'], integer=True)
+    model.add_variable('y', (data['n_pats'],))
+    model.add_variable('z', (data['n_pats'],))
+
+
+def objective_standard(model: MatrixModel, data: dict):
+    # sum(u y) + c_exclusion sum(u (1 - sum_b x)) + c_delay sum(u z)
+    u = data['u']
+    model.add_cost('y', u)
+    model.add_cost('x', np.broadcast_to(-data['c_exclusion'] * u, (data['n_blocks'], data['n_pats'])))
+    model.add_cost('z', data['c_delay'] * u)
+    model.offset = model.offset + data['c_exclusion'] * u.sum()
+
+
+def delay_detector(model: MatrixModel, data: dict):
+    # y + w - l <= z
+    patients = np.arange(data['n_pats'])
+    model.add_constraints(rows = np.concatenate([patients, patients]),
+                          columns = np.concatenate([model.columns('y'), model.columns('z')]),
+                          values = np.repeat([1., -1.], data['n_pats']),
+                          upper = data['l'] - data['w'])
+
+
+def one_surgery(model: MatrixModel, data: dict):
+    # sum_b x[b, i] <= 1
+    x = model.columns('x')
+    model.add_constraints(rows = np.broadcast_to(np.arange(data['n_pats']), x.shape),
+                          columns = x,
+                          values = 1.,
+                          upper = np.ones(data['n_pats']))
+
+
+def y_definition(model: MatrixModel, data: dict):
+    # y = sum_b day(b) x[b, i] + (n_days + 1) (1 - sum_b x[b, i]), with the day of YVarDefRule
+    n_blocks, n_pats, n_days = data['n_blocks'], data['n_pats'], data['n_days']
+    days = np.array([int(b / (n_blocks / n_days)) + 1 for b in range(1, n_blocks + 1)], dtype=float)
+    x = model.columns('x')
+    model.add_constraints(rows = np.concatenate([np.arange(n_pats), np.broadcast_to(np.arange(n_pats), x.shape).ravel()]),
+                          columns = np.concatenate([model.columns('y'), x.ravel()]),
+                          values = np.concatenate([np.ones(n_pats), np.repeat(n_days + 1 - days, n_pats)]),
+                          lower = np.full(n_pats, n_days + 1.),
+                          upper = np.full(n_pats, n_days + 1.))
+
+
+def capacity(model: MatrixModel, data: dict):
+    # sum_i t[i] x[b, i] <= g[b]
+    x = model.columns('x')
+    model.add_constraints(rows = np.broadcast_to(np.arange(data['n_blocks'])[:, None], x.shape),
+                          columns = x,
+                          values = np.broadcast_to(data['t'], x.shape),
+                          upper = data['g'])
+
+
+def capacity_overtime(model: MatrixModel, data: dict):
+    # sum_i (t[i] + eps[i, k]) x[b, i] <= g[b], for each realization k
+    n_blocks, n_pats, n_realizations = data['n_blocks'], data['n_pats'], data['n_realizations']
+    if n_realizations == 0:
+        return
+    x = model.columns('x')
+    # Rows ordered by (b, k), coefficients by (b, k, i)
+    model.add_constraints(rows = np.broadcast_to(np.arange(n_blocks * n_realizations).reshape(n_blocks, n_realizations, 1),
+                                                 (n_blocks, n_realizations, n_pats)),
+                          columns = np.broadcast_to(x[:, None, :], (n_blocks, n_realizations, n_pats)),
+                          values = np.broadcast_to((data['t'][:, None] + data['eps']).T, (n_blocks, n_realizations, n_pats)),
+                          upper = np.repeat(data['g'], n_realizations))
+
+
+def add_fraction_variables(model: MatrixModel, data: dict):
+    model.add_variable('q', (data['n_blocks'], data['n_pats']))
+
+
+def fraction_sum_one(model: MatrixModel, data: dict):
+    # sum_i q[b, i] <= 1
+    q = model.columns('q')
+    model.add_constraints(rows = np.broadcast_to(np.arange(data['n_blocks'])[:, None], q.shape),
+                          columns = q,
+                          values = 1.,
+                          upper = np.ones(data['n_blocks']))
+
+
+def assignment_exist(model: MatrixModel, data: dict):
+    # q[b, i] - x[b, i] <= 0
+    q, x = model.columns('q'), model.columns('x')
+    rows = np.arange(q.size)
+    model.add_constraints(rows = np.concatenate([rows, rows]),
+                          columns = np.concatenate([q.ravel(), x.ravel()]),
+                          values = np.repeat([1., -1.], q.size),
+                          upper = np.zeros(q.size))
+
+
+def chance_constraint(robustness_overtime: float):
+    def internal(model: MatrixModel, data: dict):
+        # (g[b] + overtime) q[b, i] - f[i] x[b, i] >= 0
+        q, x = model.columns('q'), model.columns('x')
+        rows = np.arange(q.size)
+        model.add_constraints(rows = np.concatenate([rows, rows]),
+                              columns = np.concatenate([q.ravel(), x.ravel()]),
+                              values = np.concatenate([np.repeat(data['g'] + robustness_overtime, data['n_pats']),
+                                                       -np.tile(data['f'], data['n_blocks'])]),
+                              lower = np.zeros(q.size))
+    return internal
+
+
+def add_dual_variables(model: MatrixModel, data: dict):
+    model.add_variable('xi', (data['n_blocks'],))
+    model.add_variable('pi', (data['n_blocks'], data['n_pats']))
+
+
+def dual_capacity(model: MatrixModel, data: dict):
+    # sum_i t[i] x[b, i] + gamma[b] xi[b] + sum_i pi[b, i] <= g[b]
+    n_blocks = data['n_blocks']
+    x, xi, pi = model.columns('x'), model.columns('xi'), model.columns('pi')
+    blocks = np.broadcast_to(np.arange(n_blocks)[:, None], x.shape).ravel()
+    model.add_constraints(rows = np.concatenate([blocks, np.arange(n_blocks), blocks]),
+                          columns = np.concatenate([x.ravel(), xi, pi.ravel()]),
+                          values = np.concatenate([np.tile(data['t'], n_blocks), data['gamma'], np.ones(pi.size)]),
+                          upper = data['g'])
+
+
+def dual_definition(model: MatrixModel, data: dict):
+    # xi[b] + pi[b, i] - time_increment[b] x[b, i] >= 0
+    x, xi, pi = model.columns('x'), model.columns('xi'), model.columns('pi')
+    rows = np.arange(x.size)
+    model.add_constraints(rows = np.concatenate([rows, rows, rows]),
+                          columns = np.concatenate([np.repeat(xi, data['n_pats']), pi.ravel(), x.ravel()]),
+                          values = np.concatenate([np.ones(x.size), np.ones(x.size),
+                                                   -np.repeat(data['time_increment'], data['n_pats'])]),
+                          lower = np.zeros(x.size))
+
+
+def block_ordering(pairs: list):
+    def internal(model: MatrixModel, data: dict):
+        # sum_i t[i] x[b1, i] - sum_i t[i] x[b2, i] >= 0, for each pair of equivalent blocks
+        if not pairs:
+            return
+        x = model.columns('x')
+        first, second = (np.array(blocks) - 1 for blocks in zip(*pairs))
+        rows = np.broadcast_to(np.arange(len(pairs))[:, None], (len(pairs), data['n_pats'])).ravel()
+        model.add_constraints(rows = np.concatenate([rows, rows]),
+                              columns = np.concatenate([x[first].ravel(), x[second].ravel()]),
+                              values = np.concatenate([np.tile(data['t'], len(pairs)), -np.tile(data['t'], len(pairs))]),
+                              lower = np.zeros(len(pairs)))
+    return internal
+
+
+def patient_ordering(pairs: list):
+    def internal(model: MatrixModel, data: dict):
+        # sum_b x[b, i1] - sum_b x[b, i2] >= 0 and y[i2] - y[i1] >= 0, for each pair of interchangeable patients
+        if not pairs:
+            return
+        x, y = model.columns('x'), model.columns('y')
+        first, second = (np.array(patients) - 1 for patients in zip(*pairs))
+        rows = np.broadcast_to(np.arange(len(pairs))[:, None], (len(pairs), data['n_blocks'])).ravel()
+        model.add_constraints(rows = np.concatenate([rows, rows]),
+                              columns = np.concatenate([x[:, first].T.ravel(), x[:, second].T.ravel()]),
+                              values = np.repeat([1., -1.], rows.size),
+                              lower = np.zeros(len(pairs)))
+        rows = np.arange(len(pairs))
+        model.add_constraints(rows = np.concatenate([rows, rows]),
+                              columns = np.concatenate([y[second], y[first]]),
+                              values = np.repeat([1., -1.], len(pairs)),
+                              lower = np.zeros(len(pairs)))
+    return internal
@@ -0,0 +1,90 @@
+# Python STL
+import os
+
+# Packages
+
+# Modules
+from .patient import Patient
+from .predictive_model import PredictiveModel
+
+
+class ModelRegistry():
+    """
+    Registry of fitted predictive models, so that the same model is trained only
+    once across experiment runs. Models are identified by their fingerprint (class,
+    hyperparameters, training features and target): when a model with the same
+    fingerprint was already fitted, it is returned instead of training a new one.
+    Fitted models are kept in memory and, if a directory is given, saved on disk.
+
+    Attributes
+    ----------
+    _directory: str
+        Directory where the fitted models are saved. If None, only the memory is used.
+    _models: dict
+        The fitted models by fingerprint.
+    """
+
+    def __init__(self, directory: str = None):
+        self._directory = directory
+        self._models = {}
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # Getters and setters
+    def get_directory(self):
+        return self._directory
+    directory = property(get_directory)
+
+    # Specific methods
+    def get_model(self, 
+                  model_class: type, 
+                  patients: list[Patient], 
+                  description = "", 
+                  hyperparameters: dict = None) -> PredictiveModel:
+        """
+        Return a trained model of the given class. It is fitted only if no model
+        with the same fingerprint is in the registry.
+
+        Parameters
+        ----------
+        model_class: type
+            A concrete PredictiveModel class, e.g. NGBLogNormal.
+        patients: list[Patient]
+            The training patients.
+        description: str, optional
+            Description of the model.
+        hyperparameters: dict, optional
+            Arguments of the wrapped model.
+
+        Returns
+        -------
+        PredictiveModel
+            The trained model.
+        """
+        model = model_class(patients = patients, 
+                            description = description, 
+                            hyperparameters = hyperparameters, 
+                            train = False)
+        fingerprint = model.fingerprint()
+
+        if fingerprint in self._models:
+            return self._models[fingerprint]
+
+        path = self._path(fingerprint)
+
+        if path and os.path.exists(path):
+            model.load(path)
+        else:
+            model.train()
+            if path:
+                model.save(path)
+
+        self._models[fingerprint] = model
+
+        return model
+
+    def _path(self, fingerprint: str):
+        if not self._directory:
+            return None
+        return os.path.join(self._directory, f"{fingerprint}.pkl")
@@ -1,9 +1,15 @@
 # Python STL
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import json
+import os
+import time
 
 # Packages
 import pyomo.environ as pyo  # not used for the implementor adversary
 import numpy as np
+import pandas as pd
 import scipy.stats as ss
 
 # Modules
@@ -12,6 +18,9 @@ from .adversary import Adversary, EquiprobableVertex
 from .task import Task
 from .predictive_model import PredictiveModel
 from .schedule import Schedule
+from .evaluation import ScheduleEvaluator
+from .matrix_model import MatrixSolution
+from . import instrumentation
 
 
 
@@ -46,6 +55,26 @@ class Optimizer(ABC):
 
 
 class ImplementorAdversary(Optimizer):
+    """
+    Implementor adversary loop: the implementor schedules the patients, the
+    adversary checks the risk of overtime of each block of the schedule and adds
+    realizations of the durations (scenarios) against the fragile blocks, until
+    the schedule is robust or the loops are over.
+
+    With a checkpoint file, the state of the loop is saved after every
+    iteration: the realizations of the patients (the scenario pool), the
+    assignment of the incumbent schedule and the metrics of the iterations. An
+    interrupted run continues with resume, from the iteration after the last
+    saved one, with the incumbent as MIP start of its first solve.
+
+    Attributes
+    ----------
+    _report: pd.DataFrame
+        The metrics of each iteration of the last run (see run).
+    """
+
+    # Version of the format of the checkpoint files
+    CHECKPOINT_VERSION = 1
 
     def __init__(self, task:Task, implementor: Implementor, adversary: Adversary, description = ""):
 
@@ -55,40 +84,173 @@ class ImplementorAdversary(Optimizer):
         self._adversary = adversary
 
         self._instance_data = None
+        self._report = None
 
     # Getters and setters
+    def get_report(self):
+        return self._report
+    report = property(get_report)
 
     #def set_adversary_predictor(self, predictor:PredictiveModel):
     #    self._adversary.predictor = predictor
     #    return True
 
     # Abstract methods implementation
-    def run(self, max_loops:int):
-        
+    @instrumentation.traced
+    def run(self, max_loops:int, callback = None, checkpoint: str = None):
+        """
+        Run the implementor adversary loop. The metrics of each iteration are
+        kept in report: iteration, fragile_blocks, robust, scenarios_added (by
+        the adversary), scenarios (in the solved model), variables, constraints,
+        build_time and solve_time (seconds), node_count, mip_gap and objective.
+
+        Parameters
+        ----------
+        max_loops: int
+            Maximum number of iterations.
+        callback: callable, optional
+            Called after each iteration with its metrics (a dict). If it returns
+            True the loop stops, e.g. when the fragile blocks do not decrease.
+        checkpoint: str, optional
+            File (JSON) where the state of the loop is saved after every iteration.
+
+        Returns
+        -------
+        Schedule
+            The schedule of the last iteration.
+        """
+        return self._loop(first_iteration = 1, max_loops = max_loops, iterations = [], 
+                          callback = callback, checkpoint = checkpoint)
+
+    @instrumentation.traced
+    def resume(self, checkpoint: str, max_loops:int, callback = None):
+        """
+        Continue a run from its checkpoint: the realizations of the patients of
+        the task and the report are restored, and the loop goes on from the
+        iteration after the last saved one up to max_loops (counting the
+        iterations already done), saving to the same checkpoint. The first solve
+        starts from the incumbent schedule. If the saved run was over (robust
+        schedule, stopped by the callback or no iterations left) the incumbent
+        schedule is returned without solving.
+
+        Parameters
+        ----------
+        checkpoint: str
+            The checkpoint file of the run.
+        max_loops: int
+            Maximum number of iterations, including the ones already done.
+        callback: callable, optional
+            As in run.
+
+        Returns
+        -------
+        Schedule
+            The schedule of the last iteration.
+        """
+        with open(checkpoint) as file:
+            state = json.load(file)
+        if state.get('version') != self.CHECKPOINT_VERSION:
+            raise ValueError(f"Checkpoint version {state.get('version')} is not supported.")
+
+        self.task.set_adversary_realizations(dict(zip(state['patients'], state['realizations'])))
+        iterations = state['report']
+        self._report = pd.DataFrame(iterations)
+        assignment = {tuple(pair): 1 for pair in state['assignment']}
+
+        if state['robust'] or state['stopped'] or state['iteration'] >= max_loops:
+            n_blocks = self.task.num_of_weeks * self.task.master_schedule.get_num_of_blocks()
+            x = np.zeros((n_blocks, self.task.num_of_patients))
+            for b, i in assignment:
+                x[b - 1, i - 1] = 1
+            incumbent = MatrixSolution(variables = {'x': x}, objective = state['objective'], columns = x.ravel())
+            return Schedule(task = self.task, solved_instance = incumbent)
+
+        return self._loop(first_iteration = state['iteration'] + 1, max_loops = max_loops, iterations = iterations,
+                          callback = callback, checkpoint = checkpoint, start = {'x': assignment})
+
+    def _loop(self, first_iteration: int, max_loops: int, iterations: list, callback = None, checkpoint: str = None,
+              start: dict = None):
+        """ The iterations from first_iteration to max_loops; start is the MIP start of the first solve. """
         
         # Main implementor adversary loop
-        for _ in range(max_loops):
-            
-            # Creating instance
-            self.create_instance()
-            
-            # Call implementor
-            print('implementor')
-            solved_instance = self._implementor.run()
-            schedule =  Schedule(task = self.task, solved_instance = solved_instance)
+        for iteration in range(first_iteration - 1, max_loops):
             
-            # Call adversary
-            print('adversary')
-            adversary = EquiprobableVertex(schedule=schedule, task = self.task)
-            robustness_flag, fragile_blocks = adversary.run()
-        
-            # Exit the loop if the schedule is robust and do not need other iterations
-            if robustness_flag == True:
+            with instrumentation.span('ImplementorAdversary.iteration', 'optimizer', iteration = iteration + 1) as span:
+
+                # Creating instance
+                self.create_instance()
+                scenarios = self.task.num_adversary_realizations
+                
+                # Call implementor
+                begin = time.perf_counter()
+                self._implementor.build()
+                if start is not None:
+                    self._implementor.set_start(start)
+                build_time = time.perf_counter() - begin
+                solved_instance = self._implementor.solve(warmstart = start is not None)
+                solve_time = time.perf_counter() - begin - build_time
+                schedule =  Schedule(task = self.task, solved_instance = solved_instance)
+                start = None
+                
+                # Call adversary
+                adversary = EquiprobableVertex(schedule=schedule, task = self.task)
+                robustness_flag, fragile_blocks = adversary.run()
+                span.set(robust = robustness_flag, fragile_blocks = fragile_blocks)
+
+            variables, constraints = self._implementor.model_size()
+            metrics = {
+                'iteration': iteration + 1,
+                'fragile_blocks': fragile_blocks,
+                'robust': bool(robustness_flag),
+                'scenarios_added': self.task.num_adversary_realizations - scenarios,
+                'scenarios': scenarios,
+                'variables': variables,
+                'constraints': constraints,
+                'build_time': build_time,
+                'solve_time': solve_time,
+                **self._implementor.solver_statistics(),
+                'objective': float(solved_instance.obj()),
+            }
+            iterations.append(metrics)
+            self._report = pd.DataFrame(iterations)
+
+            stop = robustness_flag == True or (callback is not None and bool(callback(metrics)))
+
+            if checkpoint:
+                self._save_checkpoint(checkpoint, schedule, iterations, stopped = stop and not robustness_flag)
+        
+            # Exit the loop if the schedule is robust and do not need other iterations, or if the callback asks it
+            if stop:
                 break
 
         return schedule
 
+    def _save_checkpoint(self, path: str, schedule: Schedule, iterations: list, stopped: bool):
+        """ Write the state of the loop, under a temporary name and then renamed: never half written. """
+        patient_index = {patient.id: index for index, patient in enumerate(self.task.patients)}
+        state = {
+            'version': self.CHECKPOINT_VERSION,
+            'iteration': iterations[-1]['iteration'],
+            'robust': iterations[-1]['robust'],
+            'stopped': stopped,
+            'objective': iterations[-1]['objective'],
+            'patients': [patient.id for patient in self.task.patients],
+            'realizations': [list(patient.adversary_realization) for patient in self.task.patients],
+            'assignment': [[block.order_in_schedule + 1, patient_index[patient.id] + 1]
+                           for block in schedule.blocks for patient in block.patients],
+            'report': iterations,
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w') as file:
+            # numpy scalars (ids, realizations, statistics) are written as Python numbers
+            json.dump(state, file, default=lambda value: value.item())
+        os.replace(path + '.tmp', path)
+
     # Specific methods
+    @instrumentation.traced
     def create_instance(self):
         
         master_schedule = self._task.get_master_schedule()
@@ -179,7 +341,7 @@ class ImplementorAdversary(Optimizer):
 
         update_dictionary = {}
 
-        for i in range(n_pats):
+        for i, patient in enumerate(patients):
             update_dictionary.update({i + 1: patient.max_waiting_days})
 
         instance.update({'l': update_dictionary})
@@ -193,7 +355,7 @@ class ImplementorAdversary(Optimizer):
             update_dictionary = {}
             
             for k in range(self.task.num_adversary_realizations):
-                for i in range(n_pats):
+                for i, patient in enumerate(patients):
                     update_dictionary.update(
                         {(i+1, k+1): 
                             patient.adversary_realization[k]}
@@ -260,6 +422,7 @@ class VanillaImplementor(Optimizer):
     # Getters and setters
 
     # Abstract methods implementation
+    @instrumentation.traced
     def run(self):
         
         # Creating instance
@@ -270,6 +433,7 @@ class VanillaImplementor(Optimizer):
         return schedule
 
     # Specific methods
+    @instrumentation.traced
     def create_instance(self):
         """
         Qui il metodo è modificato per permettere la chance constraints. Se va modificato va modificato per tutti i tipi di implemnentor...
@@ -536,52 +700,15 @@ class BudgetSet(Optimizer):
     #    return True
 
     # Abstract methods implementation
+    @instrumentation.traced
     def run(self):
-        
-        # non qui
-        import numpy as np
     
         # param setup    
-        for block in self._task.master_schedule.blocks: 
-
-            # Save nominal times of the patients
-            patient_times = []
-
-            # Check for patient compatible with the block
-            for patient in self._task.patients:                
-                if patient.equipe in block.equipes:
-                    patient_times.append(patient.uncertainty_profile.nominal_value)
-             
-            # Calculate parameters   
-            times_mean = np.mean(patient_times)
-            times_std = np.std(patient_times)/len(patient_times)
-            
-            block.robustness_budget_set.update({'mean':times_mean,
-                                                'std':times_std})
-            
-            
-            for gamma in range(2, self.task.gamma_max +1 ): # inizio da 2 perché se è 1 non posso metterlo a zero
-
-                distribution = ss.norm(loc = gamma*times_mean, scale = times_std)
-                
-                probability = 1-distribution.cdf(block.duration + self.task.robustness_overtime)
-                
-                if probability > self.task.robustness_risk: # TODO: maggiore o maggiore-uguale?
-                    
-                    chosed_gamma  = gamma-1
-                                        
-                    time_increment = (block.duration*self.task.robustness_overtime)/chosed_gamma
-                    
-                    block.robustness_budget_set.update({'gamma':chosed_gamma,
-                                                        'time_increment':time_increment})
-                    
-                    
-            
+        self.apply_calibration()
             
         # Creating instance
         self.create_instance()
         
-        print('implementor')
         solved_instance = self._implementor.run()
         schedule =  Schedule(task = self.task, solved_instance = solved_instance)
         
@@ -592,6 +719,215 @@ class BudgetSet(Optimizer):
         
 
     # Specific methods
+    @instrumentation.traced
+    def sweep(self, 
+              robustness_risks: list[float] = None, 
+              gammas_max: list[int] = None, 
+              warmstart: bool = True,
+              max_workers: int = 1,
+              n_scenarios: int = 1000,
+              seed: int = 0) -> pd.DataFrame:
+        """
+        Solve the model for every combination of robustness risk and gamma_max,
+        and measure the overtime risk of each schedule, giving the curve of the
+        objective against the overtime risk.
+        The implementor model is built once: for each point only the mutable 
+        parameters gamma and time_increment of the instance are updated, and the
+        persistent solver starts from the solution of the previous point.
+        Every point is calibrated from the budget sets of the task, as run() 
+        would; blocks for which no gamma up to gamma_max is over the risk, and
+        without a previous gamma, have no budget (see _budget_set_data). The 
+        budget set parameters of the blocks are restored at the end.
+
+        Parameters
+        ----------
+        robustness_risks: list[float], optional
+            The risks to try, by default the one of the task.
+        gammas_max: list[int], optional
+            The values of gamma_max to try, by default the one of the task.
+        warmstart: bool, optional
+            Use the solution of the previous point as MIP start.
+        max_workers: int, optional
+            The points are split in contiguous chunks solved in parallel processes,
+            each building its own model.
+        n_scenarios: int, optional
+            Scenarios of the ScheduleEvaluator of each schedule, with the 
+            robustness overtime of the task as tolerance.
+        seed: int, optional
+            Seed of the evaluation, the same for every point.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each point: robustness_risk, gamma_max, objective, number 
+            of scheduled patients, mean gamma of the blocks, solve time and the 
+            evaluated overtime_risk (the largest probability of a block to exceed
+            its duration plus the overtime), mean_overtime_risk (over the blocks)
+            and expected_overtime (minutes, of the whole schedule).
+        """
+        points = [(risk, gamma_max) 
+                  for risk in (robustness_risks if robustness_risks is not None else [self._task.robustness_risk])
+                  for gamma_max in (gammas_max if gammas_max is not None else [self._task.gamma_max])]
+
+        if max_workers == 1 or len(points) == 1:
+            rows = self._sweep_points(points, warmstart, n_scenarios, seed)
+        else:
+            chunks = [list(chunk) for chunk in np.array_split(np.arange(len(points)), min(max_workers, len(points)))]
+            with ProcessPoolExecutor(max_workers = max_workers) as executor:
+                futures = [executor.submit(_sweep_chunk, self._task, type(self._implementor), self._implementor.backend,
+                                           [points[index] for index in chunk], warmstart, n_scenarios, seed)
+                           for chunk in chunks]
+                rows = [row for future in futures for row in future.result()]
+
+        return pd.DataFrame(rows)
+
+    @instrumentation.traced
+    def calibrate(self, robustness_risk: float = None, gamma_max: int = None) -> pd.DataFrame:
+        """
+        Parameters of the budget set of each master block. For a block, mean and
+        std are computed on the nominal times of the compatible patients (std is
+        divided by their number); gamma is the last number of patients, from 2 to
+        gamma_max, for which the probability that the block exceeds its duration
+        plus the overtime is over the risk, minus one.
+        The table is computed for all blocks and gammas at once, the statistics
+        once for each set of equipes, and cached for tasks with the same blocks,
+        patients and robustness parameters.
+
+        Parameters
+        ----------
+        robustness_risk: float, optional
+            Risk used instead of the one of the task.
+        gamma_max: int, optional
+            Maximum gamma used instead of the one of the task.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each master block, with mean, std, gamma and time_increment
+            (gamma and time_increment are NaN if no gamma is over the risk).
+        """
+        blocks = self._task.master_schedule.blocks
+        patients = self._task.patients
+
+        table = _budget_set_calibration(durations = tuple(block.duration for block in blocks),
+                                        equipe_sets = tuple(frozenset(block.equipes) for block in blocks),
+                                        patient_equipes = tuple(patient.equipe for patient in patients),
+                                        nominal_values = tuple(float(patient.uncertainty_profile.nominal_value) 
+                                                               for patient in patients),
+                                        gamma_max = self._task.gamma_max if gamma_max is None else gamma_max,
+                                        overtime = self._task.robustness_overtime,
+                                        risk = self._task.robustness_risk if robustness_risk is None else robustness_risk)
+
+        return pd.DataFrame(table)
+
+    def apply_calibration(self, table: pd.DataFrame = None):
+        """ 
+        Store the calibrated parameters in the budget set of the master blocks, as
+        run does before creating the instance.
+
+        Parameters
+        ----------
+        table: pd.DataFrame, optional
+            The parameters of each block, see calibrate; by default calibrated with
+            the robustness risk and gamma_max of the task.
+        """
+        if table is None:
+            table = self.calibrate()
+
+        for block, row in zip(self._task.master_schedule.blocks, table.itertuples()):
+
+            block.robustness_budget_set.update({'mean':row.mean,
+                                                'std':row.std})
+
+            # Blocks without any gamma over the risk keep their previous values
+            if not np.isnan(row.gamma):
+                block.robustness_budget_set.update({'gamma':int(row.gamma),
+                                                    'time_increment':row.time_increment})
+
+    def _sweep_points(self, points: list, warmstart: bool, n_scenarios: int, seed: int) -> list[dict]:
+        """ Solve the points in order on the same instance. """
+        blocks = self._task.master_schedule.blocks
+        budget_sets = [dict(block.robustness_budget_set) for block in blocks]
+
+        rows = []
+        try:
+            for number, (risk, gamma_max) in enumerate(points):
+                # Every point starts from the budget sets of the task, not from the previous point
+                for block, budget_set in zip(blocks, budget_sets):
+                    block.robustness_budget_set = dict(budget_set)
+                self.apply_calibration(self.calibrate(robustness_risk = risk, gamma_max = gamma_max))
+
+                start = time.perf_counter()
+                if number == 0:
+                    self.create_instance()
+                    self._implementor.build()
+                    instance = self._implementor.solve()
+                else:
+                    self._implementor.update_parameters(self._budget_set_data())
+                    instance = self._implementor.solve(warmstart = warmstart)
+                solve_time = time.perf_counter() - start
+
+                # Objective and schedule are read in the same way from both backends
+                schedule = Schedule(task = self._task, solved_instance = instance)
+                evaluator = ScheduleEvaluator(schedule, n_scenarios = n_scenarios, 
+                                              overtime_tolerance = self._task.robustness_overtime, seed = seed)
+                evaluation = evaluator.run()
+
+                rows.append({'robustness_risk': risk,
+                             'gamma_max': gamma_max,
+                             'objective': float(instance.obj()),
+                             'scheduled_patients': sum(block.get_num_of_patients() for block in schedule.blocks),
+                             'mean_gamma': float(np.mean(list(self._budget_set_data()['gamma'].values()))),
+                             'solve_time': solve_time,
+                             'overtime_risk': float(evaluation['overtime_probability'].max()),
+                             'mean_overtime_risk': evaluator.summary['mean_block_overtime_probability'],
+                             'expected_overtime': evaluator.summary['expected_overtime']})
+        finally:
+            for block, budget_set in zip(blocks, budget_sets):
+                block.robustness_budget_set = budget_set
+
+        return rows
+
+    def _budget_set_data(self) -> dict:
+        """ 
+        The gamma and time_increment parameters of the instance, from the master
+        blocks. Blocks without a budget set (no number of patients up to 
+        gamma_max is over the risk) get 0 for both: only their nominal capacity
+        is constrained.
+        """
+        master_schedule = self._task.get_master_schedule()
+        master_blocks = master_schedule.get_blocks()
+        n_master_blocks = master_schedule.get_num_of_blocks()
+        n_schedule_blocks = master_schedule.get_num_of_blocks() * self._task.num_of_weeks 
+
+        data = {}
+
+        update_dictionary = {}
+        
+        for b in range(n_schedule_blocks):
+            
+            master_block_index = b % n_master_blocks
+            
+            update_dictionary.update \
+                    ({(b + 1): master_blocks[master_block_index].robustness_budget_set.get('gamma', 0)})
+                
+        data.update({'gamma': update_dictionary})
+        
+        
+        update_dictionary = {}
+        
+        for b in range(n_schedule_blocks):
+            
+            master_block_index = b % n_master_blocks
+
+            update_dictionary.update \
+                    ({(b + 1): master_blocks[master_block_index].robustness_budget_set.get('time_increment', 0)})
+                
+        data.update({'time_increment': update_dictionary})
+
+        return data
+
+    @instrumentation.traced
     def create_instance(self):
                 
         master_schedule = self._task.get_master_schedule()
@@ -629,29 +965,8 @@ class BudgetSet(Optimizer):
                 
         instance.update({'g': update_dictionary})
         
-        
-        update_dictionary = {}
-        
-        for b in range(n_schedule_blocks):
-            
-            master_block_index = b % n_master_blocks
-            
-            update_dictionary.update \
-                    ({(b + 1): master_blocks[master_block_index].robustness_budget_set.get('gamma')})
-                
-        instance.update({'gamma': update_dictionary})
-        
-        
-        update_dictionary = {}
-        
-        for b in range(n_schedule_blocks):
-            
-            master_block_index = b % n_master_blocks
-
-            update_dictionary.update \
-                    ({(b + 1): master_blocks[master_block_index].robustness_budget_set.get('gamma')})
-                
-        instance.update({'time_increment': update_dictionary})
+        # Parameters gamma and time_increment (budget set)
+        instance.update(self._budget_set_data())
         
         
         
@@ -708,7 +1023,7 @@ class BudgetSet(Optimizer):
 
         update_dictionary = {}
 
-        for i in range(n_pats):
+        for i, patient in enumerate(patients):
             update_dictionary.update({i + 1: patient.max_waiting_days})
 
         instance.update({'l': update_dictionary})
@@ -722,7 +1037,7 @@ class BudgetSet(Optimizer):
             update_dictionary = {}
             
             for k in range(self.task.num_adversary_realizations):
-                for i in range(n_pats):
+                for i, patient in enumerate(patients):
                     update_dictionary.update(
                         {(i+1, k+1): 
                             patient.adversary_realization[k]}
@@ -772,3 +1087,59 @@ class BudgetSet(Optimizer):
         pass
 
 
+
+def _sweep_chunk(task: Task, implementor_class: type, backend: str, points: list, warmstart: bool,
+                 n_scenarios: int, seed: int) -> list[dict]:
+    """ Sweep of a chunk of points in a worker process, with its own implementor model. """
+    optimizer = BudgetSet(task = task, implementor = implementor_class(task = task, backend = backend))
+    return optimizer._sweep_points(points, warmstart, n_scenarios, seed)
+
+
+@lru_cache(maxsize=32)
+def _budget_set_calibration(durations: tuple, 
+                            equipe_sets: tuple, 
+                            patient_equipes: tuple, 
+                            nominal_values: tuple,
+                            gamma_max: int,
+                            overtime: float,
+                            risk: float) -> dict:
+    """ Calibration of BudgetSet, as columns of a table with a row for each block. """
+    nominal_values = np.array(nominal_values, dtype=float)
+    durations = np.array(durations, dtype=float)
+
+    # Statistics of the compatible patients, once for each set of equipes
+    statistics = {}
+    for equipes in set(equipe_sets):
+        times = nominal_values[np.array([equipe in equipes for equipe in patient_equipes], dtype=bool)]
+        if len(times):
+            statistics[equipes] = (np.mean(times), np.std(times)/len(times))
+        else:
+            statistics[equipes] = (np.nan, np.nan)
+
+    means = np.array([statistics[equipes][0] for equipes in equipe_sets])
+    stds = np.array([statistics[equipes][1] for equipes in equipe_sets])
+
+    # Probability of exceeding duration plus overtime, shape (blocks, gammas)
+    gammas = np.arange(2, gamma_max + 1)
+    with np.errstate(invalid='ignore'):
+        probability = 1 - ss.norm.cdf((durations + overtime)[:, None], 
+                                      loc = gammas[None, :] * means[:, None], 
+                                      scale = stds[:, None])
+    exceeding = probability > risk
+
+    # The last gamma over the risk, minus one
+    chosen = np.full(len(durations), np.nan)
+    if len(gammas):
+        last = len(gammas) - 1 - np.argmax(exceeding[:, ::-1], axis=1)
+        chosen = np.where(exceeding.any(axis=1), gammas[last] - 1, np.nan)
+
+    table = {'mean': means,
+             'std': stds,
+             'gamma': chosen,
+             'time_increment': durations * overtime / chosen}
+
+    # The cached table is shared between the callers
+    for column in table.values():
+        column.setflags(write=False)
+
+    return table
@@ -4,7 +4,7 @@
 import numpy as np
 
 # Modules
-from .uncertainty_profile import UncertaintyProfile
+from .uncertainty_profile import UncertaintyProfile, UncertaintyProfileBatch
 
 class Patient():
 
@@ -29,9 +29,13 @@ class Patient():
         
         self._adversary_realization = []
 
+        # Batch of profiles to get the uncertainty profile from, when it is accessed
+        self._profile_batch = None
+        self._profile_batch_index = None
+
     def __str__(self):
-        if self._uncertainty_profile:
-            return f'Patient id: {self._id} \n equipe: {self._equipe} \n urgency: {self._urgency} \n nominal duration: {int(self._uncertainty_profile.get_nominal_value())} \n days waiting: {self.days_waiting}'
+        if self.uncertainty_profile:
+            return f'Patient id: {self._id} \n equipe: {self._equipe} \n urgency: {self._urgency} \n nominal duration: {int(self.uncertainty_profile.get_nominal_value())} \n days waiting: {self.days_waiting}'
         return f'Patient id: {self._id} \n equipe: {self._equipe} \n urgency: {self._urgency} \n days waiting: {self.days_waiting}'
 
     # Getters and setters
@@ -77,12 +81,22 @@ class Patient():
     target = property(get_target, set_target)
 
     def get_uncertainty_profile(self):
+        if self._uncertainty_profile is None and self._profile_batch is not None:
+            self._uncertainty_profile = self._profile_batch[self._profile_batch_index]
         return self._uncertainty_profile
     
     def set_uncertainty_profile(self, new:UncertaintyProfile):
         self._uncertainty_profile = new
+        self._profile_batch = None
+        self._profile_batch_index = None
     
     uncertainty_profile = property(get_uncertainty_profile, set_uncertainty_profile)
+
+    def set_profile_from_batch(self, batch: UncertaintyProfileBatch, index: int):
+        """ The uncertainty profile will be the one at index in batch, created when accessed. """
+        self._uncertainty_profile = None
+        self._profile_batch = batch
+        self._profile_batch_index = index
     
     
     def get_days_waiting(self):
@@ -5,10 +5,13 @@ import random
 # Packages
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 from sklearn.preprocessing import OneHotEncoder
 
 # Modules
 from .patient import Patient
+from .historical_store import HistoricalDataStore
+from ._cache_utils import dataframe_fingerprint, save_encoded, load_encoded
 
 
 class PatientsProvider(ABC):
@@ -130,7 +133,9 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
 
     def __init__(self, 
                  historical_data: pd.DataFrame, 
-                 name = ""):
+                 name = "",
+                 cache_dir: str = None,
+                 sparse_features: bool = False):
         """
         Constructor.
 
@@ -140,10 +145,23 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
             To keep a text name of the provider created.
         _historical_data: pd.DataFrame
             Is the pandas' dataframe which provide patients' data.
+        cache_dir: str, optional
+            Directory where the one-hot encoded features are cached, keyed by a
+            content hash of historical_data. On a cache hit the encoder is not 
+            fitted again and the encoded matrix is memory-mapped from disk. With
+            sparse_features it stays memory-mapped; the dense dataframe holds a
+            copy of it, as pandas consolidates the encoded columns with the other
+            numerical ones.
+        sparse_features: bool, optional
+            If True the one-hot encoded features are kept as a CSR matrix and never
+            densified: the patients' features are 1 x n CSR rows. Useful with high
+            cardinality categorical columns.
         """
         super().__init__(name)
         
         self._historical_data = historical_data
+        self._cache_dir = cache_dir
+        self._sparse_features = sparse_features
         
         # TODO qui bisogna controllare che ci siano le colonne equipe, urgency e days_waiting
         
@@ -154,18 +172,24 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
 
         # Select columns containing categorical data  (object type)
         categorical_columns = self._historical_data.select_dtypes(include=['object']).columns
-        # Instantiate one - hot- tencoder
-        encoder = OneHotEncoder( drop='first')
-        # Run the one - hot - encoder
-        one_hot_encoded = encoder.fit_transform(self._historical_data[categorical_columns])
-        # New dataframe
-        one_hot_encoded_df = pd.DataFrame(one_hot_encoded.toarray(), columns=encoder.get_feature_names_out(categorical_columns))
-        # Concatenatign with original dataframe
-        df = pd.concat([self._historical_data, one_hot_encoded_df], axis=1)
+        # Run the one - hot - encoder (or get the result from the cache)
+        one_hot_encoded, feature_names, self._encoder_categories = self._encode_categorical(categorical_columns)
+
         # Exclude equipe columns
-        categorical_columns = categorical_columns.difference(['equipe'])
-        # Removing encoded columns
-        self._historical_data = df.drop(columns=categorical_columns)
+        encoded_columns = categorical_columns.difference(['equipe'])
+
+        if self._sparse_features:
+            # Keep the encoded features apart, rows follow the positions of the dataframe
+            self._encoded_features = one_hot_encoded
+            self._encoded_feature_names = feature_names
+            self._historical_data = self._historical_data.drop(columns=encoded_columns)
+        else:
+            # New dataframe (a copy of the encoded matrix, memory-mapped or not)
+            one_hot_encoded_df = pd.DataFrame(one_hot_encoded, columns=feature_names)
+            # Concatenatign with original dataframe
+            df = pd.concat([self._historical_data, one_hot_encoded_df], axis=1)
+            # Removing encoded columns
+            self._historical_data = df.drop(columns=encoded_columns)
 
 
     # Getters and setters
@@ -177,6 +201,11 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
     
     historical_data = property(get_historical_data, set_historical_data)
 
+    def get_encoder_categories(self):
+        return self._encoder_categories
+    
+    encoder_categories = property(get_encoder_categories)
+
 
     # Abstract methods implementation
 
@@ -229,6 +258,12 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
         id = patient_index + self._patient_id_start_number
         features = np.array(self._historical_data.loc[patient_index, ~self._historical_data.columns.isin(['equipe', 'target', 'urgency'])])
         
+        if self._sparse_features:
+            # Numerical features followed by the encoded ones, as in the dense layout
+            position = self._historical_data.index.get_loc(patient_index)
+            features = sp.hstack([sp.csr_matrix(features.astype(float)), 
+                                  self._encoded_features[position]], format='csr')
+        
         if include_target:
             target = self._historical_data.loc[patient_index, 'target']
         else:
@@ -315,6 +350,45 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
 
     # Specific methods
 
+    def _encode_categorical(self, categorical_columns):
+        """
+        One-hot encode the categorical columns of the historical data. When a cache
+        directory is set, the result is looked up by the content hash of the data
+        and stored after the first run.
+
+        Returns
+        -------
+        tuple
+            The encoded matrix (dense, or CSR in sparse mode), the names of the encoded features and the 
+            categories of the fitted encoder (one list for each categorical column).
+        """
+        if self._cache_dir:
+            salt = "onehot-drop-first-sparse" if self._sparse_features else "onehot-drop-first"
+            key = dataframe_fingerprint(self._historical_data, salt = salt)
+            cached = load_encoded(self._cache_dir, key)
+            if cached is not None:
+                matrix, metadata = cached
+                return matrix, metadata['feature_names'], metadata['categories']
+
+        # Instantiate one - hot- tencoder
+        encoder = OneHotEncoder( drop='first')
+        # Run the one - hot - encoder
+        one_hot_encoded = encoder.fit_transform(self._historical_data[categorical_columns])
+
+        if self._sparse_features:
+            matrix = one_hot_encoded.tocsr()
+        else:
+            matrix = one_hot_encoded.toarray()
+        feature_names = list(encoder.get_feature_names_out(categorical_columns))
+        categories = [[str(x) for x in column_categories] for column_categories in encoder.categories_]
+
+        if self._cache_dir:
+            save_encoded(self._cache_dir, key, matrix, {'feature_names': feature_names,
+                                                         'categorical_columns': list(categorical_columns),
+                                                         'categories': categories})
+
+        return matrix, feature_names, categories
+
     def reset_sampled_indexes(self, enforce = False):
         """_summary_
         Quando chiamata, se forzata o se tutti i pazienti sono stati estratti, si resetta il contenitore
@@ -333,6 +407,132 @@ class PatientsFromHistoricalDataProvider(PatientsProvider):   # TODO bisogna ges
     
     
 
+class PatientsFromHistoricalStoreProvider(PatientsFromHistoricalDataProvider):
+    """
+    Inherit from PatientsFromHistoricalDataProvider.
+    Same provider, but patients are extracted from a HistoricalDataStore instead of
+    an in-memory dataframe: rows are read lazily from the memory-mapped columns,
+    so the size of the history is bounded by the disk rather than by the memory.
+    The features of the patients have the same layout as in the parent class.
+
+    Attributes
+    ----------
+    _name: str
+        To keep a text name of the provider created.
+    _store: HistoricalDataStore
+        The store which provide patients' data.
+    _sampled: np.ndarray
+        Boolean mask of the rows already used from the store.
+    _patient_id_start_number: int
+        When all rows are used, the function restart sampling including already used rows.
+        This variable allow to generate patients with different ids. 
+    """
+
+    def __init__(self, 
+                 store: HistoricalDataStore, 
+                 name = "",
+                 sparse_features: bool = False):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        store: HistoricalDataStore
+            The store which provide patients' data.
+        name : str, optional
+            To keep a text name of the provider created.
+        sparse_features: bool, optional
+            If True the features of the patients are 1 x n CSR rows.
+        """
+        PatientsProvider.__init__(self, name)
+
+        self._store = store
+        self._sparse_features = sparse_features
+
+        self._sampled = np.zeros(store.num_of_rows, dtype=bool)
+        self._patient_id_start_number = 0
+
+    # Getters and setters
+    def get_store(self):
+        return self._store
+    
+    store = property(get_store)
+
+    def get_historical_data(self):
+        return self._store
+    
+    historical_data = property(get_historical_data)
+
+    def get_encoder_categories(self):
+        return [self._store.categories[column] for column in self._store.categorical_columns]
+    
+    encoder_categories = property(get_encoder_categories)
+
+
+    # Abstract methods implementation
+
+    def provide_patient(self, requested_equipe:str = None, requested_urgency:int = None, include_target: bool = True) -> Patient:
+        """
+        Provide a single patient. Can request an equipe and/or an urgency.
+
+        Parameters
+        ----------
+        requested_equipe: str, optional
+            The equipe which will process the patient provided.
+
+        requested_urgency: int, optional
+            The urgency grade assigned to the patient.
+
+        Returns
+        -------
+        Patient
+            A patient object filled with information in the store.
+        """
+
+        available = ~self._sampled
+
+        if requested_equipe is not None:
+            available &= self._store.column('equipe') == self._store.code_of('equipe', requested_equipe)
+
+        if requested_urgency is not None:
+            available &= self._store.column('urgency') == int(requested_urgency)
+
+        available_indexes = np.flatnonzero(available)
+
+        if len(available_indexes) == 0:
+            print("No patients are available with the required characteristics.")
+            return None
+        
+        position = int(random.choice(available_indexes))
+        self._sampled[position] = True
+
+        features = self._store.features(position)
+        if self._sparse_features:
+            features = sp.csr_matrix(features)
+
+        return Patient(id=position + self._patient_id_start_number, 
+                       equipe=self._store.value('equipe', position), 
+                       urgency=int(self._store.value('urgency', position)), 
+                       days_waiting=self._store.value('days_waiting', position),
+                       features=features, 
+                       target=self._store.value('target', position) if include_target else None, 
+                       uncertainty_profile=None)
+
+    # Specific methods
+
+    def reset_sampled_indexes(self, enforce = False):
+        """
+        When called, if enforced or if all the rows have been used, the mask of the
+        rows already used is reset.
+        """
+        if enforce | bool(self._sampled.all()):
+            print("Warning: from now on patients can be resampled.")
+            self._sampled[:] = False
+            self._patient_id_start_number += self._store.num_of_rows
+
+
+
+
 class TruePatientsProvider(PatientsProvider):
 
     # Abstract methods implementation
@@ -0,0 +1,171 @@
+# Python STL
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+
+# Packages
+import numpy as np
+import scipy.sparse as sp
+
+# Modules
+
+
+class PredictionCache():
+    """
+    Cache of the predictions of the predictive models, so that patients predicted
+    again (e.g. the waiting list on every planning day, or in every experiment
+    configuration) do not run the model. Entries are keyed by the fingerprint of
+    the model and by a hash of the features row of the patient, and hold the raw
+    prediction of the row (the parameters of its uncertainty profile).
+    Recently used entries are kept in memory, up to max_size; if a path is given,
+    all the entries are also stored in a SQLite file, shared between runs.
+
+    Attributes
+    ----------
+    _max_size: int
+        Maximum number of entries kept in memory.
+    _path: str
+        SQLite file of the on-disk tier. If None, only the memory is used.
+    _memory: OrderedDict
+        The in-memory entries, least recently used first.
+    _hits: int
+        Number of rows found in the cache.
+    _misses: int
+        Number of rows computed by the model.
+    """
+
+    def __init__(self, max_size: int = 100_000, path: str = None):
+        self._max_size = max_size
+        self._path = path
+        self._memory = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._connection = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._memory)
+
+    # Pickling: the connection to the disk tier is opened again in each process
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_connection'] = None
+        return state
+
+    # Getters and setters
+    def get_hits(self):
+        return self._hits
+    hits = property(get_hits)
+
+    def get_misses(self):
+        return self._misses
+    misses = property(get_misses)
+
+    # Specific methods
+    def lookup(self, fingerprint: str, features, compute) -> np.ndarray:
+        """
+        The raw predictions of the rows of features. Rows not in the cache are
+        computed at once, with a single call of compute, and stored.
+
+        Parameters
+        ----------
+        fingerprint: str
+            The fingerprint of the model.
+        features: np.ndarray or scipy.sparse matrix
+            A row of features for each patient.
+        compute: callable
+            Function from a matrix of features to the raw predictions, one row
+            for each row of features.
+
+        Returns
+        -------
+        np.ndarray
+            The raw predictions, one row for each row of features.
+        """
+        keys = [(fingerprint, key) for key in row_hashes(features)]
+
+        rows = [self._get_memory(key) for key in keys]
+        missing = [index for index, row in enumerate(rows) if row is None]
+
+        if missing and self._path:
+            for index, row in zip(missing, self._get_disk([keys[index] for index in missing])):
+                if row is not None:
+                    rows[index] = row
+                    self._put_memory(keys[index], row)
+            missing = [index for index in missing if rows[index] is None]
+
+        self._hits += len(keys) - len(missing)
+        self._misses += len(missing)
+
+        if missing:
+            computed = np.atleast_2d(np.asarray(compute(features[missing]), dtype=float))
+            for index, row in zip(missing, computed):
+                rows[index] = row
+                self._put_memory(keys[index], row)
+            if self._path:
+                self._put_disk([keys[index] for index in missing], computed)
+
+        return np.vstack(rows) if rows else np.empty((0, 0))
+
+    def clear(self):
+        """ Empty the in-memory tier. """
+        self._memory.clear()
+
+    def _get_memory(self, key):
+        row = self._memory.get(key)
+        if row is not None:
+            self._memory.move_to_end(key)
+        return row
+
+    def _put_memory(self, key, row: np.ndarray):
+        self._memory[key] = row
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_size:
+            self._memory.popitem(last=False)
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS predictions "
+                                     "(fingerprint TEXT, row TEXT, value BLOB, PRIMARY KEY (fingerprint, row))")
+        return self._connection
+
+    def _get_disk(self, keys: list) -> list:
+        connection = self._connect()
+        found = {}
+        # Grouped by fingerprint, in chunks within the SQLite limit of parameters
+        for fingerprint in set(key[0] for key in keys):
+            rows = [key[1] for key in keys if key[0] == fingerprint]
+            for start in range(0, len(rows), 900):
+                chunk = rows[start:start + 900]
+                query = ("SELECT row, value FROM predictions WHERE fingerprint = ? AND row IN "
+                         f"({','.join('?' * len(chunk))})")
+                for row, value in connection.execute(query, [fingerprint] + chunk):
+                    found[(fingerprint, row)] = np.frombuffer(value, dtype=float)
+        return [found.get(key) for key in keys]
+
+    def _put_disk(self, keys: list, rows: np.ndarray):
+        connection = self._connect()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                   [(fingerprint, row, np.ascontiguousarray(value, dtype=float).tobytes())
+                                    for (fingerprint, row), value in zip(keys, rows)])
+
+
+def row_hashes(features) -> list[str]:
+    """ A hash for each row of a dense or sparse features matrix. """
+    if sp.issparse(features):
+        features = sp.csr_matrix(features)
+        features.sort_indices()
+        return [hashlib.blake2b(features.indices[start:stop].tobytes() + b'|' +
+                                features.data[start:stop].astype(float).tobytes() + b'|' +
+                                str(features.shape[1]).encode(), digest_size=16).hexdigest()
+                for start, stop in zip(features.indptr[:-1], features.indptr[1:])]
+
+    features = np.ascontiguousarray(np.atleast_2d(features), dtype=float)
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest() for row in features]
@@ -1,20 +1,68 @@
 # Python STL
 from abc import ABC, abstractmethod
+import copy
+import hashlib
+import os
+import pickle
 
 # Packages
 import numpy as np
+import scipy.sparse as sp
+import scipy.stats as ss
 import ngboost as ngb
 import ngboost.distns as ng_dist
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.tree import DecisionTreeRegressor
 
 # Modules
+from .compiled_ensemble import CompiledEnsemble
 from .patient import Patient
+from .prediction_cache import PredictionCache
+from . import instrumentation
 from .uncertainty_profile import (
     UncertaintyProfile, 
-    LogNormalDistribution,
-    NormalDistribution
+    UncertaintyProfileBatch,
+    LogNormalDistributionBatch,
+    NormalDistributionBatch,
+    TabulatedQuantileDistributionBatch
 )
 
 
+def _stack_features(features_list: list):
+    """ Stack the patients' features, keeping them sparse if they are sparse rows. """
+    if any(sp.issparse(features) for features in features_list):
+        return sp.vstack(features_list, format='csr')
+    return np.vstack(features_list)
+
+
+def _hash_data(hasher, features, target):
+    """ Add a matrix of features (dense or sparse) and its target to a hash. """
+    if sp.issparse(features):
+        features = sp.csr_matrix(features)
+        arrays = [features.data, features.indices, features.indptr]
+    else:
+        arrays = [np.asarray(features, dtype=float)]
+    arrays.append(np.asarray(target, dtype=float))
+
+    hasher.update(repr(features.shape).encode())
+    for array in arrays:
+        hasher.update(np.ascontiguousarray(array).tobytes())
+
+
+def _ngboost_arguments(hyperparameters: dict) -> dict:
+    """ 
+    Arguments of NGBRegressor from the hyperparameters of a model. As a shortcut,
+    max_depth sets the depth of the default decision tree base learner.
+    """
+    arguments = {'verbose': False, **hyperparameters}
+
+    if 'max_depth' in arguments:
+        arguments['Base'] = DecisionTreeRegressor(criterion = "friedman_mse", 
+                                                  max_depth = arguments.pop('max_depth'))
+
+    return arguments
+
+
 class PredictiveModel(ABC):
     """
     Abstract class for predictive model. Models trained with these classes are 
@@ -33,25 +81,67 @@ class PredictiveModel(ABC):
         A list containing the features for each patient to be used for training.
     _training_target: np.ndarray
         A list containing the target for each patient to be used for training.
+    _hyperparameters: dict
+        Arguments given to the wrapped model at construction.
+    _trained: bool
+        Whether the wrapped model has been fitted. Construction and training are
+        separate steps, a trained model is not fitted again.
+    _prediction_cache: PredictionCache
+        If set, predictions are looked up by features row before running the model.
+    _compiled: CompiledEnsemble
+        If set, the flattened trees used in place of the wrapped model for inference.
+    _reference_nll: float
+        Negative log likelihood of patients not used for fitting, the reference of
+        the drift: the one of the validation patients of the last training, or
+        else of a held-out part of the training patients (see drift).
 
     Methods
     -------
-    predict_form_patients(self, inference_patients: list[Patient]) -> list[Patient]:
-        Abstract method, given a list of patients, this run the trained model to update that list
+    train(self, force: bool = False) -> PredictiveModel:
+        Fit the model on the training data, once.
+    update(self, new_patients: list[Patient], additional_iterations: int = None, window: int = None) -> dict:
+        Incremental training on newly completed surgeries, returns the drift report.
+    drift(self, patients: list[Patient]) -> dict:
+        Compare the fit of the model on new patients with the one on the training data.
+    fingerprint(self) -> str:
+        Hash of the model class, hyperparameters, training features and target.
+    compile(self) -> PredictiveModel:
+        Flatten the fitted trees for fast vectorized inference.
+    save(self, path: str) / load(self, path: str):
+        Persist the fitted model and restore it on a model with the same fingerprint.
+    predict(self, inference_patients: list[Patient]) -> list[Patient]:
+        Given a list of patients, this run the trained model to update that list
         with patients having uncertainty profile filled according to the model.
+    predict_batch(self, inference_patients: list[Patient]) -> UncertaintyProfileBatch:
+        As predict, but returns the vectorized batch of the predicted profiles.
+    _predict_profiles(self, features) -> UncertaintyProfileBatch:
+        Run the trained model on a matrix of features.
+    _predict_raw(self, features) -> np.ndarray:
+        Abstract method, the profile parameters predicted for each row of features.
+    _make_batch(self, raw: np.ndarray) -> UncertaintyProfileBatch:
+        Abstract method, the batch of profiles from the predicted parameters.
     _extract_training_data(self) -> tuple[np.ndarray]
-        Method to extract features and target from each patient.
+        Method to extract features and target from each patient. Sparse features
+        are stacked into a CSR matrix.
     _extract_features(self, inference_patients: list[Patient]) -> np.ndarray
         Method to extract features from a list of patients in order to get probabilistic predicitons
         on their surgery duration. Used in inference phase.
     """
     
-    def __init__(self, patients: list[Patient], description = ""):
+    def __init__(self, patients: list[Patient], description = "", hyperparameters: dict = None):
         self._patients = patients
         self._description = description
+        self._hyperparameters = dict(hyperparameters) if hyperparameters else {}
 
         self._training_features, self._training_target = self._extract_training_data()
         self._trained = False
+        self._fingerprint = None
+        self._reference_nll = None
+        self._prediction_cache = None
+        self._compiled = None
+
+        # The wrapped model, instantiated by the concrete classes
+        self._model = None
 
     # Getters and setters 
                
@@ -63,12 +153,235 @@ class PredictiveModel(ABC):
     
     description = property(get_description, set_description)
 
+    def get_hyperparameters(self):
+        return self._hyperparameters
+    
+    hyperparameters = property(get_hyperparameters)
+
+    def get_trained(self):
+        return self._trained
+    
+    trained = property(get_trained)
+
+    def get_prediction_cache(self):
+        return self._prediction_cache
+    
+    def set_prediction_cache(self, new: PredictionCache):
+        self._prediction_cache = new
+    
+    prediction_cache = property(get_prediction_cache, set_prediction_cache)
+
     # Abstract methods
 
     @abstractmethod
+    def _predict_raw(self, features) -> np.ndarray:
+        """
+        Run the model on the features of a list of patients.
+
+        Parameters
+        ----------
+        features: np.ndarray
+            A row of features for each patient.
+
+        Returns
+        -------
+        np.ndarray
+            The parameters of the predicted profile, one row for each row of features.
+        """
+        pass
+
+    @abstractmethod
+    def _make_batch(self, raw: np.ndarray) -> UncertaintyProfileBatch:
+        """ The batch of uncertainty profiles with the parameters returned by _predict_raw. """
+        pass
+
+
+    # General methods 
+    @instrumentation.traced
+    def train(self, force: bool = False, validation_patients: list[Patient] = None, early_stopping_rounds: int = None):
+        """
+        Fit the model on the training data. A model already trained is not fitted
+        again, unless forced.
+
+        Parameters
+        ----------
+        force: bool, optional
+            Fit the model even if it is already trained.
+        validation_patients: list[Patient], optional
+            Patients (with target) used to monitor the loss during training.
+        early_stopping_rounds: int, optional
+            Stop boosting when the validation loss does not improve for this number
+            of iterations. Requires validation_patients.
+        """
+        if self._trained and not force:
+            return self
+
+        if validation_patients:
+            features, target = self._extract_evaluation_data(validation_patients)
+            self._model.fit(self._training_features, self._training_target.ravel(), 
+                            X_val = features, Y_val = target, 
+                            early_stopping_rounds = early_stopping_rounds)
+        else:
+            self._model.fit(self._training_features, self._training_target.ravel() )
+
+        self._trained = True
+        self._compiled = None
+        self._reference_nll = self.negative_log_likelihood(validation_patients) if validation_patients else None
+
+        return self
+
+    def compile(self):
+        """
+        Flatten the trees of the fitted model into a CompiledEnsemble, used from now
+        on by predict instead of the wrapped model. The predictions are the same,
+        up to floating point rounding. Only NGBoost models with decision tree base
+        learners can be compiled.
+        """
+        if not self._trained:
+            raise ValueError("Only a trained model can be compiled.")
+        if not hasattr(self._model, 'base_models'):
+            raise ValueError(f"{type(self).__name__} cannot be compiled.")
+
+        self._compiled = CompiledEnsemble.from_ngboost(self._model)
+
+        return self
+
+    @instrumentation.traced
+    def update(self, 
+               new_patients: list[Patient], 
+               additional_iterations: int = None, 
+               window: int = None,
+               nll_tolerance: float = 0.25,
+               ks_alpha: float = 0.01) -> dict:
+        """
+        Train the model on newly completed surgeries without a full retrain. The 
+        drift of the new patients with respect to the training data is measured 
+        first, with the model before the update.
+
+        Parameters
+        ----------
+        new_patients: list[Patient]
+            The patients (with target) completed since the last training.
+        additional_iterations: int, optional
+            Warm start: number of boosting iterations fitted on the new patients and
+            appended to the current model. Used when window is None, default 50.
+        window: int, optional
+            Sliding window: retrain from scratch on the most recent window patients
+            of the history followed by the new ones.
+        nll_tolerance: float, optional
+            Increase of the negative log likelihood over the training one, beyond 
+            which a full retrain is recommended.
+        ks_alpha: float, optional
+            Significance of the two-sample Kolmogorov-Smirnov test on the targets, 
+            below which a full retrain is recommended.
+
+        Returns
+        -------
+        dict
+            The drift report (see drift) and the update mode.
+        """
+        report = self.drift(new_patients, nll_tolerance = nll_tolerance, ks_alpha = ks_alpha)
+
+        if window is not None:
+            self._set_training_patients((list(self._patients) + list(new_patients))[-window:])
+            self._trained = False
+            self.train()
+            report['mode'] = 'window'
+        else:
+            previous = self.fingerprint()
+            self._warm_start(new_patients, additional_iterations or 50)
+
+            self._set_training_patients(list(self._patients) + list(new_patients))
+            self._chain_fingerprint(previous, new_patients, additional_iterations or 50)
+            report['mode'] = 'warm_start'
+
+        return report
+
+    def drift(self, patients: list[Patient], nll_tolerance: float = 0.25, ks_alpha: float = 0.01) -> dict:
+        """
+        Measure how much new patients differ from the training data.
+
+        The reference negative log likelihood is measured out of sample, as the
+        one of the new patients: on the validation patients of the last training
+        if any, otherwise on a random held_out_fraction of the training patients,
+        with a copy of the model fitted on the others (computed once and kept).
+
+        Returns
+        -------
+        dict
+            nll_reference and nll_new: negative log likelihood on the reference 
+            (held-out) and on the new patients; nll_shift: their difference; ks_statistic and 
+            ks_pvalue: two-sample Kolmogorov-Smirnov test between the training and 
+            the new targets; retrain_recommended: whether any of the two exceeds 
+            its threshold.
+        """
+        if self._reference_nll is None:
+            self._reference_nll = self._held_out_nll()
+
+        nll_new = self.negative_log_likelihood(patients)
+        ks = ss.ks_2samp(np.ravel(self._training_target), [patient.target for patient in patients])
+
+        report = {'nll_reference': self._reference_nll,
+                  'nll_new': nll_new,
+                  'nll_shift': nll_new - self._reference_nll,
+                  'ks_statistic': float(ks.statistic),
+                  'ks_pvalue': float(ks.pvalue)}
+        report['retrain_recommended'] = bool(report['nll_shift'] > nll_tolerance or report['ks_pvalue'] < ks_alpha)
+
+        return report
+
+    def negative_log_likelihood(self, patients: list[Patient]) -> float:
+        """ Mean negative log likelihood of the targets of the patients under the model. """
+        features, target = self._extract_evaluation_data(patients)
+        return float(-np.mean(self._model.pred_dist(features).logpdf(target)))
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the model class, its hyperparameters, the training features and 
+        target. Two models with the same fingerprint are fitted in the same way.
+        """
+        if self._fingerprint is None:
+            hasher = hashlib.sha256()
+            hasher.update(type(self).__name__.encode())
+            hasher.update(repr(sorted(self._hyperparameters.items())).encode())
+
+            _hash_data(hasher, self._training_features, self._training_target)
+            self._fingerprint = hasher.hexdigest()
+
+        return self._fingerprint
+
+    def save(self, path: str):
+        """ Save the fitted model, together with its fingerprint. """
+        if not self._trained:
+            raise ValueError("Only a trained model can be saved.")
+
+        # Written under a temporary name and renamed, not to leave partial files
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump({'class': type(self).__name__,
+                         'fingerprint': self.fingerprint(),
+                         'model': self._model}, file)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path: str):
+        """ 
+        Restore a fitted model saved with save(). The fingerprint must match the one
+        of this object: same class, hyperparameters and training data.
+        """
+        with open(path, 'rb') as file:
+            payload = pickle.load(file)
+
+        if payload['fingerprint'] != self.fingerprint():
+            raise ValueError("The saved model was trained with different data or hyperparameters.")
+
+        self._model = payload['model']
+        self._trained = True
+        self._compiled = None
+
+        return self
+
     def predict(self, inference_patients: list[Patient]):
         """
-        Provide a single patient. Can request an equipe and/or an urgency.
+        Fill the uncertainty profile of the patients according to the model.
 
         Parameters
         ----------
@@ -82,10 +395,51 @@ class PredictiveModel(ABC):
             The updated list of patients, this is the same list as inference_patients
             but whith the member uncertainty_profile filled according to the model.
         """
-        pass
+        self.predict_batch(inference_patients)
+        return list(inference_patients)
 
+    @instrumentation.traced
+    def predict_batch(self, inference_patients: list[Patient]) -> UncertaintyProfileBatch:
+        """
+        Run the model once on all the patients and attach the predictions to them.
+        Each patient's uncertainty profile object is created only when accessed.
+
+        Parameters
+        ----------
+        inference_patients: list[Patient]
+            A list of patients for which the surgery prediction will be predicted.
+
+        Returns
+        -------
+        UncertaintyProfileBatch
+            Parameter arrays, nominal values and percent points of all the predictions.
+        """
+
+        instrumentation.count('predictive_model.predicted_patients', len(inference_patients))
+
+        # Get the list of the features (an element for each patient in the list)
+        features = self._extract_features(inference_patients=inference_patients)
+
+        # Run the model, or read the cached predictions
+        batch = self._cached_profiles(features, self._prediction_cache)
+
+        # Attach the predictions to the patients
+        for index, patient in enumerate(inference_patients):
+            patient.set_profile_from_batch(batch, index)
+
+        return batch
+
+
+    def _predict_profiles(self, features) -> UncertaintyProfileBatch:
+        """ Run the model on the features of a list of patients. """
+        return self._make_batch(self._predict_raw(features))
+
+    def _cached_profiles(self, features, cache: PredictionCache) -> UncertaintyProfileBatch:
+        """ As _predict_profiles, only the rows not in the cache (if any) run the model. """
+        if cache is None:
+            return self._predict_profiles(features)
+        return self._make_batch(cache.lookup(self.fingerprint(), features, self._predict_raw))
 
-    # General methods 
     def _extract_training_data(self):
 
         features_list = []
@@ -95,9 +449,74 @@ class PredictiveModel(ABC):
             features_list.append(patient.features)
             target_list.append(patient.target)
 
-        return (np.vstack(features_list), np.vstack(target_list))
+        return (_stack_features(features_list), np.vstack(target_list))
     
 
+    def _set_training_patients(self, patients: list[Patient]):
+        """ Replace the training patients, the model is not refitted. """
+        self._patients = patients
+        self._training_features, self._training_target = self._extract_training_data()
+        self._fingerprint = None
+
+    def _held_out_nll(self, held_out_fraction: float = 0.2, seed: int = 0) -> float:
+        """ 
+        Negative log likelihood of a random part of the training patients, under a
+        copy of the model fitted from scratch on the others.
+        """
+        order = np.random.default_rng(seed).permutation(len(self._patients))
+        size = max(1, int(round(held_out_fraction * len(self._patients))))
+
+        # The copy does not share the prediction cache
+        cache, self._prediction_cache = self._prediction_cache, None
+        try:
+            model = copy.deepcopy(self)
+        finally:
+            self._prediction_cache = cache
+
+        model._set_training_patients([self._patients[index] for index in order[size:]])
+        model.train(force = True)
+
+        return model.negative_log_likelihood([self._patients[index] for index in order[:size]])
+
+    def _chain_fingerprint(self, previous: str, patients: list[Patient], iterations: int):
+        """ 
+        After a warm start the fitted model depends on the previous fit and on the
+        update: the fingerprint hashes both, so that the predictions cached with
+        the previous fingerprint are not used any more.
+        """
+        hasher = hashlib.sha256(previous.encode())
+        hasher.update(f"update-{iterations}".encode())
+        _hash_data(hasher, *self._extract_evaluation_data(patients))
+        self._fingerprint = hasher.hexdigest()
+
+    def _warm_start(self, patients: list[Patient], iterations: int):
+        """
+        Append boosting iterations fitted on the patients to the trained model.
+        NGBoost's partial_fit fits the initial parameters again on the new targets,
+        which would shift all the previous predictions: here they are kept.
+        """
+        if not hasattr(self._model, 'partial_fit'):
+            raise NotImplementedError(f"{type(self).__name__} does not support warm start, use a window.")
+
+        features, target = self._extract_evaluation_data(patients)
+        n_estimators = self._model.n_estimators
+
+        self._model.n_estimators = iterations
+        self._model.fit_init_params_to_marginal = lambda Y: None
+        try:
+            self._model.partial_fit(features, target)
+        finally:
+            self._model.n_estimators = n_estimators
+            del self._model.fit_init_params_to_marginal
+
+        # The compiled trees are outdated
+        self._compiled = None
+
+    def _extract_evaluation_data(self, patients: list[Patient]):
+        """ Features and target (as a flat array) of patients not used for training. """
+        return (self._extract_features(inference_patients = patients), 
+                np.array([patient.target for patient in patients], dtype=float))
+
     def _extract_features(self, inference_patients: list[Patient]) -> np.ndarray:
         """Questa funzione potrebbe essere completamente inutile.
 
@@ -113,7 +532,7 @@ class PredictiveModel(ABC):
         for patient in inference_patients:
             features_list.append(patient.features)
 
-        return np.vstack(features_list)
+        return _stack_features(features_list)
 
 
 
@@ -136,56 +555,25 @@ class NGBLogNormal(PredictiveModel):
         Provide a single patient, can specify equpe and urgency
     """
 
-    def __init__(self, patients: list[Patient], description = ""):
-        super().__init__(patients = patients, description = description)
+    def __init__(self, patients: list[Patient], description = "", hyperparameters: dict = None, train: bool = True):
+        super().__init__(patients = patients, description = description, hyperparameters = hyperparameters)
         
-        # Instantiate the model and train
-        self._model = ngb \
-            .NGBRegressor(Dist = ng_dist.LogNormal, verbose = False) \
-            .fit(self._training_features, self._training_target.ravel() ) 
+        # Instantiate the model
+        self._model = ngb.NGBRegressor(Dist = ng_dist.LogNormal, **_ngboost_arguments(self._hyperparameters))
 
+        # Train, unless the fitted model will be loaded or trained later
+        if train:
+            self.train()
 
-    def train(self):
-        self._model.fit(self._training_features, self._training_target.ravel() )
+    def _predict_raw(self, features):
 
-    def predict(self, inference_patients: list[Patient]):
-        """
-        Provide a single patient. Can request an equipe and/or an urgency.
+        # Run the model, or its compiled trees
+        predictions = (self._compiled or self._model).pred_dist(features).params
 
-        Parameters
-        ----------
-        inference_patients: list[Patient]
-            A list of patients for which the surgery prediction will be predicted.
-            "Features" of each Patient will be used.
-
-        Returns
-        -------
-        patients
-            The updated list of patients, this is the same list as inference_patients
-            but whith the member uncertainty_profile filled according to the model.
-        """
-
-        # Get the list of the features (an element for each patient in the list)
-        features = self._extract_features(inference_patients=inference_patients)
-
-        # Run the model
-        predictions = self._model.pred_dist(features).params
-
-        # Initalize a new empty list of patients
-        patients = []
-
-        # Cicle on initial list inference_patients
-        for ind, patient in enumerate(inference_patients):
-            # Get patient parameter
-            param_s = predictions.get('s')[ind]
-            param_scale = predictions.get('scale')[ind]
-
-            # Update patient by creating uncertanty profile object
-            patient.uncertainty_profile = LogNormalDistribution(param_s=param_s, param_scale=param_scale)
-            
-            patients.append(patient)
+        return np.column_stack([predictions.get('s'), predictions.get('scale')])
 
-        return patients
+    def _make_batch(self, raw):
+        return LogNormalDistributionBatch(param_s=raw[:, 0], param_scale=raw[:, 1])
         
 
 
@@ -215,67 +603,200 @@ class NGBNormal(PredictiveModel):
         Provide a single patient, can specify equpe and urgency
     """
 
-    def __init__(self, patients: list[Patient], description = ""):
-        super().__init__(patients = patients, description = description)
+    def __init__(self, patients: list[Patient], description = "", hyperparameters: dict = None, train: bool = True):
+        super().__init__(patients = patients, description = description, hyperparameters = hyperparameters)
         
-        # Instantiate the model and train
-        self._model = ngb \
-            .NGBRegressor(Dist = ng_dist.Normal, verbose = False) \
-            .fit(self._training_features, self._training_target.ravel() ) 
+        # Instantiate the model
+        self._model = ngb.NGBRegressor(Dist = ng_dist.Normal, **_ngboost_arguments(self._hyperparameters))
 
+        # Train, unless the fitted model will be loaded or trained later
+        if train:
+            self.train()
 
-    def train(self):
-        self._model.fit(self._training_features, self._training_target.ravel() )
+    def _predict_raw(self, features):
 
-    def predict(self, inference_patients: list[Patient]):
-        """
-        Provide a single patient. Can request an equipe and/or an urgency.
+        # Run the model, or its compiled trees
+        predictions = (self._compiled or self._model).pred_dist(features).params
 
-        Parameters
-        ----------
-        inference_patients: list[Patient]
-            A list of patients for which the surgery prediction will be predicted.
-            "Features" of each Patient will be used.
+        return np.column_stack([predictions.get('loc'), predictions.get('scale')])
+
+    def _make_batch(self, raw):
+        return NormalDistributionBatch(param_loc=raw[:, 0], param_scale=raw[:, 1])
+        
 
-        Returns
-        -------
-        patients
-            The updated list of patients, this is the same list as inference_patients
-            but whith the member uncertainty_profile filled according to the model.
-        """
 
-        # Get the list of the features (an element for each patient in the list)
-        features = self._extract_features(inference_patients=inference_patients)
+
+
+
+class XGBQuantile(PredictiveModel):
+    """
+    Inherit from abstract class Predictive model.
+    Gradient boosted quantile regressor: histogram-based gradient boosting 
+    (multithreaded) with the pinball loss, fitted at several probability levels.
+    The prediction of each patient is the tabulated quantile function, returned as
+    TabulatedQuantileDistribution profiles. Compared to NGBoost it is much faster 
+    to train and does not assume a parametric family.
+
+    Hyperparameters are given to sklearn's HistGradientBoostingRegressor, but 
+    "quantiles", the tuple of probability levels.
+    
+    Attributes
+    ----------
+    _patients : list[Patient]
+        The list of patients that will be used as to train the model.
+    _description : str
+        To keep a text description of the model created.
+    """
+
+    DEFAULT_QUANTILES = tuple(np.round(np.arange(0.05, 0.951, 0.05), 2))
+
+    def __init__(self, patients: list[Patient], description = "", hyperparameters: dict = None, train: bool = True):
+        super().__init__(patients = patients, description = description, hyperparameters = hyperparameters)
+
+        # Instantiate the model
+        arguments = dict(self._hyperparameters)
+        quantiles = arguments.pop('quantiles', self.DEFAULT_QUANTILES)
+        self._model = _MultiQuantileRegressor(quantiles = quantiles, **arguments)
+
+        # Train, unless the fitted model will be loaded or trained later
+        if train:
+            self.train()
+
+    def _predict_raw(self, features):
 
         # Run the model
-        predictions = self._model.pred_dist(features).params
+        return self._model.predict(features)
 
-        # Initalize a new empty list of patients
-        patients = []
+    def _make_batch(self, raw):
+        return TabulatedQuantileDistributionBatch(levels=self._model.quantiles, values=raw)
 
-        # Cicle on initial list inference_patients
-        for ind, patient in enumerate(inference_patients):
-            # Get patient parameter
-            param_loc = predictions.get('loc')[ind]
-            param_scale = predictions.get('scale')[ind]
+    def _warm_start(self, patients: list[Patient], iterations: int):
+        """ For each level, a regressor of iterations trees is fitted on the residuals of the patients. """
+        features, target = self._extract_evaluation_data(patients)
+        self._model.partial_fit(features, target, iterations)
+        self._compiled = None
 
-            # Update patient by creating uncertanty profile object
-            patient.uncertainty_profile = NormalDistribution(param_loc=param_loc, param_scale=param_scale)
-            
-            patients.append(patient)
+    def negative_log_likelihood(self, patients: list[Patient]) -> float:
+        """
+        Approximated: the density is piecewise constant between the predicted 
+        quantiles, with exponential tails holding the probability outside them.
+        """
+        features, target = self._extract_evaluation_data(patients)
+        levels = np.asarray(self._model.quantiles)
+        values = np.sort(self._model.predict(features), axis=1)
+        rows = np.arange(len(target))
 
-        return patients
-        
+        # Density inside the tabulated range
+        widths = np.maximum(np.diff(values, axis=1), 1e-9)
+        bins = np.clip(np.sum(values <= target[:, None], axis=1) - 1, 0, len(levels) - 2)
+        density = np.diff(levels)[bins] / widths[rows, bins]
 
+        # Exponential tails, starting from the average density of the tabulated range
+        spread = np.maximum(values[:, -1] - values[:, 0], 1e-9) / (levels[-1] - levels[0])
+        lower_scale = levels[0] * spread
+        upper_scale = (1 - levels[-1]) * spread
+        lower_tail = levels[0] / lower_scale * np.exp(np.minimum(target - values[:, 0], 0) / lower_scale)
+        upper_tail = (1 - levels[-1]) / upper_scale * np.exp(np.minimum(values[:, -1] - target, 0) / upper_scale)
 
+        density = np.where(target < values[:, 0], lower_tail, density)
+        density = np.where(target > values[:, -1], upper_tail, density)
 
+        return float(-np.mean(np.log(np.maximum(density, 1e-300))))
 
 
-class XGBQuantile(PredictiveModel):
 
-    def __init__(self):
-        pass
+class _MultiQuantileRegressor():
+    """
+    One HistGradientBoostingRegressor with pinball loss for each probability level,
+    behind a single fit / predict interface. predict returns a column per level.
 
-    @abstractmethod
-    def train(self, patients):
-        pass
+    A warm start (partial_fit) leaves the fitted regressors untouched: for each
+    level a new regressor is fitted on the residuals of the current prediction,
+    and its output is added at predict time.
+    """
+
+    def __init__(self, quantiles: tuple, **hyperparameters):
+        self.quantiles = tuple(float(q) for q in quantiles)
+        self.hyperparameters = hyperparameters
+        self.models = []
+        self.corrections = []
+
+    def fit(self, X, Y, X_val = None, Y_val = None, early_stopping_rounds = None):
+        """
+        Fit a regressor for each level. With early_stopping_rounds, boosting stops
+        when the pinball loss on X_val and Y_val does not improve for that number
+        of iterations, and each regressor keeps its best number of iterations; 
+        without a validation set HistGradientBoostingRegressor holds out its own.
+        """
+        X = _dense(X)
+        arguments = dict(self.hyperparameters)
+        self.corrections = []
+
+        if early_stopping_rounds and X_val is not None:
+            X_val = _dense(X_val)
+            self.models = [self._fit_early_stopping(X, Y, X_val, np.ravel(Y_val), quantile, early_stopping_rounds)
+                           for quantile in self.quantiles]
+            return self
+
+        if early_stopping_rounds:
+            arguments.update({'early_stopping': True, 'n_iter_no_change': early_stopping_rounds})
+
+        self.models = [HistGradientBoostingRegressor(loss = 'quantile', quantile = quantile, **arguments).fit(X, Y)
+                       for quantile in self.quantiles]
+        return self
+
+    def partial_fit(self, X, Y, iterations: int):
+        """ 
+        Fit, for each level, iterations trees on the residuals of the current 
+        prediction on X and Y. The regressors already fitted are not modified.
+        """
+        X = _dense(X)
+        residuals = np.ravel(Y)[:, None] - self.predict(X)
+        arguments = {**self.hyperparameters, 'max_iter': iterations, 'early_stopping': False}
+        self.corrections.append([HistGradientBoostingRegressor(loss = 'quantile', quantile = quantile, **arguments)
+                                 .fit(X, residuals[:, level])
+                                 for level, quantile in enumerate(self.quantiles)])
+        return self
+
+    def predict(self, X):
+        X = _dense(X)
+        prediction = np.column_stack([model.predict(X) for model in self.models])
+        for correction in self.corrections:
+            prediction += np.column_stack([model.predict(X) for model in correction])
+        return prediction
+
+    def _fit_early_stopping(self, X, Y, X_val, Y_val, quantile: float, rounds: int) -> HistGradientBoostingRegressor:
+        """ A regressor grown one iteration at a time, scored on the validation set, refitted to its best iteration. """
+        arguments = {**self.hyperparameters, 'early_stopping': False}
+        max_iter = arguments.pop('max_iter', 100)
+        # The bins are found again by every fit: on large data they come from a subsample, which must be the same
+        arguments.setdefault('random_state', 0)
+        model = HistGradientBoostingRegressor(loss = 'quantile', quantile = quantile, warm_start = True, 
+                                              max_iter = 1, **arguments)
+
+        best_loss, best_iteration = np.inf, 0
+        for iteration in range(1, max_iter + 1):
+            model.set_params(max_iter = iteration)
+            model.fit(X, Y)
+            loss = _pinball_loss(Y_val, model.predict(X_val), quantile)
+            if loss < best_loss:
+                best_loss, best_iteration = loss, iteration
+            elif iteration - best_iteration >= rounds:
+                break
+
+        if model.n_iter_ == best_iteration:
+            model.set_params(warm_start = False)
+            return model
+        return HistGradientBoostingRegressor(loss = 'quantile', quantile = quantile, max_iter = best_iteration,
+                                             **arguments).fit(X, Y)
+
+
+def _pinball_loss(target: np.ndarray, prediction: np.ndarray, quantile: float) -> float:
+    """ Mean pinball loss of the predicted quantile. """
+    difference = target - prediction
+    return float(np.mean(np.maximum(quantile * difference, (quantile - 1) * difference)))
+
+
+def _dense(X):
+    """ HistGradientBoostingRegressor does not accept sparse matrices. """
+    return X.toarray() if sp.issparse(X) else np.asarray(X, dtype=float)
@@ -6,10 +6,12 @@ from abc import ABC, abstractmethod
 # Modules
 from .task import Task
 from .block import ScheduleBlock
+from . import instrumentation
 
 
 class Schedule(ABC):
 
+    @instrumentation.traced
     def __init__(self, task:Task, solved_instance):
         
         self._blocks = []
@@ -49,17 +51,10 @@ class Schedule(ABC):
                         block.add_patient(patient)
                         
                 self._blocks.append(block)
-                    
-                    
-                    
-                
-        
-    
-        
-        
-        
-
 
 
 
-    # Getters and setters
\ No newline at end of file
+    # Getters and setters
+    def get_blocks(self):
+        return self._blocks
+    blocks = property(get_blocks)
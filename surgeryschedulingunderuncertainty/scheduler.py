@@ -1,71 +1,457 @@
 # Python STL
-
+import copy
+import hashlib
+import os
+import pickle
+import random
+import time
 
 # Packages
-from pandas import pd
+import numpy as np
+import pandas as pd
 
 # Modules
-from .adversary import ( Equiprobable)
 from .master import Master
-from .patient import Patient
 from .patients_provider import PatientsFromHistoricalDataProvider
-from .predictive_model import PredictiveModel
+from .predictive_model import PredictiveModel, NGBLogNormal
 from .task import Task
+from .schedule import Schedule
+from .implementor import StandardImplementor, ChanceConstraintsImplementor, BSImplementor
+from .optimizer import ImplementorAdversary, VanillaImplementor, BudgetSet
+from ._cache_utils import dataframe_fingerprint
+from . import instrumentation
 
 
 class Scheduler():
+    """
+    End-to-end pipeline: the patients to be scheduled and the training patients
+    are provided from the historical data, a predictive model is trained and
+    predicts the uncertainty profiles of the patients, the task and the instance
+    of the optimizer are created and the optimizer produces the schedule.
+
+    The output of each stage (patients, model, predictions, instance, schedule)
+    is cached by a hash of its inputs: the key of the previous stage and the
+    parameters the stage depends on. Running again after changing only, e.g.,
+    robustness_risk recomputes the instance and the schedule, the patients, the
+    model and the predictions are taken from the cache. The outputs are kept in
+    memory and, if cache_dir is given, pickled on disk and shared between runs.
+    Every random stage seeds the random generators with seed (the optimization
+    with optimization_seed, if given), so its output only depends on its key.
+
+    The optimizer types are 'implementor_adversary' (ImplementorAdversary with
+    StandardImplementor, which builds its instances in the loop, so its instance
+    stage only holds the task), 'vanilla' (VanillaImplementor with
+    StandardImplementor), 'chance_constraints' (VanillaImplementor with
+    ChanceConstraintsImplementor) and 'budget_set' (BudgetSet with BSImplementor).
+
+    Attributes
+    ----------
+    _historical_data: pd.DataFrame
+        Data of the operated patients, see PatientsFromHistoricalDataProvider.
+    _master_schedule: Master
+        The master schedule, never modified: each task gets a copy.
+    _predictive_model_type: type
+        A concrete PredictiveModel class, e.g. NGBLogNormal.
+    _optimizer_type: str
+        One of OPTIMIZER_TYPES.
+    _cache_dir: str
+        Directory of the pickled stage outputs. If None, only the memory is used.
+    _solver_options: dict
+        Options of HiGHS given to the implementors, e.g. threads or time_limit.
+    _optimization_seed: int
+        Seed of the optimization stage (the samples of the adversary). If None, seed.
+    _cache: dict
+        The stage outputs by stage and key.
+    _stages: list[dict]
+        Stage, key, source (computed, memory or disk) and seconds of each stage of the last run.
+    _report: pd.DataFrame
+        The iteration report of the implementor adversary, when the schedule was computed by it.
+    """
+
+    OPTIMIZER_TYPES = ('implementor_adversary', 'vanilla', 'chance_constraints', 'budget_set')
+
+    STAGES = ('patients', 'model', 'predictions', 'instance', 'schedule')
+
     def __init__(self,
-                 name: str,
-                 num_of_weeks: int,
+                 historical_data: pd.DataFrame,
+                 master_schedule: Master,
                  num_of_patients: int,
+                 num_patients_training: int,
                  robustness_risk: float,
                  robustness_overtime: int,
-                 num_patients_training: int,
+                 urgency_to_max_waiting_days: dict,
+                 num_of_weeks: int = 1,
+                 name: str = "",
+                 predictive_model_type: type = NGBLogNormal,
+                 hyperparameters: dict = None,
+                 optimizer_type: str = 'implementor_adversary',
+                 backend: str = 'pyomo',
+                 max_loops: int = 3,
+                 gamma_max: int = 10,
+                 seed: int = 0,
+                 cache_dir: str = None,
+                 solver_options: dict = None,
+                 optimization_seed: int = None):
+
+        if optimizer_type not in self.OPTIMIZER_TYPES:
+            raise ValueError(f"Unknown optimizer type {optimizer_type}, use one of {', '.join(self.OPTIMIZER_TYPES)}.")
+        if not (isinstance(predictive_model_type, type) and issubclass(predictive_model_type, PredictiveModel)):
+            raise TypeError("The predictive model type must be a PredictiveModel class.")
+
+        self._historical_data = historical_data
+        self._master_schedule = master_schedule
+        self._num_of_patients = num_of_patients
+        self._num_patients_training = num_patients_training
+        self._robustness_risk = robustness_risk
+        self._robustness_overtime = robustness_overtime
+        self._urgency_to_max_waiting_days = urgency_to_max_waiting_days
+        self._num_of_weeks = num_of_weeks
+        self._name = name
+        self._predictive_model_type = predictive_model_type
+        self._hyperparameters = hyperparameters
+        self._optimizer_type = optimizer_type
+        self._backend = backend
+        self._max_loops = max_loops
+        self._gamma_max = gamma_max
+        self._seed = seed
+        self._cache_dir = cache_dir
+        self._solver_options = dict(solver_options or {})
+        self._optimization_seed = optimization_seed
+
+        self._cache = {stage: {} for stage in self.STAGES}
+        self._data_fingerprint = dataframe_fingerprint(historical_data)
+        self._stages = []
+        self._report = None
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # Getters and setters
+    def get_name(self):
+        return self._name
+    def set_name(self, new: str):
+        self._name = new
+    name = property(get_name, set_name)
+
+    def get_num_of_patients(self):
+        return self._num_of_patients
+    def set_num_of_patients(self, new: int):
+        self._num_of_patients = new
+    num_of_patients = property(get_num_of_patients, set_num_of_patients)
+
+    def get_num_patients_training(self):
+        return self._num_patients_training
+    def set_num_patients_training(self, new: int):
+        self._num_patients_training = new
+    num_patients_training = property(get_num_patients_training, set_num_patients_training)
+
+    def get_robustness_risk(self):
+        return self._robustness_risk
+    def set_robustness_risk(self, new: float):
+        self._robustness_risk = new
+    robustness_risk = property(get_robustness_risk, set_robustness_risk)
+
+    def get_robustness_overtime(self):
+        return self._robustness_overtime
+    def set_robustness_overtime(self, new: int):
+        self._robustness_overtime = new
+    robustness_overtime = property(get_robustness_overtime, set_robustness_overtime)
+
+    def get_num_of_weeks(self):
+        return self._num_of_weeks
+    def set_num_of_weeks(self, new: int):
+        self._num_of_weeks = new
+    num_of_weeks = property(get_num_of_weeks, set_num_of_weeks)
+
+    def get_gamma_max(self):
+        return self._gamma_max
+    def set_gamma_max(self, new: int):
+        self._gamma_max = new
+    gamma_max = property(get_gamma_max, set_gamma_max)
+
+    def get_hyperparameters(self):
+        return self._hyperparameters
+    def set_hyperparameters(self, new: dict):
+        self._hyperparameters = new
+    hyperparameters = property(get_hyperparameters, set_hyperparameters)
+
+    def get_optimizer_type(self):
+        return self._optimizer_type
+    def set_optimizer_type(self, new: str):
+        if new not in self.OPTIMIZER_TYPES:
+            raise ValueError(f"Unknown optimizer type {new}, use one of {', '.join(self.OPTIMIZER_TYPES)}.")
+        self._optimizer_type = new
+    optimizer_type = property(get_optimizer_type, set_optimizer_type)
+
+    def get_backend(self):
+        return self._backend
+    def set_backend(self, new: str):
+        self._backend = new
+    backend = property(get_backend, set_backend)
+
+    def get_max_loops(self):
+        return self._max_loops
+    def set_max_loops(self, new: int):
+        self._max_loops = new
+    max_loops = property(get_max_loops, set_max_loops)
+
+    def get_seed(self):
+        return self._seed
+    def set_seed(self, new: int):
+        self._seed = new
+    seed = property(get_seed, set_seed)
+
+    def get_solver_options(self):
+        return self._solver_options
+    def set_solver_options(self, new: dict):
+        self._solver_options = dict(new or {})
+    solver_options = property(get_solver_options, set_solver_options)
+
+    def get_optimization_seed(self):
+        return self._optimization_seed
+    def set_optimization_seed(self, new: int):
+        self._optimization_seed = new
+    optimization_seed = property(get_optimization_seed, set_optimization_seed)
+
+    def get_stages(self):
+        return pd.DataFrame(self._stages, columns=['stage', 'key', 'source', 'seconds'])
+    stages = property(get_stages)
+
+    def get_report(self):
+        return self._report
+    report = property(get_report)
+
+    # Specific methods
+    def run(self) -> Schedule:
+        """
+        Run the pipeline, taking from the cache the stages whose inputs did not change.
+
+        Returns
+        -------
+        Schedule
+            The schedule of the patients.
+        """
+        self._stages = []
+        keys, predicted = self._prepare()
+
+        instance_key = self._key('instance', keys['predictions'], self._master_fingerprint(), self._name,
+                                 self._num_of_weeks, self._robustness_risk, self._robustness_overtime,
+                                 sorted(self._urgency_to_max_waiting_days.items()), self._gamma_max,
+                                 self._optimizer_type)
+        task, instance_data = self._stage('instance', instance_key, lambda: self._create_instance(predicted))
+
+        schedule_key = self._key('schedule', instance_key, self._backend, self._max_loops, self._seed,
+                                 self._optimization_seed, sorted(self._solver_options.items()))
+        schedule, self._report = self._stage('schedule', schedule_key, lambda: self._optimize(task, instance_data))
+
+        return schedule
+
+    def prepare(self) -> list:
+        """
+        Run, or take from the cache, the stages before the optimization:
+        patients, model and predictions.
+
+        Returns
+        -------
+        list[Patient]
+            The patients to be scheduled, with their predicted uncertainty profiles.
+        """
+        self._stages = []
+        return self._prepare()[1]
+
+    def prepared_copy(self) -> 'Scheduler':
+        """
+        A copy of the scheduler to be sent to worker processes: its memory cache
+        holds only the prepared stages (patients, model and predictions) of the
+        current parameters, which are not computed again, so it carries neither
+        the historical data nor the disk cache. The parameters of the stages
+        after the predictions can be changed freely on the copy.
+        """
+        self._stages = []
+        keys, _ = self._prepare()
+
+        shared = copy.copy(self)
+        shared._historical_data = None
+        shared._cache_dir = None
+        shared._cache = {stage: {keys[stage]: self._cache[stage][keys[stage]]} if stage in keys else {}
+                         for stage in self.STAGES}
+        shared._stages = []
+        shared._report = None
+        return shared
+
+    def fingerprint(self, exclude: tuple = ()) -> str:
+        """
+        Key of the parameters of the scheduler, without computing any stage.
+
+        Parameters
+        ----------
+        exclude: tuple[str]
+            Names of the parameters left out of the key, e.g. those varied by
+            an experiment: robustness_risk, robustness_overtime, num_of_weeks,
+            gamma_max, optimizer_type, backend, max_loops, optimization_seed or
+            solver_options. The historical data, the number of patients, the
+            seed and the predictive model are always in the key.
+
+        Returns
+        -------
+        str
+            The hash of the keys of the prepared stages and of the other parameters.
+        """
+        parameters = {'name': self._name, 'master': self._master_fingerprint(), 'num_of_weeks': self._num_of_weeks,
+                      'robustness_risk': self._robustness_risk, 'robustness_overtime': self._robustness_overtime,
+                      'urgency_to_max_waiting_days': sorted(self._urgency_to_max_waiting_days.items()),
+                      'gamma_max': self._gamma_max, 'optimizer_type': self._optimizer_type,
+                      'backend': self._backend, 'max_loops': self._max_loops,
+                      'optimization_seed': self._optimization_seed,
+                      'solver_options': sorted(self._solver_options.items())}
+        parameters = sorted((name, value) for name, value in parameters.items() if name not in exclude)
+        return self._key('fingerprint', self._prepared_keys()['predictions'], parameters)
+
+    def clear_cache(self, stages: list[str] = None):
+        """ Remove the outputs of the given stages (all by default) from the memory and from the disk. """
+        for stage in stages or self.STAGES:
+            self._cache[stage].clear()
+            if self._cache_dir:
+                for file_name in os.listdir(self._cache_dir):
+                    if file_name.startswith(f"{stage}_") and file_name.endswith(".pkl"):
+                        os.remove(os.path.join(self._cache_dir, file_name))
+
+    # Stages
+    def _prepare(self) -> tuple[dict, list]:
+        """ The keys of the prepared stages and the predicted patients. """
+        keys = self._prepared_keys()
+        patients, training = self._stage('patients', keys['patients'], self._provide_patients)
+        model = self._stage('model', keys['model'], lambda: self._train(training))
+        predicted = self._stage('predictions', keys['predictions'], lambda: self._predict(model, patients))
+
+        return keys, predicted
+
+    def _prepared_keys(self) -> dict:
+        """ The keys of the patients, model and predictions stages. """
+        keys = {}
+        keys['patients'] = self._key('patients', self._data_fingerprint, self._num_of_patients,
+                                     self._num_patients_training, self._seed)
+        keys['model'] = self._key('model', keys['patients'], self._predictive_model_type.__qualname__,
+                                  sorted((self._hyperparameters or {}).items()))
+        keys['predictions'] = self._key('predictions', keys['model'])
+        return keys
+
+    def _provide_patients(self) -> tuple[list, list]:
+        self._set_seed()
+        provider = PatientsFromHistoricalDataProvider(historical_data=self._historical_data)
+        return provider.provide_sets(quantity=self._num_of_patients, quantity_training=self._num_patients_training)
+
+    def _train(self, training: list) -> PredictiveModel:
+        self._set_seed()
+        return self._predictive_model_type(patients=training, hyperparameters=self._hyperparameters)
+
+    def _predict(self, model: PredictiveModel, patients: list) -> list:
+        # The cached patients of the previous stage are not modified
+        return model.predict(copy.deepcopy(patients))
+
+    def _create_instance(self, patients: list) -> tuple:
+        """ The task, on copies of the patients and of the master, and the instance data of the optimizer. """
+        task = Task(name=self._name,
+                    num_of_weeks=self._num_of_weeks,
+                    num_of_patients=len(patients),
+                    robustness_risk=self._robustness_risk,
+                    robustness_overtime=self._robustness_overtime,
+                    urgency_to_max_waiting_days=self._urgency_to_max_waiting_days,
+                    gamma_max=self._gamma_max)
+        # The setter of the patients sets their urgency grades and maximum waiting days
+        task.patients = copy.deepcopy(patients)
+        task.master_schedule = copy.deepcopy(self._master_schedule)
+
+        if self._optimizer_type == 'implementor_adversary':
+            return task, None
+
+        implementor = self._implementor(task)
+        if self._optimizer_type == 'budget_set':
+            optimizer = BudgetSet(task=task, implementor=implementor)
+            optimizer.apply_calibration()
+        else:
+            optimizer = VanillaImplementor(task=task, implementor=implementor)
+        optimizer.create_instance()
+
+        return task, implementor.instance_data
+
+    def _optimize(self, task: Task, instance_data: dict) -> tuple:
+        """ The schedule and, for the implementor adversary, its iteration report. """
+        self._set_seed(self._optimization_seed)
+        # The cached task is not modified: the adversary adds realizations to the patients
+        task = copy.deepcopy(task)
+        implementor = self._implementor(task)
+
+        if self._optimizer_type == 'implementor_adversary':
+            optimizer = ImplementorAdversary(task=task, implementor=implementor, adversary=None)
+            schedule = optimizer.run(max_loops=self._max_loops)
+            return schedule, optimizer.report
+
+        implementor.instance_data = instance_data
+        return Schedule(task=task, solved_instance=implementor.run()), None
+
+    # Helpers
+    def _implementor(self, task: Task):
+        if self._optimizer_type == 'chance_constraints':
+            implementor = ChanceConstraintsImplementor(task=task, backend=self._backend)
+        elif self._optimizer_type == 'budget_set':
+            implementor = BSImplementor(task=task, backend=self._backend)
+        else:
+            implementor = StandardImplementor(backend=self._backend)
+        implementor.solver_options = self._solver_options
+        return implementor
+
+    def _stage(self, stage: str, key: str, compute):
+        """ The output of a stage from the memory, from the disk or computed, and stored. """
+        start = time.perf_counter()
+        source = 'memory'
+        with instrumentation.span(f'Scheduler.{stage}', 'scheduler') as span:
+            if key in self._cache[stage]:
+                output = self._cache[stage][key]
+            else:
+                output = self._load(stage, key)
+                source = 'disk'
+                if output is None:
+                    output = compute()
+                    source = 'computed'
+                    self._save(stage, key, output)
+                self._cache[stage][key] = output
+            span.set(source=source)
+
+        self._stages.append({'stage': stage, 'key': key, 'source': source, 'seconds': time.perf_counter() - start})
+        return output
+
+    def _load(self, stage: str, key: str):
+        path = self._path(stage, key)
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+    def _save(self, stage: str, key: str, output):
+        path = self._path(stage, key)
+        if not path:
+            return
+        # Written under a temporary name and then renamed, never half written
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(output, file)
+        os.replace(path + '.tmp', path)
+
+    def _path(self, stage: str, key: str):
+        if not self._cache_dir:
+            return None
+        return os.path.join(self._cache_dir, f"{stage}_{key}.pkl")
+
+    def _master_fingerprint(self) -> str:
+        blocks = [(block.duration, list(block.equipes), block.room, block.weekday, block.order_in_day)
+                  for block in self._master_schedule.blocks]
+        return hashlib.sha256(repr(blocks).encode()).hexdigest()
+
+    def _set_seed(self, seed: int = None):
+        seed = self._seed if seed is None else seed
+        random.seed(seed)
+        np.random.seed(seed)
 
-                 master_scheduling: Master,# no questo va sistemato
-
-                 patient_provider_type:str,
-                 predictive_model_type:str,
-                 uncertainty_model_type:str,
-
-                 
-                 historical_data: pd.DataFrame = None,
-                 patients_to_be_scheduled: pd.DataFrame = None,
-                 patient_generation_profile: dict = None
-                 ):
-        
-        _name = name
-        _num_of_weeks = num_of_weeks
-        _num_of_patients = num_of_patients
-        _robustness_risk = robustness_risk
-        _robustness_overtime = robustness_overtime
-        _num_patients_training = num_patients_training
-
-        _master_scheduling = master_scheduling # questo va sistemato
-
-        _patient_provider_type = patient_provider_type
-        _predictive_model_type = predictive_model_type
-        _uncertainty_model_type = uncertainty_model_type
-
-        _historical_data = historical_data
-        _patients_to_be_scheduled = patients_to_be_scheduled
-        _patient_generation_profile = patient_generation_profile
-
-
-    def run(self):
-
-        patient_provider = PatientsFromHistoricalDataProvider(
-                        historical_data= historical_data_df
-                        )
-        
-        (_patients, _training_set) = patient_provider.provide_patient_set(quantity = self._num_of_patients, 
-                                                                          quantity_training = self._num_patients_training, 
-                                                                          equipe_profile = None, 
-                                                                          urgency_profile = None)
-        
-        master = Master()
-
-        _master_scheduling = master.master_creator() #????
-
-        
-        predictive_model = Pre
+    @staticmethod
+    def _key(*parts) -> str:
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
@@ -0,0 +1,302 @@
+# Python STL
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+
+# Packages
+import numpy as np
+
+# Modules
+from .patient import Patient
+from .predictive_model import PredictiveModel, NGBLogNormal
+from .uncertainty_profile import UncertaintyProfileBatch, CompositeProfileBatch
+
+
+# The attributes of a sub-model set by its train, sent back by the training processes
+TRAINED_STATE = ('_model', '_trained', '_compiled', '_reference_nll')
+
+class EquipeShardedModel(PredictiveModel):
+    """
+    Inherit from abstract class Predictive model.
+    Wrapper training one sub-model (shard) for each equipe, instead of a single
+    model on the whole history. Equipes with fewer than min_shard_size training
+    patients do not get a shard: their patients, and patients of equipes never
+    seen in training, are predicted by a fallback model trained on the patients
+    of the equipes without a shard. If every equipe has its own shard, the
+    fallback is trained on all the patients, and only when a patient of an
+    unseen equipe is first predicted. Shards are independent, so they are fitted
+    in parallel processes and a single shard can be retrained when only the data
+    of its equipe changed.
+
+    Attributes
+    ----------
+    _model_class: type
+        The PredictiveModel class of the shards and of the fallback model.
+    _min_shard_size: int
+        Minimum number of training patients of an equipe to get its own shard.
+    _max_workers: int
+        Number of processes used for training, 1 to train in the current process.
+    _model: dict
+        The sub-models by equipe, the fallback model has key None (not trained
+        until it is needed).
+    _stale_shards: bool
+        Whether the training patients changed since the shards were built.
+    """
+
+    def __init__(self,
+                 patients: list[Patient],
+                 description = "",
+                 hyperparameters: dict = None,
+                 train: bool = True,
+                 model_class: type = NGBLogNormal,
+                 min_shard_size: int = 200,
+                 max_workers: int = None):
+        """
+        Parameters
+        ----------
+        hyperparameters: dict, optional
+            Arguments of the sub-models, the same for all the shards.
+        """
+        super().__init__(patients = patients, description = description, hyperparameters = hyperparameters)
+
+        self._model_class = model_class
+        self._min_shard_size = min_shard_size
+        self._max_workers = max_workers
+
+        self._model = self._make_shards(patients)
+        self._stale_shards = False
+
+        # Train, unless the fitted model will be loaded or trained later
+        if train:
+            self.train()
+
+    # Getters and setters
+    def get_model_class(self):
+        return self._model_class
+    model_class = property(get_model_class)
+
+    def get_shards(self):
+        """ The sub-models of the equipes with their own shard. """
+        return {equipe: model for equipe, model in self._model.items() if equipe is not None}
+    shards = property(get_shards)
+
+    def get_fallback(self):
+        return self._model[None]
+    fallback = property(get_fallback)
+
+    # Abstract methods implementation
+    # Without the equipes of the patients only the fallback model can be used
+    def _predict_raw(self, features):
+        if not self.fallback.trained:
+            self._fit([None])
+        return self.fallback._predict_raw(features)
+
+    def _make_batch(self, raw):
+        return self.fallback._make_batch(raw)
+
+    # General methods
+    def train(self, force: bool = False, validation_patients: list[Patient] = None, early_stopping_rounds: int = None):
+        """
+        Fit the shards and the fallback model, in parallel. Validation patients, if
+        any, are routed to the shard of their equipe.
+        """
+        if self._trained and not force:
+            return self
+
+        # The training patients changed after the shards were built
+        if self._stale_shards:
+            self._model = self._make_shards(self._patients)
+            self._stale_shards = False
+
+        keys = [key for key in self._model if key is not None]
+        if self._fallback_needed() or self._model[None].trained:
+            keys.append(None)
+
+        self._fit(keys, validation_patients, early_stopping_rounds, force = force)
+        self._trained = True
+        self._reference_nll = self.negative_log_likelihood(validation_patients) if validation_patients else None
+
+        return self
+
+    def retrain_shard(self, equipe: str, patients: list[Patient] = None):
+        """
+        Refit only the model used by an equipe, e.g. after its history changed.
+
+        Parameters
+        ----------
+        equipe: str
+            The equipe whose model is refitted.
+        patients: list[Patient], optional
+            The new training patients of the equipe, replacing the old ones. If
+            None, the shard is refitted on the current data.
+        """
+        if patients is not None:
+            # The other shards are kept as they are
+            super()._set_training_patients([patient for patient in self._patients if patient.equipe != equipe] 
+                                           + list(patients))
+
+        group = [patient for patient in self._patients if patient.equipe == equipe]
+
+        if len(group) >= self._min_shard_size:
+            self._model[equipe] = self._model_class(patients = group,
+                                                    hyperparameters = self._hyperparameters,
+                                                    train = False)
+            keys = [equipe]
+        else:
+            # Too few patients: the equipe is served by the fallback model
+            self._model.pop(equipe, None)
+            keys = []
+
+        # The fallback is built again if it serves the equipe or if its training patients changed
+        fallback = self._make_fallback(self._patients, self._model)
+        if equipe not in self._model or fallback.fingerprint() != self._model[None].fingerprint():
+            self._model[None] = fallback
+            if equipe not in self._model or self._fallback_needed():
+                keys.append(None)
+
+        self._fit(keys)
+
+        return self._model[equipe if equipe in self._model else None]
+
+    def compile(self):
+        """ Compile every sub-model. """
+        for model in self._model.values():
+            if model.trained:
+                model.compile()
+        return self
+
+    def predict_batch(self, inference_patients: list[Patient]) -> UncertaintyProfileBatch:
+        """
+        Run each sub-model once on the patients of its equipe. The returned batch
+        is made of the batches of the sub-models, in the order of the patients.
+        The prediction cache, if set, is shared by the sub-models.
+        """
+        keys, groups = self._route(inference_patients)
+
+        batches = []
+        owners = np.empty(len(inference_patients), dtype=int)
+        positions = np.empty(len(inference_patients), dtype=int)
+
+        for number, (key, indexes) in enumerate(zip(keys, groups)):
+            model = self._model[key]
+            features = model._extract_features([inference_patients[i] for i in indexes])
+            batches.append(model._cached_profiles(features, self._prediction_cache))
+            owners[indexes] = number
+            positions[indexes] = np.arange(len(indexes))
+
+        batch = CompositeProfileBatch(batches = batches, owners = owners, positions = positions)
+
+        # Attach the predictions to the patients
+        for index, patient in enumerate(inference_patients):
+            patient.set_profile_from_batch(batch, index)
+
+        return batch
+
+    def negative_log_likelihood(self, patients: list[Patient]) -> float:
+        keys, groups = self._route(patients)
+        total = sum(len(indexes) * self._model[key].negative_log_likelihood([patients[i] for i in indexes])
+                    for key, indexes in zip(keys, groups))
+        return float(total / len(patients))
+
+    def fingerprint(self) -> str:
+        """ As for the other models, plus the sub-model class and the sharding threshold. """
+        if self._fingerprint is None:
+            hasher = hashlib.sha256(super().fingerprint().encode())
+            hasher.update(repr((self._model_class.__name__, self._min_shard_size)).encode())
+            self._fingerprint = hasher.hexdigest()
+        return self._fingerprint
+
+    # Specific methods
+    def _make_shards(self, patients: list[Patient]) -> dict:
+        """ Untrained sub-models: one for each large enough equipe, plus the fallback. """
+        groups = {}
+        for patient in patients:
+            groups.setdefault(patient.equipe, []).append(patient)
+
+        models = {equipe: self._model_class(patients = group, hyperparameters = self._hyperparameters, train = False)
+                  for equipe, group in groups.items()
+                  if len(group) >= self._min_shard_size}
+        models[None] = self._make_fallback(patients, models)
+
+        return models
+
+    def _make_fallback(self, patients: list[Patient], shards: dict) -> PredictiveModel:
+        """ Untrained fallback model: on the patients of the equipes without a shard, or on all if there are none. """
+        group = [patient for patient in patients if patient.equipe not in shards]
+        return self._model_class(patients = group or patients, hyperparameters = self._hyperparameters, train = False)
+
+    def _fallback_needed(self) -> bool:
+        """ Whether some training patients have no shard: the fallback is fitted with the shards. """
+        return any(patient.equipe not in self._model for patient in self._patients)
+
+    def _set_training_patients(self, patients: list[Patient]):
+        """ Replace the training patients, the shards are built again at the next fit. """
+        super()._set_training_patients(patients)
+        self._stale_shards = True
+
+    def _warm_start(self, patients: list[Patient], iterations: int):
+        """ 
+        Each shard is updated with the new patients of its equipe, the fallback
+        with the ones of the equipes without a shard. The fingerprints of the
+        updated sub-models change, as they key the cached predictions.
+        """
+        keys, groups = self._route(patients, fit_fallback = False)
+
+        # A fallback not fitted yet is fitted when needed, on the new patients too
+        if not self._model[None].trained:
+            self._model[None] = self._make_fallback(list(self._patients) + list(patients), self.shards)
+
+        for key, indexes in zip(keys, groups):
+            model = self._model[key]
+            if not model.trained:
+                continue
+            group = [patients[i] for i in indexes]
+            previous = model.fingerprint()
+            model._warm_start(group, iterations)
+            model._chain_fingerprint(previous, group, iterations)
+
+    def _route(self, patients: list[Patient], fit_fallback: bool = True):
+        """ 
+        The keys of the sub-models used and, for each of them, the indexes of its
+        patients. The fallback is fitted, if it is used and not fitted yet.
+        """
+        groups = {}
+        for index, patient in enumerate(patients):
+            key = patient.equipe if patient.equipe in self._model else None
+            groups.setdefault(key, []).append(index)
+
+        if fit_fallback and None in groups and not self._model[None].trained:
+            self._fit([None])
+
+        return list(groups.keys()), [np.array(indexes) for indexes in groups.values()]
+
+    def _fit(self, keys: list, validation_patients: list[Patient] = None, early_stopping_rounds: int = None,
+             force: bool = False):
+        """ Fit the sub-models with the given keys, in parallel processes; force refits trained ones. """
+        if not keys:
+            return
+
+        tasks = []
+        for key in keys:
+            model = self._model[key]
+            validation = None
+            if validation_patients:
+                validation = [patient for patient in validation_patients
+                              if patient.equipe == key or (key is None and patient.equipe not in self._model)] or None
+            tasks.append((model, validation, early_stopping_rounds, force))
+
+        if self._max_workers == 1 or len(tasks) == 1:
+            fitted = [_fit_model(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers = self._max_workers) as executor:
+                fitted = list(executor.map(_fit_model, *zip(*tasks)))
+
+        # The state set by train comes back from the processes, the sub-models keep their data and cache
+        for key, state in zip(keys, fitted):
+            for name, value in state.items():
+                setattr(self._model[key], name, value)
+
+
+def _fit_model(model: PredictiveModel, validation_patients: list[Patient], early_stopping_rounds: int,
+               force: bool = False):
+    model.train(force = force, validation_patients = validation_patients, early_stopping_rounds = early_stopping_rounds)
+    return {name: getattr(model, name) for name in TRAINED_STATE}
@@ -0,0 +1,246 @@
+# Python STL
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+from .schedule import Schedule
+from .uncertainty_profile import sample_profiles
+
+
+class DaySimulator():
+    """
+    Simulation of the days of a schedule, with the surgeries sequenced in the
+    rooms and performed by the equipes of the patients.
+
+    In a day the blocks of a room are back to back, from time 0, in their order
+    in the day, and the surgeries of a block in the order of its patients. Each
+    room and each equipe performs its surgeries in the planned order (of the
+    nominal start times): a surgery starts when the room and the equipe are both
+    free, not before the start of its block. So a block that overruns delays the
+    next blocks of its room and the surgeries of its equipe in the other rooms.
+    A surgery that would end, with its nominal duration, after the closing time
+    of the room (end of its last block) plus the overtime tolerance is
+    cancelled, and does not occupy the room nor the equipe.
+
+    Surgeries are processed in the planned order, every step on the arrays of
+    all the simulated scenarios at once, in chunks.
+
+    Attributes
+    ----------
+    _schedule: Schedule
+        The simulated schedule.
+    _overtime_tolerance: float
+        Minutes after the closing time of a room within which surgeries are not cancelled.
+    _chunk_size: int
+        Number of scenarios simulated at once.
+    _seed: int
+        Seed of numpy global random state, which the profiles sample from.
+    _surgeries: pd.DataFrame
+        Plan of the surgeries in the processing order, with their metrics after run.
+    _room_days: pd.DataFrame
+        The metrics of each room in each day, after run.
+    _summary: dict
+        The metrics of the whole schedule, after run.
+    """
+
+    def __init__(self, schedule: Schedule, overtime_tolerance: float = 0., chunk_size: int = 10_000, seed: int = None):
+        self._schedule = schedule
+        self._overtime_tolerance = overtime_tolerance
+        self._chunk_size = chunk_size
+        self._seed = seed
+
+        self._plan()
+
+        self._room_days = None
+        self._summary = None
+
+    # Getters and setters
+    def get_schedule(self):
+        return self._schedule
+    schedule = property(get_schedule)
+
+    def get_surgeries(self):
+        return self._surgeries
+    surgeries = property(get_surgeries)
+
+    def get_room_days(self):
+        return self._room_days
+    room_days = property(get_room_days)
+
+    def get_summary(self):
+        return self._summary
+    summary = property(get_summary)
+
+    # Specific methods
+    def run(self, n_scenarios: int = 10_000) -> pd.DataFrame:
+        """
+        Simulate the schedule on scenarios sampled from the uncertainty profiles
+        of the patients.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each room in each day with: week, weekday, room, closing
+            (planned end), overtime_probability, expected_overtime,
+            expected_cancellations and expected_idle (closing time minus the
+            minutes of surgery, if positive). The metrics of the surgeries are added to the
+            surgeries property, the ones of the schedule are in summary.
+        """
+        if self._seed is not None:
+            np.random.seed(self._seed)
+
+        n_room_days = len(self._closing)
+        cancelled_count = np.zeros(len(self._surgeries))
+        delay_sum = np.zeros(len(self._surgeries))
+        overtime_count = np.zeros(n_room_days)
+        overtime_sum = np.zeros(n_room_days)
+        idle_sum = np.zeros(n_room_days)
+        any_overtime_count = 0
+        daily_cancellations = []
+
+        for first in range(0, n_scenarios, self._chunk_size):
+            size = min(self._chunk_size, n_scenarios - first)
+            if len(self._profiles) > 0:
+                durations = sample_profiles(self._profiles, size)
+            else:
+                durations = np.zeros((size, 0))
+
+            start, cancelled, room_end, busy = self.simulate(durations)
+
+            overtime = np.maximum(room_end - self._closing, 0.)
+            cancelled_count += cancelled.sum(axis=0)
+            delay_sum += np.where(cancelled, 0., start - self._surgeries['nominal_start'].to_numpy()).sum(axis=0)
+            overtime_count += (overtime > 0).sum(axis=0)
+            overtime_sum += overtime.sum(axis=0)
+            idle_sum += np.maximum(self._closing - busy, 0.).sum(axis=0)
+            any_overtime_count += int(np.any(overtime > 0, axis=1).sum())
+            daily_cancellations.append(cancelled.sum(axis=1))
+
+        performed = np.maximum(n_scenarios - cancelled_count, 1)
+        self._surgeries['cancellation_probability'] = cancelled_count / n_scenarios
+        self._surgeries['mean_start_delay'] = delay_sum / performed
+
+        room_cancellations = np.zeros(n_room_days)
+        np.add.at(room_cancellations, self._surgeries['room_day'].to_numpy(), cancelled_count)
+
+        self._room_days = self._room_day_keys.assign(
+            closing = self._closing,
+            overtime_probability = overtime_count / n_scenarios,
+            expected_overtime = overtime_sum / n_scenarios,
+            expected_cancellations = room_cancellations / n_scenarios,
+            expected_idle = idle_sum / n_scenarios,
+        )
+
+        daily_cancellations = np.concatenate(daily_cancellations) if daily_cancellations else np.zeros(0)
+        n_surgeries = max(len(self._surgeries), 1)
+        self._summary = {
+            'n_scenarios': n_scenarios,
+            'cancellation_rate': float(cancelled_count.sum() / (n_scenarios * n_surgeries)),
+            'expected_cancellations': float(daily_cancellations.mean()) if n_scenarios else 0.,
+            'no_cancellation_probability': float(np.mean(daily_cancellations == 0)) if n_scenarios else 1.,
+            'overtime_probability': any_overtime_count / n_scenarios,
+            'expected_overtime': float(overtime_sum.sum() / n_scenarios),
+            'expected_idle': float(idle_sum.sum() / n_scenarios),
+        }
+
+        return self._room_days
+
+    def simulate(self, durations: np.ndarray) -> tuple:
+        """
+        Simulate the schedule on given durations of the surgeries.
+
+        Parameters
+        ----------
+        durations: np.ndarray
+            Durations of the surgeries in the order of the surgeries property,
+            shape (scenarios, surgeries).
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Start of each surgery and whether it is cancelled, shape (scenarios,
+            surgeries); end of the last surgery of each room day (0 if none is
+            performed) and minutes of surgery in it, shape (scenarios, room days).
+        """
+        # Scenarios on the last axis, so every step reads and writes contiguous rows
+        durations = np.ascontiguousarray(np.atleast_2d(np.asarray(durations, dtype=float)).T)
+        n_scenarios = durations.shape[1]
+
+        room_free = np.zeros((len(self._closing), n_scenarios))
+        equipe_free = np.zeros((self._n_equipe_days, n_scenarios))
+        busy = np.zeros((len(self._closing), n_scenarios))
+        start = np.empty_like(durations)
+        cancelled = np.zeros(durations.shape, dtype=bool)
+
+        columns = zip(self._surgeries['room_day'].to_numpy(), self._surgeries['equipe_day'].to_numpy(),
+                      self._surgeries['block_start'].to_numpy(), self._surgeries['nominal_duration'].to_numpy())
+        for s, (room_day, equipe_day, block_start, nominal_duration) in enumerate(columns):
+            begin = start[s]
+            np.maximum(room_free[room_day], equipe_free[equipe_day], out=begin)
+            np.maximum(begin, block_start, out=begin)
+            cancel = np.greater(begin, self._closing[room_day] + self._overtime_tolerance - nominal_duration,
+                                out=cancelled[s])
+            length = np.where(cancel, 0., durations[s])
+            end = begin + length
+
+            np.copyto(room_free[room_day], end, where=~cancel)
+            np.copyto(equipe_free[equipe_day], end, where=~cancel)
+            busy[room_day] += length
+
+        return start.T, cancelled.T, room_free.T, busy.T
+
+    def trace(self, durations: np.ndarray) -> pd.DataFrame:
+        """ The events of one scenario: plan of the surgeries with their start, end and cancellation. """
+        durations = np.asarray(durations, dtype=float)
+        start, cancelled, _, _ = self.simulate(durations[None, :])
+        return self._surgeries[['week', 'weekday', 'room', 'block', 'patient', 'equipe', 'nominal_start']].assign(
+            start = start[0],
+            end = np.where(cancelled[0], start[0], start[0] + durations),
+            cancelled = cancelled[0],
+        )
+
+    def _plan(self):
+        """ Nominal plan of the surgeries, sorted in the processing order, and closing time of the room days. """
+        rows = []
+        blocks = sorted(self._schedule.blocks, key=lambda block: (block.order_in_week, block.weekday, block.order_in_day))
+        block_start = {}
+        for block in blocks:
+            key = (block.order_in_week, block.weekday, block.room)
+            start = block_start.get(key, 0.)
+            block_start[key] = start + block.duration
+
+            offset = start
+            for patient in block.patients:
+                nominal_duration = float(patient.uncertainty_profile.nominal_value)
+                rows.append({'week': block.order_in_week, 'weekday': block.weekday, 'room': block.room,
+                             'block': block.order_in_schedule, 'patient': patient.id, 'equipe': patient.equipe,
+                             'block_start': start, 'nominal_start': offset, 'nominal_duration': nominal_duration,
+                             '_profile': patient.uncertainty_profile})
+                offset += nominal_duration
+
+        room_days = pd.DataFrame([{'week': key[0], 'weekday': key[1], 'room': key[2], 'closing': closing}
+                                  for key, closing in block_start.items()])
+        columns = ['week', 'weekday', 'room', 'block', 'patient', 'equipe', 'block_start', 'nominal_start',
+                   'nominal_duration', '_profile']
+        surgeries = pd.DataFrame(rows, columns=columns)
+
+        # Planned order: by day and nominal start, ties by room
+        surgeries = surgeries.sort_values(['week', 'weekday', 'nominal_start', 'room'], kind='stable').reset_index(drop=True)
+
+        if len(room_days) > 0:
+            room_index = {key: number for number, key in enumerate(block_start)}
+            surgeries['room_day'] = [room_index[key] for key in zip(surgeries['week'], surgeries['weekday'], surgeries['room'])]
+        else:
+            surgeries['room_day'] = pd.Series(dtype=int)
+        equipe_days = list(dict.fromkeys(zip(surgeries['week'], surgeries['weekday'], surgeries['equipe'])))
+        equipe_index = {key: number for number, key in enumerate(equipe_days)}
+        surgeries['equipe_day'] = [equipe_index[key] for key in zip(surgeries['week'], surgeries['weekday'], surgeries['equipe'])]
+
+        self._profiles = list(surgeries.pop('_profile'))
+        self._surgeries = surgeries
+        self._n_equipe_days = len(equipe_days)
+        self._room_day_keys = room_days[['week', 'weekday', 'room']] if len(room_days) > 0 else \
+            pd.DataFrame(columns=['week', 'weekday', 'room'])
+        self._closing = room_days['closing'].to_numpy(dtype=float) if len(room_days) > 0 else np.zeros(0)
@@ -0,0 +1,75 @@
+# Python STL
+
+# Packages
+import numpy as np
+
+# Modules
+from .matrix_model import instance_arrays
+
+
+# Parameters describing a block and a patient in the models: blocks (patients)
+# with the same values of all of them, and the same compatibility, can be
+# swapped in any solution without changing its feasibility or its objective.
+BLOCK_PARAMETERS = ['g', 'gamma', 'time_increment']
+PATIENT_PARAMETERS = ['t', 'w', 'l', 'u', 'f']
+
+
+def block_days(n_blocks: int, n_days: int) -> np.ndarray:
+    """ The day of each block (from 1), as computed by YVarDefRule. """
+    return np.array([int(b / (n_blocks / n_days)) + 1 for b in range(1, n_blocks + 1)])
+
+
+def equivalent_blocks(data: dict) -> list[np.ndarray]:
+    """
+    Classes of equivalent blocks: same day, same compatible patients and same
+    values of the block parameters.
+
+    Parameters
+    ----------
+    data: dict
+        The arrays of the instance data, as returned by matrix_model.instance_arrays.
+
+    Returns
+    -------
+    list[np.ndarray]
+        The indexes (from 0) of the blocks of each class with more than one block.
+    """
+    columns = [block_days(data['n_blocks'], data['n_days'])[:, None], data['a']]
+    columns += [data[name][:, None] for name in BLOCK_PARAMETERS if name in data]
+    return _classes(np.hstack(columns))
+
+
+def equivalent_patients(data: dict) -> list[np.ndarray]:
+    """
+    Classes of interchangeable patients: same compatible blocks, same values of
+    the patient parameters and the same adversary realizations.
+    """
+    columns = [data['a'].T]
+    columns += [data[name][:, None] for name in PATIENT_PARAMETERS if name in data]
+    if 'eps' in data:
+        columns.append(data['eps'])
+    return _classes(np.hstack(columns))
+
+
+def symmetry_pairs(instance_data: dict) -> tuple[list, list]:
+    """
+    Pairs of consecutive blocks, and of consecutive patients, of each class of
+    equivalent ones, with indexes from 1 as in the models.
+    """
+    data = instance_arrays(instance_data)
+    block_pairs = [(int(first) + 1, int(second) + 1)
+                   for blocks in equivalent_blocks(data) for first, second in zip(blocks[:-1], blocks[1:])]
+    patient_pairs = [(int(first) + 1, int(second) + 1)
+                     for patients in equivalent_patients(data) for first, second in zip(patients[:-1], patients[1:])]
+    return block_pairs, patient_pairs
+
+
+def _classes(rows: np.ndarray) -> list[np.ndarray]:
+    """ Groups of identical rows with more than one member, each sorted by index. """
+    if len(rows) == 0:
+        return []
+    _, inverse, counts = np.unique(rows, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(order, np.cumsum(counts)[:-1])
+    return [group for group in groups if len(group) > 1]
@@ -0,0 +1,137 @@
+# Python STL
+import string
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+
+
+# Maximum waiting days of the urgency grades of the synthetic patients
+URGENCY_TO_MAX_WAITING_DAYS = {0: 30, 1: 60, 2: 180}
+
+
+def synthetic_equipes(num_of_equipes: int) -> list[str]:
+    """ Names of the equipes: A, B, ..., Z, AA, AB, ... """
+    letters = string.ascii_uppercase
+    names = []
+    for number in range(num_of_equipes):
+        name = ''
+        number += 1
+        while number > 0:
+            number, remainder = divmod(number - 1, len(letters))
+            name = letters[remainder] + name
+        names.append(name)
+    return names
+
+
+def synthetic_history(quantity: int,
+                      num_of_equipes: int = 4,
+                      procedures_per_equipe: int = 3,
+                      seed: int = None) -> pd.DataFrame:
+    """
+    Historical data of operated patients, in the format of
+    PatientsFromHistoricalDataProvider: equipe, urgency, days_waiting, target
+    (the surgery time in minutes) and the features procedure (categorical), age,
+    bmi and asa. The surgery time is lognormal, with a median depending on the
+    procedure and growing with age, bmi and asa, and a dispersion depending on
+    the procedure.
+
+    Parameters
+    ----------
+    quantity: int
+        Number of patients (rows).
+    num_of_equipes: int, optional
+        Number of equipes, named as synthetic_equipes.
+    procedures_per_equipe: int, optional
+        Number of procedures performed by each equipe.
+    seed: int, optional
+        Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    equipes = synthetic_equipes(num_of_equipes)
+
+    num_of_procedures = num_of_equipes * procedures_per_equipe
+    procedure_median = rng.uniform(40, 200, num_of_procedures)
+    procedure_sigma = rng.uniform(0.15, 0.45, num_of_procedures)
+
+    procedure = rng.integers(0, num_of_procedures, quantity)
+    age = rng.integers(18, 90, quantity)
+    bmi = np.round(rng.normal(26, 4, quantity).clip(16, 45), 1)
+    asa = rng.choice([1, 2, 3, 4], quantity, p=[0.3, 0.4, 0.25, 0.05])
+    urgency = rng.choice(list(URGENCY_TO_MAX_WAITING_DAYS), quantity, p=[0.2, 0.3, 0.5])
+    max_waiting_days = np.array([URGENCY_TO_MAX_WAITING_DAYS[grade] for grade in urgency])
+    days_waiting = np.floor(rng.uniform(0, 1.1, quantity) * max_waiting_days).astype(int)
+
+    log_median = np.log(procedure_median[procedure]) + 0.003 * (age - 50) + 0.01 * (bmi - 26) + 0.05 * (asa - 2)
+    target = np.round(np.exp(log_median + procedure_sigma[procedure] * rng.standard_normal(quantity)), 1)
+
+    return pd.DataFrame({
+        'equipe': np.array(equipes, dtype=object)[procedure // procedures_per_equipe],
+        'procedure': np.array([f'P{number:03d}' for number in procedure], dtype=object),
+        'age': age,
+        'bmi': bmi,
+        'asa': asa,
+        'urgency': urgency,
+        'days_waiting': days_waiting,
+        'target': target,
+    })
+
+
+def synthetic_master(num_of_blocks: int,
+                     num_of_equipes: int = 4,
+                     num_of_rooms: int = None,
+                     week_length: int = 5,
+                     seed: int = None) -> pd.DataFrame:
+    """
+    Table of a master schedule, in the format of Master: every day of the week
+    each room has a morning and an afternoon block, the blocks are spread evenly
+    over the days. Each block is of one equipe, or of two with probability 0.2,
+    and every equipe has at least one block if there are enough blocks.
+
+    Parameters
+    ----------
+    num_of_blocks: int
+        Number of blocks in a week.
+    num_of_equipes: int, optional
+        Number of equipes, named as synthetic_equipes.
+    num_of_rooms: int, optional
+        Number of rooms, by default the fewest needed.
+    week_length: int, optional
+        Number of days of the week.
+    seed: int, optional
+        Seed of the random generator.
+    """
+    if num_of_rooms is None:
+        num_of_rooms = int(np.ceil(num_of_blocks / (2 * week_length)))
+    if num_of_blocks > 2 * week_length * num_of_rooms:
+        raise ValueError(f"{num_of_blocks} blocks do not fit in {num_of_rooms} rooms for {week_length} days.")
+    if num_of_blocks < week_length:
+        raise ValueError("The master schedule needs at least one block for each day of the week.")
+
+    rng = np.random.default_rng(seed)
+    equipes = synthetic_equipes(num_of_equipes)
+
+    # Blocks of each day, then their slots (room, morning or afternoon)
+    per_day = np.full(week_length, num_of_blocks // week_length)
+    per_day[:num_of_blocks % week_length] += 1
+
+    rows = []
+    for weekday, count in enumerate(per_day, start=1):
+        slots = sorted(rng.permutation(2 * num_of_rooms)[:count])
+        for slot in slots:
+            room, afternoon = divmod(slot, 2)
+            duration = float(rng.choice([240, 300] if afternoon else [300, 360]))
+            rows.append({'weekday': weekday, 'room': f'R{room + 1}', 'duration': duration})
+
+    owners = rng.permutation(np.resize(np.arange(num_of_equipes), num_of_blocks))
+    for row, owner in zip(rows, owners):
+        block_equipes = [equipes[owner]]
+        if num_of_equipes > 1 and rng.uniform() < 0.2:
+            block_equipes.append(equipes[(owner + rng.integers(1, num_of_equipes)) % num_of_equipes])
+        row['equipes'] = ', '.join(block_equipes)
+
+    table = pd.DataFrame(rows, columns=['weekday', 'equipes', 'room', 'duration'])
+    table['weekday'] = table['weekday'].astype(int)
+    return table
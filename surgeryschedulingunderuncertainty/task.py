@@ -5,6 +5,7 @@
 # Modules
 from .master import Master
 from .patient import Patient
+from . import instrumentation
 
 
 class Task():
@@ -185,12 +186,34 @@ class Task():
     num_adversary_realizations = property(get_num_adversary_realizations)
 
 
+    def set_adversary_realizations(self, realizations: dict):
+        """
+        Replace the adversary realizations of all the patients, e.g. when a run is
+        resumed from a checkpoint.
+
+        Parameters
+        ----------
+        realizations: dict
+            Mapping from the id of each patient of the task to the list of its realizations.
+        """
+        if set(realizations) != {patient.id for patient in self.patients}:
+            raise ValueError("The realizations do not match the patients of the task.")
+        lengths = {len(values) for values in realizations.values()}
+        if len(lengths) > 1:
+            raise ValueError("All the patients must have the same number of realizations.")
+
+        for patient in self.patients:
+            patient.adversary_realization = [float(value) for value in realizations[patient.id]]
+
+        self._num_adversary_realizations = lengths.pop() if lengths else 0
+
     def add_adversary_realization(self, adversary_realization: dict):
         patients_ids = adversary_realization.keys()
+        instrumentation.count('adversary.realizations')
         
         for patient in self.patients:
             if patient.id in patients_ids:
-                patient.add_adversary_realization(adversary_realization.get(patients_ids))
+                patient.add_adversary_realization(adversary_realization.get(patient.id))
             else:
                 patient.add_adversary_realization(0.0)
             
@@ -0,0 +1,263 @@
+# Python STL
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import json
+import os
+
+# Packages
+import numpy as np
+import pandas as pd
+
+# Modules
+from .patient import Patient
+from .predictive_model import PredictiveModel
+
+
+class HyperparameterSearch():
+    """
+    Grid search with k-fold cross validation for the predictive models. Every
+    (configuration, fold) pair is fitted in a separate process.
+    Each configuration is scored by:
+     - the negative log likelihood of the targets in the test folds (nll);
+     - the calibration of the 1-robustness_risk quantile, which is the percent
+       point used by the chance constraints: coverage is the fraction of targets
+       below the predicted quantile, calibration_error its distance from
+       1-robustness_risk.
+    Fold results can be cached on disk, so a new run evaluates only the
+    configurations (or folds) not seen before.
+
+    Attributes
+    ----------
+    _model_class: type
+        The PredictiveModel class to tune, e.g. NGBLogNormal.
+    _patients: list[Patient]
+        Patients with target, split in folds.
+    _configurations: list[dict]
+        The hyperparameters to evaluate.
+    _robustness_risk: float
+        Risk of overtime used by the chance constraints.
+    _num_folds: int
+        Number of folds.
+    _max_workers: int
+        Number of processes, 1 to run in the current process.
+    _early_stopping_rounds: int
+        If set, a fraction of each training fold is used as validation set for
+        early stopping.
+    _validation_fraction: float
+        Fraction of the training fold used as validation set.
+    _cache_dir: str
+        Directory of the cached fold results.
+    _seed: int
+        Seed of the split in folds.
+    """
+
+    def __init__(self,
+                 model_class: type,
+                 patients: list[Patient],
+                 param_grid: dict,
+                 robustness_risk: float,
+                 num_folds: int = 5,
+                 max_workers: int = None,
+                 early_stopping_rounds: int = None,
+                 validation_fraction: float = 0.1,
+                 cache_dir: str = None,
+                 seed: int = 0):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        param_grid: dict or list[dict]
+            Mapping from hyperparameter name to the list of values to try (all the
+            combinations are evaluated), or an explicit list of configurations.
+        """
+        if num_folds < 2:
+            raise ValueError("At least two folds are required.")
+
+        self._model_class = model_class
+        self._patients = patients
+        self._robustness_risk = robustness_risk
+        self._num_folds = num_folds
+        self._max_workers = max_workers
+        self._early_stopping_rounds = early_stopping_rounds
+        self._validation_fraction = validation_fraction
+        self._cache_dir = cache_dir
+        self._seed = seed
+
+        if isinstance(param_grid, dict):
+            names = sorted(param_grid)
+            self._configurations = [dict(zip(names, values))
+                                    for values in itertools.product(*(param_grid[name] for name in names))]
+        else:
+            self._configurations = [dict(configuration) for configuration in param_grid]
+
+        self._results = None
+
+    # Getters and setters
+    def get_configurations(self):
+        return self._configurations
+    configurations = property(get_configurations)
+
+    def get_results(self):
+        return self._results
+    results = property(get_results)
+
+    # Specific methods
+    def run(self) -> pd.DataFrame:
+        """
+        Evaluate every configuration on every fold.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each configuration, with the hyperparameters, the mean and
+            standard deviation of nll, the mean coverage and calibration error,
+            the mean number of boosting iterations.
+        """
+        folds = self._folds()
+        data_key = self._data_key(folds)
+
+        fold_results = {}
+        pending = []
+
+        for number, configuration in enumerate(self._configurations):
+            for fold in range(self._num_folds):
+                key = _fold_key(data_key, self._model_class, configuration, fold,
+                                self._robustness_risk, self._early_stopping_rounds, self._validation_fraction)
+                cached = self._load_fold(key)
+                if cached is not None:
+                    fold_results[(number, fold)] = cached
+                else:
+                    pending.append((number, fold, key))
+
+        tasks = [(self._model_class, self._configurations[number], folds, fold, self._robustness_risk,
+                  self._early_stopping_rounds, self._validation_fraction, self._seed)
+                 for number, fold, _ in pending]
+
+        if self._max_workers == 1:
+            _init_worker(self._patients)
+            outputs = [_evaluate_fold(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=self._max_workers,
+                                     initializer=_init_worker,
+                                     initargs=(self._patients,)) as executor:
+                outputs = list(executor.map(_evaluate_fold, *zip(*tasks))) if tasks else []
+
+        for (number, fold, key), output in zip(pending, outputs):
+            fold_results[(number, fold)] = output
+            self._save_fold(key, output)
+
+        rows = []
+        for number, configuration in enumerate(self._configurations):
+            scores = pd.DataFrame([fold_results[(number, fold)] for fold in range(self._num_folds)])
+            rows.append({**{name: _readable(value) for name, value in configuration.items()},
+                         'nll': scores['nll'].mean(),
+                         'nll_std': scores['nll'].std(),
+                         'coverage': scores['coverage'].mean(),
+                         'calibration_error': scores['calibration_error'].mean(),
+                         'iterations': scores['iterations'].mean()})
+
+        self._results = pd.DataFrame(rows)
+
+        return self._results
+
+    def best_configuration(self, criterion: str = 'nll') -> dict:
+        """ The configuration with the lowest mean score (nll or calibration_error). """
+        if self._results is None:
+            raise ValueError("Call run() before asking for the best configuration.")
+        return self._configurations[int(self._results[criterion].idxmin())]
+
+    def _folds(self):
+        """ Fold number of each patient. """
+        rng = np.random.default_rng(self._seed)
+        assignment = np.empty(len(self._patients), dtype=int)
+        for fold, indexes in enumerate(np.array_split(rng.permutation(len(self._patients)), self._num_folds)):
+            assignment[indexes] = fold
+        return assignment
+
+    def _data_key(self, folds: np.ndarray) -> str:
+        """ Hash of the training data and of the split in folds. """
+        model = self._model_class(patients = self._patients, train = False)
+        hasher = hashlib.sha256(model.fingerprint().encode())
+        hasher.update(folds.tobytes())
+        return hasher.hexdigest()
+
+    def _load_fold(self, key: str):
+        if not self._cache_dir:
+            return None
+        path = os.path.join(self._cache_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return json.load(file)
+
+    def _save_fold(self, key: str, output: dict):
+        if not self._cache_dir:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        path = os.path.join(self._cache_dir, f"{key}.json")
+        with open(path + '.tmp', 'w') as file:
+            json.dump(output, file)
+        os.replace(path + '.tmp', path)
+
+
+# Worker process state: the patients are sent once to each process
+_WORKER_PATIENTS = None
+
+
+def _init_worker(patients: list[Patient]):
+    global _WORKER_PATIENTS
+    _WORKER_PATIENTS = patients
+
+
+def _evaluate_fold(model_class: type,
+                   configuration: dict,
+                   folds: np.ndarray,
+                   fold: int,
+                   robustness_risk: float,
+                   early_stopping_rounds: int,
+                   validation_fraction: float,
+                   seed: int) -> dict:
+    """ Fit the model on all folds but one and score it on the remaining one. """
+    patients = _WORKER_PATIENTS
+
+    training = [patient for patient, number in zip(patients, folds) if number != fold]
+    test = [patient for patient, number in zip(patients, folds) if number == fold]
+    validation = None
+
+    if early_stopping_rounds:
+        rng = np.random.default_rng(seed + fold)
+        is_validation = rng.random(len(training)) < validation_fraction
+        validation = [patient for patient, flag in zip(training, is_validation) if flag]
+        training = [patient for patient, flag in zip(training, is_validation) if not flag]
+
+    model: PredictiveModel = model_class(patients = training, hyperparameters = configuration, train = False)
+    model.train(validation_patients = validation, early_stopping_rounds = early_stopping_rounds)
+
+    features, target = model._extract_evaluation_data(test)
+    quantile = model._predict_profiles(features).percent_point_function(1 - robustness_risk)
+    coverage = float(np.mean(target <= quantile))
+
+    iterations = getattr(model._model, 'best_val_loss_itr', None)
+    if iterations is None:
+        iterations = len(getattr(model._model, 'base_models', []))
+
+    return {'nll': model.negative_log_likelihood(test),
+            'coverage': coverage,
+            'calibration_error': abs(coverage - (1 - robustness_risk)),
+            'iterations': int(iterations)}
+
+
+def _fold_key(data_key: str, model_class: type, configuration: dict, fold: int,
+              robustness_risk: float, early_stopping_rounds: int, validation_fraction: float) -> str:
+    description = repr((data_key, model_class.__name__, sorted(configuration.items()), fold,
+                        robustness_risk, early_stopping_rounds, validation_fraction))
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _readable(value):
+    """ Hyperparameter values that are objects (e.g. base learners) are shown by repr. """
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    return repr(value)
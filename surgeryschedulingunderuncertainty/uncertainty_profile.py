@@ -148,6 +148,12 @@ class NormalDistribution(UncertaintyProfile):
     def sample(self, size):
         return ss.norm.rvs(loc = self._param_loc, scale = self._param_scale, size = size)
 
+    def percent_point_function(self, probability):
+        """
+        Using this method for the chans constraints implementor
+        """
+        return ss.norm.ppf(q = probability, loc = self._param_loc, scale = self._param_scale)
+
 
 
 
@@ -318,3 +324,335 @@ class BalancedHistogramModel(UncertaintyProfile):
     def continuous_sampling(self, size):
         return self._profile.continuous_sampling(size)
 
+
+
+class TabulatedQuantileDistribution(UncertaintyProfile):
+    """
+    Distribution described by its quantile function tabulated at some probability
+    levels, e.g. the output of a quantile regressor. Between the levels the 
+    quantile function is linearly interpolated, outside them it is constant.
+    Quantiles are sorted, to remove crossings between levels.
+    The nominal value is the mean of the tabulated quantile function.
+    """
+
+    def __init__(self, levels: list[float], values: list[float]):
+
+        levels = np.asarray(levels, dtype=float)
+        values = np.sort(np.asarray(values, dtype=float))
+
+        # Check that levels and values are of the same lenght
+        if not len(levels) == len(values):
+            raise ValueError("The levels vector and the values vector have a different number of components.")
+
+        # Check that levels are increasing probabilities
+        if np.any(np.diff(levels) <= 0) or levels[0] <= 0 or levels[-1] >= 1:
+            raise ValueError("The levels must be increasing probabilities between 0 and 1.")
+
+        super().__init__(nominal_value = _tabulated_mean(levels, values))
+
+        self._levels = levels
+        self._values = values
+
+    # Getters and setters
+    def get_levels(self):
+        return self._levels
+    levels = property(get_levels)
+
+    def get_values(self):
+        return self._values
+    values = property(get_values)
+
+    # Abstract methods implementation
+    def sample(self, size):
+        return self.percent_point_function(np.random.uniform(size = size))
+
+    def percent_point_function(self, probability):
+        return np.interp(probability, self._levels, self._values)
+
+
+
+def _tabulated_mean(levels: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """ Mean of the tabulated quantile functions (last axis of values) over the levels range. """
+    areas = np.diff(levels) * (values[..., 1:] + values[..., :-1]) / 2
+    return np.sum(areas, axis=-1) / (levels[-1] - levels[0])
+
+
+
+class UncertaintyProfileBatch(ABC):
+    """
+    Abstract class for a batch of uncertainty profiles of the same kind, e.g. the
+    output of a predictive model on a list of patients. Parameters are stored as
+    arrays, so nominal values, percent points and samples are computed for the
+    whole batch at once. The single profile objects are created only when they
+    are accessed, with batch[index].
+
+    Attributes
+    ----------
+    _nominal_values: np.ndarray
+        The nominal value of each profile in the batch.
+    _profiles: dict
+        The profile objects created so far, by index.
+    """
+
+    def __init__(self, nominal_values: np.ndarray):
+        self._nominal_values = np.asarray(nominal_values, dtype=float)
+        self._profiles = {}
+
+    def __len__(self):
+        return len(self._nominal_values)
+
+    def __getitem__(self, index: int) -> UncertaintyProfile:
+        if index not in self._profiles:
+            self._profiles[index] = self._make_profile(index)
+        return self._profiles[index]
+
+    # Getters and setters
+    def get_nominal_values(self):
+        return self._nominal_values
+    nominal_values = property(get_nominal_values)
+
+    # Abstract methods
+    @abstractmethod
+    def _make_profile(self, index: int) -> UncertaintyProfile:
+        pass
+
+    @abstractmethod
+    def percent_point_function(self, probability) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def sample(self, size) -> np.ndarray:
+        """ Samples with shape (size, len(batch)). """
+        pass
+
+
+
+class LogNormalDistributionBatch(UncertaintyProfileBatch):
+
+    def __init__(self, param_s: np.ndarray, param_scale: np.ndarray):
+        
+        param_s = np.asarray(param_s, dtype=float)
+        param_scale = np.asarray(param_scale, dtype=float)
+
+        super().__init__(nominal_values = param_scale**2/np.sqrt(param_scale**2 + param_s**2))
+
+        self._param_s = param_s
+        self._param_scale = param_scale
+
+    # Getters and setters
+    def get_param_s(self):
+        return self._param_s
+    param_s = property(get_param_s)
+
+    def get_param_scale(self):
+        return self._param_scale
+    param_scale = property(get_param_scale)
+
+    # Abstract methods implementation
+    def _make_profile(self, index):
+        return LogNormalDistribution(param_s=self._param_s[index], param_scale=self._param_scale[index])
+
+    def percent_point_function(self, probability):
+        """ Same transformation of LogNormalDistribution.percent_point_function, on arrays. """
+        my_mu, my_sigma = self._normal_parameters()
+        return np.exp(ss.norm.ppf(q = probability, loc = my_mu, scale = my_sigma))
+
+    def sample(self, size):
+        # Same draws of ss.norm.rvs(loc = my_mu, scale = my_sigma), computed in place
+        my_mu, my_sigma = self._normal_parameters()
+        samples = np.random.standard_normal(size = (size, len(self)))
+        samples *= my_sigma
+        samples += my_mu
+        return np.exp(samples, out = samples)
+
+    # Specific methods
+    def _normal_parameters(self):
+        # Same convention of LogNormalDistribution
+        mean = self._param_scale
+        std = self._param_s
+        return np.log(mean**2/np.sqrt(mean**2 + std**2)), np.log(1+(std**2)/(mean**2))
+
+
+
+class NormalDistributionBatch(UncertaintyProfileBatch):
+
+    def __init__(self, param_loc: np.ndarray, param_scale: np.ndarray):
+        
+        param_loc = np.asarray(param_loc, dtype=float)
+
+        super().__init__(nominal_values = param_loc)
+
+        self._param_loc = param_loc
+        self._param_scale = np.asarray(param_scale, dtype=float)
+
+    # Getters and setters
+    def get_param_loc(self):
+        return self._param_loc
+    param_loc = property(get_param_loc)
+
+    def get_param_scale(self):
+        return self._param_scale
+    param_scale = property(get_param_scale)
+
+    # Abstract methods implementation
+    def _make_profile(self, index):
+        return NormalDistribution(param_loc=self._param_loc[index], param_scale=self._param_scale[index])
+
+    def percent_point_function(self, probability):
+        return ss.norm.ppf(q = probability, loc = self._param_loc, scale = self._param_scale)
+
+    def sample(self, size):
+        # Same draws of ss.norm.rvs(loc = param_loc, scale = param_scale), computed in place
+        samples = np.random.standard_normal(size = (size, len(self)))
+        samples *= self._param_scale
+        samples += self._param_loc
+        return samples
+
+
+
+class TabulatedQuantileDistributionBatch(UncertaintyProfileBatch):
+
+    def __init__(self, levels: np.ndarray, values: np.ndarray):
+        """
+        Parameters
+        ----------
+        levels: np.ndarray
+            The probability levels, shared by all the profiles.
+        values: np.ndarray
+            The quantiles, one row for each profile and one column for each level.
+        """
+        levels = np.asarray(levels, dtype=float)
+        values = np.sort(np.asarray(values, dtype=float), axis=1)
+
+        super().__init__(nominal_values = _tabulated_mean(levels, values))
+
+        self._levels = levels
+        self._values = values
+
+    # Getters and setters
+    def get_levels(self):
+        return self._levels
+    levels = property(get_levels)
+
+    def get_values(self):
+        return self._values
+    values = property(get_values)
+
+    # Abstract methods implementation
+    def _make_profile(self, index):
+        return TabulatedQuantileDistribution(levels=self._levels, values=self._values[index])
+
+    def percent_point_function(self, probability):
+        return self._interpolate(np.full(len(self), probability, dtype=float))
+
+    def sample(self, size):
+        return self._interpolate(np.random.uniform(size = (size, len(self))))
+
+    # Specific methods
+    def _interpolate(self, probabilities: np.ndarray) -> np.ndarray:
+        """ Quantiles at the given probabilities, whose last axis runs over the profiles. """
+        probabilities = np.clip(probabilities, self._levels[0], self._levels[-1])
+        upper = np.clip(np.searchsorted(self._levels, probabilities), 1, len(self._levels) - 1)
+        lower = upper - 1
+        weight = (probabilities - self._levels[lower]) / (self._levels[upper] - self._levels[lower])
+
+        columns = np.arange(len(self))
+        return (1 - weight) * self._values[columns, lower] + weight * self._values[columns, upper]
+
+
+
+class CompositeProfileBatch(UncertaintyProfileBatch):
+    """
+    Batch made of the rows of other batches, possibly of different kinds, e.g.
+    the predictions of several models each run on a part of the patients.
+    Profile i is row positions[i] of batches[owners[i]].
+    """
+
+    def __init__(self, batches: list, owners: np.ndarray, positions: np.ndarray):
+        """
+        Parameters
+        ----------
+        batches: list[UncertaintyProfileBatch]
+            The batches holding the profiles.
+        owners: np.ndarray
+            For each profile, the index of the batch holding it.
+        positions: np.ndarray
+            For each profile, its index in the owner batch.
+        """
+        owners = np.asarray(owners, dtype=int)
+        positions = np.asarray(positions, dtype=int)
+
+        self._batches = list(batches)
+        self._owners = owners
+        self._positions = positions
+
+        super().__init__(nominal_values = self._gather(lambda batch: batch.nominal_values))
+
+    # Getters and setters
+    def get_batches(self):
+        return self._batches
+    batches = property(get_batches)
+
+    # Abstract methods implementation
+    def _make_profile(self, index):
+        return self._batches[self._owners[index]][int(self._positions[index])]
+
+    def percent_point_function(self, probability):
+        return self._gather(lambda batch: batch.percent_point_function(probability))
+
+    def sample(self, size):
+        return self._gather(lambda batch: batch.sample(size), leading = (size,))
+
+    # Specific methods
+    def _gather(self, function, leading: tuple = ()) -> np.ndarray:
+        """ Apply function to every batch and place its output (last axis) in the rows of the composite. """
+        output = np.empty(leading + (len(self._owners),))
+        for number, batch in enumerate(self._batches):
+            rows = self._owners == number
+            if np.any(rows):
+                output[..., rows] = np.asarray(function(batch))[..., self._positions[rows]]
+        return output
+
+
+
+
+def sample_profiles(profiles: list[UncertaintyProfile], size: int) -> np.ndarray:
+    """
+    Samples of a list of profiles, with shape (size, len(profiles)). Profiles of
+    the same kind are gathered in a batch and sampled at once: lognormal and
+    normal profiles, tabulated quantile profiles with the same levels. Profiles
+    of other kinds are sampled one by one.
+    """
+    groups = {}
+    for position, profile in enumerate(profiles):
+        if isinstance(profile, TabulatedQuantileDistribution):
+            key = (TabulatedQuantileDistribution, tuple(profile.levels))
+        elif isinstance(profile, (LogNormalDistribution, NormalDistribution)):
+            key = (type(profile),)
+        else:
+            key = (None, position)
+        groups.setdefault(key, []).append(position)
+
+    # A single batch in the order of the profiles is returned as it is
+    if len(groups) == 1 and None not in next(iter(groups)):
+        return _group_batch(next(iter(groups)), profiles).sample(size)
+
+    samples = np.empty((size, len(profiles)))
+    for key, positions in groups.items():
+        if key[0] is None:
+            samples[:, key[1]] = profiles[key[1]].sample(size = size)
+        else:
+            samples[:, positions] = _group_batch(key, [profiles[position] for position in positions]).sample(size)
+
+    return samples
+
+
+def _group_batch(key: tuple, members: list[UncertaintyProfile]) -> UncertaintyProfileBatch:
+    """ The batch of a group of profiles of sample_profiles. """
+    if key[0] is LogNormalDistribution:
+        return LogNormalDistributionBatch(param_s = [profile.param_s for profile in members],
+                                          param_scale = [profile.param_scale for profile in members])
+    if key[0] is NormalDistribution:
+        return NormalDistributionBatch(param_loc = [profile.param_loc for profile in members],
+                                       param_scale = [profile.param_scale for profile in members])
+    return TabulatedQuantileDistributionBatch(levels = key[1], values = [profile.values for profile in members])
@@ -0,0 +1,138 @@
+# Python STL
+import types
+import unittest
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, ChanceConstraintsImplementor, AggregatedImplementor
+
+# Objects of test
+from surgeryschedulingunderuncertainty.aggregation import PatientClasses
+
+
+def make_instance_data(seed = 0, n_days = 2, n_rooms = 2, n_pats = 16):
+    """ Patients from a few classes of duration, urgency and waiting time, two specialties. """
+    rng = np.random.default_rng(seed)
+    n_blocks = n_days * n_rooms
+    durations = rng.choice([60., 90., 150.], n_pats)
+    urgencies = rng.choice([1., 3.], n_pats)
+    waiting = rng.choice([0., 5., 9.], n_pats)
+    specialties = rng.integers(0, 2, n_pats)
+    return {None: {
+        'n_days': {None: n_days},
+        'n_rooms': {None: n_rooms},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: 240 for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): int(b % 2 == specialties[i] or b == 0) for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: durations[i] for i in range(n_pats)},
+        'u': {i + 1: urgencies[i] for i in range(n_pats)},
+        'w': {i + 1: waiting[i] for i in range(n_pats)},
+        'l': {i + 1: 10. for i in range(n_pats)},
+        'f': {i + 1: 1.2 * durations[i] for i in range(n_pats)},
+    }}
+
+
+def objective(solution):
+    return solution.obj() if callable(solution.obj) and not isinstance(solution.obj, pyo.Objective) else pyo.value(solution.obj)
+
+
+def schedule(solution, data):
+    n_blocks, n_pats = data[None]['n_blocks'][None], data[None]['n_pats'][None]
+    return np.array([[solution.x[b + 1, i + 1]() for i in range(n_pats)] for b in range(n_blocks)])
+
+
+class TestPatientClasses(unittest.TestCase):
+
+    def test_classes(self):
+        data = make_instance_data()
+        data[None]['t'] = {i + 1: [60., 62., 75.][i % 3] for i in range(16)}
+
+        exact = PatientClasses(data, duration_resolution=None)
+        rounded = PatientClasses(data, duration_resolution=10.)
+        self.assertEqual(exact.size.sum(), 16)
+        self.assertEqual(rounded.size.sum(), 16)
+        # 62 and 75 are rounded up to 70 and 80, 60 stays 60: the classes do not change
+        self.assertEqual(rounded.num_of_classes, exact.num_of_classes)
+
+        coarse = PatientClasses(data, duration_resolution=30.)
+        self.assertLess(coarse.num_of_classes, exact.num_of_classes)
+
+    def test_members_by_waiting_time(self):
+        data = make_instance_data()
+        classes = PatientClasses(data, duration_resolution=None)
+        waiting = np.array([data[None]['w'][i + 1] for i in range(16)])
+        for members in classes.members:
+            self.assertTrue(np.all(np.diff(waiting[members]) <= 0))
+
+    def test_disaggregate(self):
+        data = make_instance_data()
+        data[None]['l'] = {i + 1: 100. for i in range(16)}
+        classes = PatientClasses(data, duration_resolution=None)
+        counts = np.zeros((4, classes.num_of_classes))
+        c = int(np.argmax(classes.size))
+        self.assertGreater(classes.size[c], 1)
+        compatible = np.flatnonzero(classes._a[:, c])
+        counts[compatible[-1], c] = 1
+        counts[compatible[0], c] = 1
+
+        x = classes.disaggregate(counts)
+        self.assertEqual(x.sum(), 2)
+        self.assertTrue(np.all(x.sum(axis=0) <= 1))
+        # The longest waiting patient of the class gets the earliest block
+        self.assertEqual(x[compatible[0], classes.members[c][0]], 1)
+        self.assertEqual(x[compatible[-1], classes.members[c][1]], 1)
+
+
+class TestAggregatedImplementor(unittest.TestCase):
+
+    def check_feasible(self, solution, data):
+        x = schedule(solution, data)
+        t = np.array([data[None]['t'][i + 1] for i in range(x.shape[1])])
+        a = np.array([[data[None]['a'][(b + 1, i + 1)] for i in range(x.shape[1])] for b in range(x.shape[0])])
+        self.assertTrue(np.all(x.sum(axis=0) <= 1))
+        self.assertTrue(np.all(x <= a))
+        self.assertTrue(np.all(x @ t <= 240 + 1e-6))
+
+    def test_same_objective_as_standard(self):
+        for backend in ['pyomo', 'matrix']:
+            for seed in range(2):
+                data = make_instance_data(seed=seed)
+                standard = StandardImplementor(backend=backend)
+                standard.instance_data = data
+                expected = objective(standard.run())
+
+                aggregated = AggregatedImplementor(duration_resolution=None, backend=backend)
+                aggregated.instance_data = data
+                solution = aggregated.run()
+                self.assertAlmostEqual(solution.obj(), expected, places=6)
+                self.check_feasible(solution, data)
+
+    def test_same_objective_as_chance_constraints(self):
+        task = types.SimpleNamespace(robustness_overtime=10)
+        data = make_instance_data()
+        chance_constraints = ChanceConstraintsImplementor(task=task)
+        chance_constraints.instance_data = data
+        expected = objective(chance_constraints.run())
+
+        for backend in ['pyomo', 'matrix']:
+            aggregated = AggregatedImplementor(task=task, duration_resolution=None, backend=backend)
+            aggregated.instance_data = data
+            self.assertAlmostEqual(aggregated.run().obj(), expected, places=6)
+
+    def test_rounded_durations_are_feasible(self):
+        data = make_instance_data()
+        data[None]['t'] = {i: t + 3. for i, t in data[None]['t'].items()}
+        aggregated = AggregatedImplementor(duration_resolution=30., backend='matrix')
+        aggregated.instance_data = data
+        self.check_feasible(aggregated.run(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# Python STL
+import unittest
+
+# Packages
+import numpy as np
+import scipy.sparse as sp
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal, NGBNormal, XGBQuantile
+
+# Objects of test
+from surgeryschedulingunderuncertainty.compiled_ensemble import CompiledEnsemble
+
+
+def make_patients(quantity, seed = 0):
+    rng = np.random.default_rng(seed)
+    features = np.hstack([rng.uniform(0, 1, (quantity, 2)), rng.integers(0, 2, (quantity, 3))])
+    targets = np.exp(4 + features[:, 0] + 0.5 * features[:, 2] + rng.normal(0, 0.1 + 0.2 * features[:, 1], quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=10, features=features[id], target=targets[id])
+            for id in range(quantity)]
+
+
+class TestCompiledEnsemble(unittest.TestCase):
+
+    def assert_same_distribution(self, model, features):
+        expected = model._model.pred_dist(features).params
+        compiled = CompiledEnsemble.from_ngboost(model._model).pred_dist(features).params
+        for name in expected:
+            np.testing.assert_allclose(compiled[name], expected[name], rtol=1e-9, atol=1e-9)
+
+    def test_log_normal(self):
+        model = NGBLogNormal(patients=make_patients(300), hyperparameters={'n_estimators': 60})
+        self.assert_same_distribution(model, model._extract_features(make_patients(500, seed=1)))
+
+    def test_deep_trees(self):
+        """ Deep trees are partly descended by indexing, leaves are above the last level. """
+        model = NGBNormal(patients=make_patients(300), hyperparameters={'n_estimators': 30, 'max_depth': 6})
+        compiled = CompiledEnsemble.from_ngboost(model._model)
+        self.assertGreater(compiled.depth, CompiledEnsemble.SELECT_MAX_DEPTH)
+        self.assert_same_distribution(model, model._extract_features(make_patients(500, seed=1)))
+
+    def test_sparse_and_missing_features(self):
+        model = NGBLogNormal(patients=make_patients(300), hyperparameters={'n_estimators': 30})
+        features = model._extract_features(make_patients(200, seed=1))
+
+        self.assert_same_distribution(model, sp.csr_matrix(features))
+
+        features[::3, 0] = np.nan
+        self.assert_same_distribution(model, features)
+
+    def test_chunks(self):
+        model = NGBLogNormal(patients=make_patients(100), hyperparameters={'n_estimators': 20})
+        compiled = CompiledEnsemble.from_ngboost(model._model)
+        features = model._extract_features(make_patients(50, seed=1))
+        np.testing.assert_allclose(compiled.pred_param(features, chunk_elements=1), compiled.pred_param(features))
+
+    def test_compiled_model(self):
+        model = NGBLogNormal(patients=make_patients(100), hyperparameters={'n_estimators': 20})
+        patients = make_patients(10, seed=1)
+        expected = model.predict_batch(patients).nominal_values
+
+        model.compile()
+        self.assertIsNotNone(model._compiled)
+        np.testing.assert_allclose(model.predict_batch(patients).nominal_values, expected, rtol=1e-9)
+
+        model.train(force=True)
+        self.assertIsNone(model._compiled)
+
+        with self.assertRaises(ValueError):
+            XGBQuantile(patients=make_patients(100), hyperparameters={'max_iter': 5}).compile()
+
+
+if __name__ == '__main__':
+    unittest.main()
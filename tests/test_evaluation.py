@@ -0,0 +1,116 @@
+# Python STL
+import types
+import unittest
+
+# Packages
+import numpy as np
+import scipy.stats as ss
+
+# Modules
+from surgeryschedulingunderuncertainty.block import ScheduleBlock
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.uncertainty_profile import (
+    LogNormalDistribution,
+    NormalDistribution,
+    TabulatedQuantileDistribution,
+    BalancedHistogramModel,
+    sample_profiles,
+)
+
+# Objects of test
+from surgeryschedulingunderuncertainty.evaluation import ScheduleEvaluator
+
+
+def make_block(order, duration, profiles, urgencies = None):
+    block = ScheduleBlock(duration=duration, equipes=['A'], room='R1', weekday=order % 5, order_in_day=0,
+                          order_in_week=0, order_in_schedule=order)
+    for number, profile in enumerate(profiles):
+        urgency = urgencies[number] if urgencies else 1
+        block.add_patient(Patient(id=100 * order + number, equipe='A', urgency=urgency, days_waiting=0,
+                                  uncertainty_profile=profile))
+    return block
+
+
+class TestSampleProfiles(unittest.TestCase):
+
+    def test_shape_and_moments(self):
+        np.random.seed(0)
+        levels = [0.1, 0.5, 0.9]
+        profiles = [NormalDistribution(param_loc=60, param_scale=5),
+                    TabulatedQuantileDistribution(levels=levels, values=[10, 20, 30]),
+                    NormalDistribution(param_loc=120, param_scale=1),
+                    TabulatedQuantileDistribution(levels=levels, values=[40, 50, 60]),
+                    BalancedHistogramModel(values=[30, 40, 50])]
+        samples = sample_profiles(profiles, 20000)
+
+        self.assertEqual(samples.shape, (20000, 5))
+        np.testing.assert_allclose(samples[:, [0, 2]].mean(axis=0), [60, 120], atol=0.2)
+        np.testing.assert_allclose(np.median(samples[:, [1, 3]], axis=0), [20, 50], atol=0.5)
+        self.assertTrue(np.all((samples[:, 4] > 20) & (samples[:, 4] < 60)))
+
+
+class TestScheduleEvaluator(unittest.TestCase):
+
+    def test_normal_blocks(self):
+        # Sums of normal durations are normal: compare with the exact metrics
+        blocks = [make_block(0, 240, [NormalDistribution(100, 10), NormalDistribution(130, 20)]),
+                  make_block(1, 240, [NormalDistribution(90, 10)]),
+                  make_block(2, 180, [])]
+        evaluator = ScheduleEvaluator(types.SimpleNamespace(blocks=blocks), n_scenarios=100_000,
+                                      chunk_size=30_000, seed=0)
+        result = evaluator.run()
+
+        total = ss.norm(loc=230, scale=np.sqrt(500))
+        self.assertAlmostEqual(result['overtime_probability'][0], total.sf(240), delta=0.005)
+        expected_overtime = ss.norm(0, 1).pdf(10 / np.sqrt(500)) * np.sqrt(500) - 10 * total.sf(240)
+        self.assertAlmostEqual(result['expected_overtime'][0], expected_overtime, delta=0.1)
+        self.assertAlmostEqual(result['expected_undertime'][1], 150, delta=0.2)
+        self.assertAlmostEqual(result['utilization_mean'][0], 230 / 240, delta=0.002)
+        self.assertAlmostEqual(result['utilization_q50'][0], 230 / 240, delta=0.011)
+
+        # The empty block is idle
+        self.assertEqual(result['overtime_probability'][2], 0)
+        self.assertEqual(result['expected_undertime'][2], 180)
+        self.assertEqual(list(result['num_of_patients']), [2, 1, 0])
+
+        summary = evaluator.summary
+        self.assertEqual(summary['n_scenarios'], 100_000)
+        self.assertAlmostEqual(summary['overtime_probability'], result['overtime_probability'][0], delta=0.002)
+        self.assertAlmostEqual(summary['expected_undertime'], result['expected_undertime'].sum(), delta=1e-6)
+        self.assertAlmostEqual(summary['utilization_mean'], 320 / 660, delta=0.002)
+        # Exact quantile: only the first block has overtime
+        self.assertAlmostEqual(summary['overtime_q90'], total.ppf(0.9) - 240, delta=0.3)
+
+    def test_overtime_tolerance(self):
+        blocks = [make_block(0, 100, [LogNormalDistribution(param_s=20, param_scale=100)])]
+        strict = ScheduleEvaluator(types.SimpleNamespace(blocks=blocks), n_scenarios=5000, seed=1).run()
+        tolerant = ScheduleEvaluator(types.SimpleNamespace(blocks=blocks), n_scenarios=5000, seed=1,
+                                     overtime_tolerance=30).run()
+        self.assertLess(tolerant['overtime_probability'][0], strict['overtime_probability'][0])
+        # Same scenarios: the expected overtime does not depend on the tolerance
+        self.assertAlmostEqual(tolerant['expected_overtime'][0], strict['expected_overtime'][0])
+
+    def test_chunks_do_not_change_the_result(self):
+        blocks = [make_block(b, 240, [NormalDistribution(60 + 10 * i, 10) for i in range(b % 4)]) for b in range(8)]
+        schedule = types.SimpleNamespace(blocks=blocks)
+        whole = ScheduleEvaluator(schedule, n_scenarios=2000, chunk_size=2000, seed=3)
+        chunked = ScheduleEvaluator(schedule, n_scenarios=2000, chunk_size=300, seed=3)
+        self.assertEqual(whole.run().shape, chunked.run().shape)
+        self.assertAlmostEqual(whole.summary['utilization_mean'], chunked.summary['utilization_mean'], delta=0.01)
+
+
+class TestScheduleBlockMetrics(unittest.TestCase):
+
+    def test_proportion_urgency(self):
+        block = make_block(0, 240, [NormalDistribution(60, 5)] * 4, urgencies=[1, 3, 1, 2])
+        self.assertEqual(block.proportion_urgency(), {1: 0.5, 2: 0.25, 3: 0.25})
+
+    def test_metric_undertime(self):
+        np.random.seed(0)
+        block = make_block(0, 240, [NormalDistribution(60, 1), NormalDistribution(80, 1)])
+        self.assertAlmostEqual(block.metric_undertime(), 100, delta=0.1)
+        self.assertEqual(make_block(1, 240, []).metric_undertime(), 240)
+
+
+if __name__ == '__main__':
+    unittest.main()
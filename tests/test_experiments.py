@@ -0,0 +1,119 @@
+# Python STL
+import os
+import tempfile
+import unittest
+
+# Packages
+import pandas as pd
+
+# Modules
+from surgeryschedulingunderuncertainty.master import Master
+from surgeryschedulingunderuncertainty.scheduler import Scheduler
+from surgeryschedulingunderuncertainty.synthetic import synthetic_history, synthetic_master, URGENCY_TO_MAX_WAITING_DAYS
+
+# Objects of test
+from surgeryschedulingunderuncertainty.experiments import ExperimentRunner, cell_key
+
+
+def make_scheduler():
+    """ A small overtime: the time increment of the budget set is the block duration times the overtime over gamma. """
+    return Scheduler(historical_data=synthetic_history(400, num_of_equipes=2, seed=0),
+                     master_schedule=Master(table=synthetic_master(5, num_of_equipes=2, seed=0)),
+                     num_of_patients=15,
+                     num_patients_training=150,
+                     robustness_risk=0.2,
+                     robustness_overtime=0.1,
+                     urgency_to_max_waiting_days=URGENCY_TO_MAX_WAITING_DAYS,
+                     hyperparameters={'n_estimators': 50})
+
+
+GRID = {'optimizer_type': ['vanilla', 'budget_set'], 'robustness_risk': [0.1, 0.3]}
+
+
+class TestExperimentRunner(unittest.TestCase):
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            runner = ExperimentRunner(make_scheduler(), GRID, os.path.join(directory, 'results.csv'), n_scenarios=500)
+            results = runner.run()
+
+            self.assertEqual(len(results), 4)
+            self.assertTrue((results['status'] == 'ok').all())
+            self.assertEqual(list(results['optimizer_type']), ['vanilla', 'vanilla', 'budget_set', 'budget_set'])
+            self.assertTrue((results['scheduled_patients'] > 0).all())
+            self.assertTrue(results['overtime_probability'].between(0, 1).all())
+            self.assertEqual(len(pd.read_csv(runner.output)), 4)
+
+    def test_every_grid_parameter_reaches_the_scheduler(self):
+        scheduler = make_scheduler()
+        for name in ['robustness_risk', 'robustness_overtime', 'num_of_weeks', 'gamma_max', 'optimizer_type']:
+            self.assertTrue(isinstance(getattr(type(scheduler), name), property), name)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.csv')
+            runner = ExperimentRunner(make_scheduler(), GRID, output, n_scenarios=0)
+
+            # A completed cell, with a sentinel result, and a failed one
+            first, second = runner.cells[:2]
+            pd.DataFrame([{'cell': cell_key(first, runner.fingerprint), **first, 'status': 'ok', 'scheduled_patients': -1},
+                          {'cell': cell_key(second, runner.fingerprint), **second, 'status': 'error', 
+                           'scheduled_patients': -1}]
+                         ).to_csv(output, index=False)
+
+            results = runner.run()
+            self.assertEqual(len(results), 4)
+            self.assertEqual(results['scheduled_patients'].iloc[0], -1)
+            self.assertGreater(results['scheduled_patients'].iloc[1], 0)
+            self.assertTrue((results['status'] == 'ok').all())
+
+    def test_fingerprint(self):
+        fingerprint = ExperimentRunner(make_scheduler(), GRID, 'results.csv').fingerprint
+
+        # The grid parameters are not in the fingerprint
+        scheduler = make_scheduler()
+        scheduler.robustness_risk = 0.5
+        scheduler.optimizer_type = 'budget_set'
+        self.assertEqual(ExperimentRunner(scheduler, GRID, 'results.csv').fingerprint, fingerprint)
+
+        # The other parameters are
+        scheduler = make_scheduler()
+        scheduler.num_of_patients = 10
+        self.assertNotEqual(ExperimentRunner(scheduler, GRID, 'results.csv').fingerprint, fingerprint)
+        scheduler = make_scheduler()
+        scheduler.gamma_max = 5
+        self.assertNotEqual(ExperimentRunner(scheduler, GRID, 'results.csv').fingerprint, fingerprint)
+        scheduler = make_scheduler()
+        scheduler.backend = 'matrix'
+        self.assertNotEqual(ExperimentRunner(scheduler, GRID, 'results.csv').fingerprint, fingerprint)
+        self.assertNotEqual(ExperimentRunner(make_scheduler(), GRID, 'results.csv', n_scenarios=10).fingerprint,
+                            fingerprint)
+
+    def test_other_scheduler_does_not_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.csv')
+            ExperimentRunner(make_scheduler(), GRID, output, n_scenarios=0).run()
+
+            scheduler = make_scheduler()
+            scheduler.num_of_patients = 10
+            results = ExperimentRunner(scheduler, GRID, output, n_scenarios=0).run()
+            
+            # The four cells of the second scheduler are run, those of the first are dropped
+            self.assertEqual(len(results), 4)
+            self.assertTrue((results['scheduled_patients'] <= 10).all())
+            self.assertEqual(len(pd.read_csv(output)), 4)
+
+    def test_process_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            serial = ExperimentRunner(make_scheduler(), GRID, os.path.join(directory, 'serial.csv'), n_scenarios=0).run()
+            parallel = ExperimentRunner(make_scheduler(), GRID, os.path.join(directory, 'parallel.csv'),
+                                        max_workers=2, n_scenarios=0).run()
+            self.assertEqual(list(parallel['scheduled_patients']), list(serial['scheduled_patients']))
+
+    def test_unknown_parameter(self):
+        with self.assertRaises(ValueError):
+            ExperimentRunner(make_scheduler(), {'temperature': [1, 2]}, 'results.csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
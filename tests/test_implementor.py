@@ -0,0 +1,81 @@
+# Python STL
+import unittest
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+
+# Objects of test
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor
+
+
+def make_instance_data(seed = 0, n_blocks = 4, n_pats = 8, compatibility = None):
+    rng = np.random.default_rng(seed)
+    if compatibility is None:
+        compatibility = np.ones((n_blocks, n_pats), dtype=int)
+    return {None: {
+        'n_days': {None: 2},
+        'n_rooms': {None: 2},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: int(rng.choice([120, 240])) for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): int(compatibility[b, i]) for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: float(rng.uniform(30, 150)) for i in range(n_pats)},
+        'u': {i + 1: float(rng.integers(1, 4)) for i in range(n_pats)},
+        'w': {i + 1: float(rng.integers(0, 30)) for i in range(n_pats)},
+        'l': {i + 1: float(rng.integers(1, 60)) for i in range(n_pats)},
+    }}
+
+
+def solve(implementor, instance_data):
+    implementor.instance_data = instance_data
+    instance = implementor.run()
+    return pyo.value(instance.obj), instance
+
+
+class TestInstanceReuse(unittest.TestCase):
+
+    def test_same_solutions_as_new_instances(self):
+        reused = StandardImplementor(reuse_instances=True)
+        for seed in range(3):
+            data = make_instance_data(seed=seed)
+            expected, _ = solve(StandardImplementor(), data)
+            objective, _ = solve(reused, data)
+            self.assertAlmostEqual(objective, expected)
+
+        # A single instance, its parameters updated every time
+        self.assertEqual(len(reused._instances), 1)
+
+    def test_new_instance_for_new_structure(self):
+        reused = StandardImplementor(reuse_instances=True)
+        _, first = solve(reused, make_instance_data())
+        compatibility = np.ones((4, 8), dtype=int)
+        compatibility[0, :4] = 0
+        _, second = solve(reused, make_instance_data(compatibility=compatibility))
+        _, third = solve(reused, make_instance_data(seed=1))
+
+        self.assertIsNot(first, second)
+        self.assertIs(first, third)
+        self.assertEqual(len(reused._instances), 2)
+
+    def test_without_reuse(self):
+        implementor = StandardImplementor()
+        _, first = solve(implementor, make_instance_data())
+        _, second = solve(implementor, make_instance_data())
+        self.assertIsNot(first, second)
+        self.assertEqual(len(implementor._instances), 0)
+
+    def test_instance(self):
+        implementor = StandardImplementor()
+        self.assertIsNone(implementor.instance)
+        _, instance = solve(implementor, make_instance_data())
+        self.assertIs(implementor.instance, instance)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# Python STL
+import json
+import os
+import tempfile
+import unittest
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty import instrumentation
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor
+
+# Objects of test
+from surgeryschedulingunderuncertainty.instrumentation import Profiler, span, count, traced
+
+
+@traced
+def allocate(size):
+    return np.ones(size)
+
+
+def make_instance_data(n_blocks = 4, n_pats = 8):
+    rng = np.random.default_rng(0)
+    return {None: {
+        'n_days': {None: 2},
+        'n_rooms': {None: 2},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: int(rng.choice([120, 240])) for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): 1 for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: float(rng.uniform(30, 150)) for i in range(n_pats)},
+        'u': {i + 1: float(rng.integers(1, 4)) for i in range(n_pats)},
+        'w': {i + 1: float(rng.integers(0, 30)) for i in range(n_pats)},
+        'l': {i + 1: float(rng.integers(1, 60)) for i in range(n_pats)},
+    }}
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertFalse(instrumentation.enabled())
+        with span('outer') as outer:
+            outer.set(value=1)
+        count('things')
+        self.assertEqual(allocate(3).sum(), 3)
+        self.assertIsNone(instrumentation.active_profiler())
+
+    def test_spans_and_counters(self):
+        with Profiler() as profiler:
+            self.assertIs(instrumentation.active_profiler(), profiler)
+            with span('outer.section', iteration=1) as outer:
+                allocate(10)
+                count('things', 2)
+                outer.set(robust=True)
+            count('things')
+        self.assertFalse(instrumentation.enabled())
+
+        inner, outer = profiler.spans
+        self.assertEqual(inner['name'], 'allocate')
+        self.assertEqual(inner['category'], 'test_instrumentation')
+        self.assertEqual((inner['depth'], inner['parent']), (1, 'outer.section'))
+        self.assertEqual((outer['category'], outer['iteration'], outer['robust']), ('outer', 1, True))
+        self.assertLessEqual(outer['start'], inner['start'])
+        self.assertGreaterEqual(outer['wall'], inner['wall'])
+        self.assertEqual(profiler.counters, {'things': 3})
+
+        summary = profiler.summary()
+        self.assertEqual(list(summary['name']), ['outer.section', 'allocate'])
+        self.assertEqual(list(summary['calls']), [1, 1])
+
+    def test_exception_is_recorded(self):
+        with Profiler() as profiler:
+            with self.assertRaises(ValueError):
+                with span('failing'):
+                    raise ValueError()
+        self.assertEqual(profiler.spans[0]['error'], 'ValueError')
+
+    def test_traced_memory(self):
+        with Profiler(trace_memory=True) as profiler:
+            with span('outer'):
+                allocate(100_000)
+                with span('small'):
+                    allocate(10)
+            profiler.snapshot('end', top=3)
+        large, _, small, outer = profiler.spans
+        # 100000 floats: 0.76 MB, kept as peak of the outer span after the inner ones reset it
+        self.assertGreater(large['traced_peak_mb'], 0.7)
+        self.assertGreater(outer['traced_peak_mb'], 0.7)
+        self.assertLess(small['traced_peak_mb'], 0.1)
+        self.assertEqual(len(profiler.snapshots[0]['top']), 3)
+
+    def test_exports(self):
+        with Profiler() as profiler:
+            with span('outer'):
+                count('things')
+        trace = profiler.chrome_trace()
+        phases = [event['ph'] for event in trace['traceEvents']]
+        self.assertEqual(phases, ['X', 'C'])
+        self.assertEqual(trace['traceEvents'][1]['args'], {'things': 1})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            profiler.write_chrome_trace(path)
+            with open(path) as file:
+                self.assertEqual(len(json.load(file)['traceEvents']), 2)
+
+            path = os.path.join(directory, 'log.jsonl')
+            profiler.write_log(path)
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual([record['type'] for record in records], ['span', 'counter'])
+
+    def test_implementor(self):
+        for backend in ['pyomo', 'matrix']:
+            implementor = StandardImplementor(backend=backend)
+            implementor.instance_data = make_instance_data()
+            with Profiler() as profiler:
+                implementor.run()
+            names = [record['name'] for record in profiler.spans]
+            self.assertIn('Implementor.build', names)
+            self.assertIn('Implementor.solve', names)
+            self.assertIn('pyomo.create_instance' if backend == 'pyomo' else 'matrix.assemble', names)
+            self.assertEqual(profiler.counters['implementor.solves'], 1)
+            self.assertGreaterEqual(profiler.counters['implementor.variables'], 4 * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Python STL
+import types
+import unittest
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, ChanceConstraintsImplementor, BSImplementor
+
+# Objects of test
+from surgeryschedulingunderuncertainty.matrix_model import MatrixModel, instance_array
+
+
+def make_instance_data(seed = 0, n_blocks = 6, n_pats = 15, n_realizations = 2):
+    rng = np.random.default_rng(seed)
+    compatibility = rng.random((n_blocks, n_pats)) < 0.6
+    return {None: {
+        'n_days': {None: 3},
+        'n_rooms': {None: 2},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: n_realizations},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: int(rng.choice([120, 240])) for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): int(compatibility[b, i]) for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: float(rng.uniform(30, 150)) for i in range(n_pats)},
+        'u': {i + 1: float(rng.integers(1, 4)) for i in range(n_pats)},
+        'w': {i + 1: float(rng.integers(0, 30)) for i in range(n_pats)},
+        'l': {i + 1: float(rng.integers(1, 60)) for i in range(n_pats)},
+        'f': {i + 1: float(rng.uniform(30, 180)) for i in range(n_pats)},
+        'eps': {(i + 1, k + 1): float(rng.uniform(0, 30)) for i in range(n_pats) for k in range(n_realizations)},
+        'gamma': {b + 1: int(rng.integers(1, 4)) for b in range(n_blocks)},
+        'time_increment': {b + 1: float(rng.uniform(5, 40)) for b in range(n_blocks)},
+    }}
+
+
+def solve(implementor, instance_data):
+    implementor.instance_data = instance_data
+    return implementor.run()
+
+
+class TestMatrixBackend(unittest.TestCase):
+
+    def check_same_objective(self, make_implementor, drop = (), n_realizations = 2):
+        for seed in range(3):
+            data = make_instance_data(seed=seed, n_realizations=n_realizations)
+            data = {None: {name: value for name, value in data[None].items() if name not in drop}}
+
+            expected = pyo.value(solve(make_implementor('pyomo'), data).obj)
+            solution = solve(make_implementor('matrix'), data)
+            self.assertAlmostEqual(solution.obj(), expected, places=6)
+
+            # The solution is read as a Pyomo instance, each patient in at most one compatible block
+            x = np.array([[solution.x[b + 1, i + 1]() for i in range(15)] for b in range(6)])
+            self.assertTrue(np.all(x.sum(axis=0) <= 1))
+            self.assertTrue(np.all(x <= instance_array(data[None]['a'], (6, 15))))
+
+    def test_standard(self):
+        self.check_same_objective(lambda backend: StandardImplementor(backend=backend), drop=['f', 'gamma', 'time_increment'])
+
+    def test_chance_constraints(self):
+        # The model has no eps parameter, so no realizations
+        task = types.SimpleNamespace(robustness_overtime=10)
+        self.check_same_objective(lambda backend: ChanceConstraintsImplementor(task=task, backend=backend),
+                                  drop=['eps', 'gamma', 'time_increment'], n_realizations=0)
+
+    def test_budget_set(self):
+        self.check_same_objective(lambda backend: BSImplementor(task=None, backend=backend),
+                                  drop=['f', 'eps'])
+
+    def test_update_parameters(self):
+        data = make_instance_data()
+        implementor = BSImplementor(task=None, backend='matrix')
+        solve(implementor, data)
+
+        gamma = {b + 1: 3 for b in range(6)}
+        implementor.update_parameters({'gamma': gamma})
+        objective = implementor.solve(warmstart=True).obj()
+
+        data[None]['gamma'] = gamma
+        expected = pyo.value(solve(BSImplementor(task=None), data).obj)
+        self.assertAlmostEqual(objective, expected, places=6)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            StandardImplementor(backend='gurobi')
+
+
+class TestMatrixModel(unittest.TestCase):
+
+    def test_small_model(self):
+        # max x + 2y, x + y <= 1.5, x integer, y <= 0.8
+        model = MatrixModel()
+        x = model.add_variable('x', (1,), upper=1, integer=True)
+        y = model.add_variable('y', (1,), upper=0.8)
+        model.add_cost('x', -1.)
+        model.add_cost('y', -2.)
+        model.add_constraints(rows=[0, 0], columns=[x[0], y[0]], values=1., upper=[1.5])
+
+        solution = model.solve()
+        self.assertAlmostEqual(solution.obj(), -2.)
+        self.assertEqual(solution.x[1](), 1.)
+        self.assertAlmostEqual(solution.y[1](), 0.5)
+        self.assertEqual(model.matrix().shape, (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
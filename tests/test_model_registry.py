@@ -0,0 +1,63 @@
+# Python STL
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal
+
+# Objects of test
+from surgeryschedulingunderuncertainty.model_registry import ModelRegistry
+
+
+def make_patients(quantity, seed = 0):
+    rng = np.random.default_rng(seed)
+    features = rng.uniform(0, 1, (quantity, 3))
+    targets = np.exp(4 + features[:, 0] + rng.normal(0, 0.1, quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=10, features=features[id], target=targets[id])
+            for id in range(quantity)]
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.hyperparameters = {'n_estimators': 10}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_model_is_fitted_once(self):
+        """ The same fingerprint gives back the fitted model, in memory and from disk. """
+        registry = ModelRegistry(directory=self.directory.name)
+        model = registry.get_model(NGBLogNormal, make_patients(30), hyperparameters=self.hyperparameters)
+
+        self.assertTrue(model.trained)
+        self.assertEqual(os.listdir(self.directory.name), [f"{model.fingerprint()}.pkl"])
+
+        with patch('ngboost.NGBRegressor.fit') as mock_fit:
+            same = registry.get_model(NGBLogNormal, make_patients(30), hyperparameters=self.hyperparameters)
+            self.assertIs(same, model)
+
+            from_disk = ModelRegistry(directory=self.directory.name) \
+                .get_model(NGBLogNormal, make_patients(30), hyperparameters=self.hyperparameters)
+            self.assertTrue(from_disk.trained)
+
+            mock_fit.assert_not_called()
+
+    def test_different_data_is_fitted(self):
+        registry = ModelRegistry()
+        first = registry.get_model(NGBLogNormal, make_patients(30), hyperparameters=self.hyperparameters)
+        second = registry.get_model(NGBLogNormal, make_patients(30, seed=1), hyperparameters=self.hyperparameters)
+
+        self.assertIsNot(first, second)
+        self.assertNotEqual(first.fingerprint(), second.fingerprint())
+
+
+if __name__ == '__main__':
+    unittest.main()
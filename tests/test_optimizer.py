@@ -0,0 +1,305 @@
+# Python STL
+import contextlib
+import io
+import json
+import os
+import tempfile
+import types
+import unittest
+import warnings
+
+# Packages
+import numpy as np
+import scipy.stats as ss
+
+# Modules
+from surgeryschedulingunderuncertainty.block import MasterBlock
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.uncertainty_profile import NormalDistribution, LogNormalDistribution
+from surgeryschedulingunderuncertainty.master import Master
+from surgeryschedulingunderuncertainty.task import Task
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, BSImplementor
+from surgeryschedulingunderuncertainty.synthetic import synthetic_master
+
+# Objects of test
+from surgeryschedulingunderuncertainty.optimizer import BudgetSet, ImplementorAdversary
+
+
+def make_task(seed = 0, gamma_max = 10, risk = 0.2):
+    rng = np.random.default_rng(seed)
+    equipes = [['A'], ['B'], ['A', 'B'], ['C'], ['A']]
+    blocks = [MasterBlock(duration=float(rng.choice([240, 360, 480])), equipes=equipes[i % 5], room='R1', 
+                          weekday=i, order_in_day=1, order_in_master=i)
+              for i in range(10)]
+    patients = [Patient(id=i, equipe=rng.choice(['A', 'B']), urgency=1, days_waiting=0,
+                        uncertainty_profile=NormalDistribution(float(rng.uniform(30, 150)), 10.))
+                for i in range(25)]
+    return types.SimpleNamespace(master_schedule=types.SimpleNamespace(blocks=blocks), patients=patients,
+                                 gamma_max=gamma_max, robustness_overtime=30, robustness_risk=risk)
+
+
+def loop_calibration(task):
+    """ The block by block, gamma by gamma calibration, as reference. """
+    expected = []
+    for block in task.master_schedule.blocks:
+        times = [patient.uncertainty_profile.nominal_value for patient in task.patients if patient.equipe in block.equipes]
+        mean, std = np.mean(times), np.std(times)/len(times)
+        row = {'mean': mean, 'std': std, 'gamma': np.nan, 'time_increment': np.nan}
+        for gamma in range(2, task.gamma_max + 1):
+            if 1 - ss.norm(loc=gamma*mean, scale=std).cdf(block.duration + task.robustness_overtime) > task.robustness_risk:
+                row.update({'gamma': gamma - 1, 'time_increment': block.duration*task.robustness_overtime/(gamma - 1)})
+        expected.append(row)
+    return expected
+
+
+class TestBudgetSetCalibration(unittest.TestCase):
+
+    def test_same_values_as_loop(self):
+        for seed in range(5):
+            task = make_task(seed=seed, gamma_max=3 + 2*seed)
+            table = BudgetSet(task=task, implementor=None).calibrate()
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                expected = loop_calibration(task)
+
+            for (_, row), reference in zip(table.iterrows(), expected):
+                for column in ['mean', 'std', 'gamma', 'time_increment']:
+                    if np.isnan(reference[column]):
+                        self.assertTrue(np.isnan(row[column]))
+                    else:
+                        self.assertEqual(row[column], reference[column])
+
+    def test_blocks_without_compatible_patients(self):
+        table = BudgetSet(task=make_task(), implementor=None).calibrate()
+        self.assertTrue(table.iloc[3].isna().all())
+
+    def test_cached_table(self):
+        task = make_task()
+        first = BudgetSet(task=task, implementor=None).calibrate()
+        second = BudgetSet(task=make_task(), implementor=None).calibrate()
+        self.assertTrue(first.equals(second))
+
+        task.patients[0].uncertainty_profile = NormalDistribution(1000., 10.)
+        third = BudgetSet(task=task, implementor=None).calibrate()
+        self.assertFalse(first.equals(third))
+
+    def test_explicit_zero_values(self):
+        """ A risk or gamma_max of 0 is used, not replaced by the one of the task. """
+        optimizer = BudgetSet(task=make_task(risk=1.), implementor=None)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            no_risk = optimizer.calibrate(robustness_risk=0.)
+            no_gamma = optimizer.calibrate(gamma_max=0)
+
+        self.assertTrue(optimizer.calibrate()['gamma'].isna().all())
+        self.assertTrue((no_risk['gamma'].dropna() == 9).all())
+        self.assertEqual(no_risk['gamma'].notna().sum(), 8)
+        self.assertTrue(no_gamma['gamma'].isna().all())
+
+
+def make_sweep_task(seed = 0, num_of_patients = 30, backend = 'pyomo'):
+    """ 
+    Patients of equipes A and B, blocks of A, B and C: the blocks of C have no
+    budget set. The overtime is small, as the time increment of the calibration
+    is the block duration times the overtime over gamma.
+    """
+    rng = np.random.default_rng(seed)
+    patients = [Patient(id=i, equipe=str(rng.choice(['A', 'B'])), urgency=int(rng.integers(0, 3)), 
+                        days_waiting=int(rng.integers(0, 30)),
+                        uncertainty_profile=NormalDistribution(float(rng.uniform(60, 150)), 30.))
+                for i in range(num_of_patients)]
+    task = Task(name='sweep', num_of_weeks=1, num_of_patients=num_of_patients, robustness_risk=0.2, 
+                robustness_overtime=0.1, urgency_to_max_waiting_days={0: 30, 1: 60, 2: 180}, gamma_max=8)
+    task.patients = patients
+    task.master_schedule = Master(table=synthetic_master(6, num_of_equipes=3, seed=4))
+    return task
+
+
+class TestBudgetSetSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.task = make_sweep_task()
+
+    def test_budget_set_data(self):
+        """ The instance gets the calibrated time increments, blocks without budget set get 0. """
+        optimizer = BudgetSet(task=self.task, implementor=None)
+        table = optimizer.calibrate()
+        optimizer.apply_calibration(table)
+        data = optimizer._budget_set_data()
+
+        self.assertTrue(table['gamma'].isna().any())
+        for b, row in enumerate(table.itertuples()):
+            if np.isnan(row.gamma):
+                self.assertEqual((data['gamma'][b + 1], data['time_increment'][b + 1]), (0, 0))
+            else:
+                self.assertEqual((data['gamma'][b + 1], data['time_increment'][b + 1]), (row.gamma, row.time_increment))
+
+    def test_apply_calibration(self):
+        """ By default the calibration of the task is applied. """
+        explicit = BudgetSet(task=make_sweep_task(), implementor=None)
+        explicit.apply_calibration(explicit.calibrate())
+        default = BudgetSet(task=self.task, implementor=None)
+        default.apply_calibration()
+        self.assertEqual(default._budget_set_data(), explicit._budget_set_data())
+
+    def test_sweep(self):
+        optimizer = BudgetSet(task=self.task, implementor=BSImplementor(task=self.task))
+        budget_sets = [dict(block.robustness_budget_set) for block in self.task.master_schedule.blocks]
+        curve = optimizer.sweep(robustness_risks=[0.01, 0.5], gammas_max=[4, 8], n_scenarios=500)
+
+        self.assertEqual(list(zip(curve['robustness_risk'], curve['gamma_max'])), 
+                         [(0.01, 4), (0.01, 8), (0.5, 4), (0.5, 8)])
+        self.assertTrue(((curve['overtime_risk'] >= 0) & (curve['overtime_risk'] <= 1)).all())
+        self.assertTrue((curve['overtime_risk'] >= curve['mean_overtime_risk']).all())
+        self.assertTrue((curve['scheduled_patients'] > 0).all())
+        self.assertEqual([dict(block.robustness_budget_set) for block in self.task.master_schedule.blocks], budget_sets)
+
+        # Each point as solved alone
+        single = BudgetSet(task=self.task, implementor=BSImplementor(task=self.task)).sweep(
+            robustness_risks=[0.5], gammas_max=[8], n_scenarios=500)
+        self.assertAlmostEqual(single['objective'][0], curve['objective'].iloc[-1])
+
+    def test_sweep_backends_and_workers(self):
+        points = {'robustness_risks': [0.01, 0.5], 'gammas_max': [4], 'n_scenarios': 200}
+        pyomo = BudgetSet(task=self.task, implementor=BSImplementor(task=self.task)).sweep(**points)
+        matrix = BudgetSet(task=self.task, implementor=BSImplementor(task=self.task, backend='matrix')).sweep(**points)
+        parallel = BudgetSet(task=self.task, implementor=BSImplementor(task=self.task, backend='matrix')).sweep(
+            max_workers=2, **points)
+
+        self.assertTrue(np.allclose(matrix['objective'], pyomo['objective']))
+        self.assertTrue(np.allclose(parallel['objective'], matrix['objective']))
+        self.assertTrue(matrix['overtime_risk'].notna().all())
+
+
+
+def make_fragile_task(seed = 0, num_of_patients = 40, robustness_risk = 0.01):
+    """ 
+    More and more uncertain patients than 5 blocks can hold: every block is
+    fragile at first, and with a low risk the adversary finds fragile blocks for
+    three iterations.
+    """
+    rng = np.random.default_rng(seed)
+    patients = [Patient(id=i, equipe=str(rng.choice(['A', 'B'])), urgency=int(rng.integers(0, 3)), 
+                        days_waiting=int(rng.integers(0, 30)),
+                        uncertainty_profile=LogNormalDistribution(param_s=60., param_scale=float(rng.uniform(60, 150))))
+                for i in range(num_of_patients)]
+    task = Task(name='fragile', num_of_weeks=1, num_of_patients=num_of_patients, robustness_risk=robustness_risk, 
+                robustness_overtime=10, urgency_to_max_waiting_days={0: 30, 1: 60, 2: 180})
+    task.patients = patients
+    task.master_schedule = Master(table=synthetic_master(5, num_of_equipes=2, seed=seed))
+    return task
+
+
+class TestImplementorAdversaryReport(unittest.TestCase):
+
+    def test_report(self):
+        np.random.seed(0)
+        task = make_fragile_task()
+        optimizer = ImplementorAdversary(task=task, implementor=StandardImplementor(), adversary=None)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            optimizer.run(max_loops=3)
+        report = optimizer.report
+
+        # Progress is recorded by the instrumentation spans, not printed
+        self.assertEqual(output.getvalue(), '')
+
+        self.assertEqual(list(report['iteration']), [1, 2, 3])
+        self.assertFalse(report['robust'].any())
+        self.assertTrue((report['fragile_blocks'] > 0).all())
+        # Realizations of an iteration are in the model of the next one
+        self.assertEqual(list(report['scenarios'][1:]), list((report['scenarios'] + report['scenarios_added'])[:-1]))
+        self.assertEqual(task.num_adversary_realizations, report['scenarios_added'].sum())
+        self.assertEqual(len(task.patients[0].adversary_realization), task.num_adversary_realizations)
+        self.assertTrue(report['constraints'].is_monotonic_increasing)
+        self.assertTrue((report['objective'] > 0).all())
+
+    def test_realizations_in_instance(self):
+        np.random.seed(0)
+        task = make_fragile_task()
+        implementor = StandardImplementor()
+        optimizer = ImplementorAdversary(task=task, implementor=implementor, adversary=None)
+        optimizer.run(max_loops=2)
+        optimizer.create_instance()
+        data = implementor.instance_data[None]
+
+        self.assertGreater(task.num_adversary_realizations, 0)
+        for i, patient in enumerate(task.patients):
+            self.assertEqual(data['l'][i + 1], patient.max_waiting_days)
+            for k, realization in enumerate(patient.adversary_realization):
+                self.assertEqual(data['eps'][i + 1, k + 1], realization)
+        self.assertGreater(len({value for value in data['eps'].values()}), 1)
+
+    def test_callback_stops(self):
+        np.random.seed(0)
+        iterations = []
+        def callback(metrics):
+            iterations.append(metrics)
+            return len(iterations) > 1 and metrics['fragile_blocks'] >= iterations[-2]['fragile_blocks']
+
+        optimizer = ImplementorAdversary(task=make_fragile_task(), implementor=StandardImplementor(), adversary=None)
+        schedule = optimizer.run(max_loops=5, callback=callback)
+
+        self.assertEqual(len(iterations), 3)
+        self.assertEqual(len(optimizer.report), 3)
+        self.assertEqual(len(schedule.blocks), 5)
+
+
+
+class TestImplementorAdversaryCheckpoint(unittest.TestCase):
+
+    def test_resume(self):
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'run.json')
+            first = make_fragile_task()
+            ImplementorAdversary(task=first, implementor=StandardImplementor(), adversary=None).run(
+                max_loops=2, checkpoint=checkpoint)
+
+            # A new process: a new task without realizations
+            task = make_fragile_task()
+            optimizer = ImplementorAdversary(task=task, implementor=StandardImplementor(), adversary=None)
+            schedule = optimizer.resume(checkpoint, max_loops=4)
+
+            with open(checkpoint) as file:
+                state = json.load(file)
+
+        self.assertEqual(list(optimizer.report['iteration']), [1, 2, 3, 4])
+        self.assertEqual(state['iteration'], 4)
+        # The realizations of the first run are kept, those of the resumed iterations added
+        self.assertEqual(task.patients[0].adversary_realization[:first.num_adversary_realizations],
+                         first.patients[0].adversary_realization)
+        self.assertEqual(task.num_adversary_realizations, optimizer.report['scenarios_added'].sum())
+        self.assertEqual(optimizer.report['scenarios'].iloc[2], first.num_adversary_realizations)
+        self.assertEqual(len(schedule.blocks), 5)
+
+    def test_resume_finished_run(self):
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'run.json')
+            optimizer = ImplementorAdversary(task=make_fragile_task(), implementor=StandardImplementor(), adversary=None)
+            schedule = optimizer.run(max_loops=2, checkpoint=checkpoint)
+
+            task = make_fragile_task()
+            resumed = ImplementorAdversary(task=task, implementor=StandardImplementor(), adversary=None)
+            incumbent = resumed.resume(checkpoint, max_loops=2)
+
+        self.assertEqual(len(resumed.report), 2)
+        self.assertEqual([[patient.id for patient in block.patients] for block in incumbent.blocks],
+                         [[patient.id for patient in block.patients] for block in schedule.blocks])
+
+    def test_set_adversary_realizations(self):
+        task = make_fragile_task(num_of_patients=3)
+        task.set_adversary_realizations({0: [1., 2.], 1: [3., 4.], 2: [5., 6.]})
+        self.assertEqual(task.num_adversary_realizations, 2)
+        self.assertEqual(task.patients[2].adversary_realization, [5., 6.])
+
+        with self.assertRaises(ValueError):
+            task.set_adversary_realizations({0: [1.], 1: [2.]})
+        with self.assertRaises(ValueError):
+            task.set_adversary_realizations({0: [1.], 1: [2.], 2: []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 # Python STL
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
@@ -6,15 +8,18 @@ from unittest.mock import patch
 from hypothesis import given, strategies as st
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 # Modules
 from surgeryschedulingunderuncertainty.patient import Patient
 from surgeryschedulingunderuncertainty.task import Task
+from surgeryschedulingunderuncertainty.historical_store import HistoricalDataStore
 
 # Objects of test
 from surgeryschedulingunderuncertainty.patients_provider import (
     Patient,
-    PatientsFromHistoricalDataProvider
+    PatientsFromHistoricalDataProvider,
+    PatientsFromHistoricalStoreProvider
 )
 
 
@@ -141,5 +146,159 @@ class TestNormalDistribution(unittest.TestCase):
 
 
 
+class TestHistoricalDataCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.historical_data = pd.DataFrame({
+            'equipe': rng.choice(['A', 'B', 'C'], 50),
+            'procedure': rng.choice(['p1', 'p2', 'p3'], 50),
+            'age': rng.integers(20, 90, 50),
+            'urgency': rng.integers(0, 3, 50),
+            'days_waiting': rng.integers(0, 60, 50),
+            'target': rng.uniform(30, 300, 50),
+        })
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_cache_hit_matches_fresh_encoding(self):
+        """ A provider built from the cache holds the same data as a fresh one. """
+        fresh = PatientsFromHistoricalDataProvider(historical_data=self.historical_data)
+        first = PatientsFromHistoricalDataProvider(historical_data=self.historical_data, cache_dir=self.cache_dir.name)
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 2)
+
+        with patch('surgeryschedulingunderuncertainty.patients_provider.OneHotEncoder') as mock_encoder:
+            second = PatientsFromHistoricalDataProvider(historical_data=self.historical_data, cache_dir=self.cache_dir.name)
+            mock_encoder.assert_not_called()
+
+        pd.testing.assert_frame_equal(fresh.historical_data, first.historical_data)
+        pd.testing.assert_frame_equal(fresh.historical_data, second.historical_data)
+        self.assertEqual(first.encoder_categories, second.encoder_categories)
+
+    def test_cache_hit_memory(self):
+        """ The sparse features stay memory-mapped, the dense dataframe holds a copy. """
+        def memory_mapped(array):
+            while array is not None:
+                if isinstance(array, np.memmap):
+                    return True
+                array = array.base
+            return False
+
+        for sparse_features in (False, True):
+            PatientsFromHistoricalDataProvider(historical_data=self.historical_data, cache_dir=self.cache_dir.name,
+                                               sparse_features=sparse_features)
+            provider = PatientsFromHistoricalDataProvider(historical_data=self.historical_data, 
+                                                          cache_dir=self.cache_dir.name, sparse_features=sparse_features)
+            if sparse_features:
+                self.assertTrue(memory_mapped(provider._encoded_features.data))
+            else:
+                self.assertFalse(memory_mapped(provider.historical_data['procedure_p2'].values))
+                self.assertTrue(provider.historical_data['procedure_p2'].values.flags.writeable)
+
+    def test_cache_key_depends_on_content(self):
+        """ Changing the data creates a new cache entry. """
+        PatientsFromHistoricalDataProvider(historical_data=self.historical_data, cache_dir=self.cache_dir.name)
+        changed = self.historical_data.copy()
+        changed.loc[0, 'procedure'] = 'p9'
+        provider = PatientsFromHistoricalDataProvider(historical_data=changed, cache_dir=self.cache_dir.name)
+
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 4)
+        self.assertIn('procedure_p9', provider.historical_data.columns)
+
+
+class TestSparseFeatures(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.historical_data = pd.DataFrame({
+            'equipe': rng.choice(['A', 'B', 'C'], 50),
+            'procedure': rng.choice(['p1', 'p2', 'p3'], 50),
+            'age': rng.integers(20, 90, 50),
+            'urgency': rng.integers(0, 3, 50),
+            'days_waiting': rng.integers(0, 60, 50),
+            'target': rng.uniform(30, 300, 50),
+        })
+
+    def test_sparse_features_match_dense(self):
+        """ Sparse rows hold the same values of the dense features, in the same order. """
+        dense_provider = PatientsFromHistoricalDataProvider(historical_data=self.historical_data)
+        sparse_provider = PatientsFromHistoricalDataProvider(historical_data=self.historical_data, sparse_features=True)
+
+        self.assertNotIn('procedure_p2', sparse_provider.historical_data.columns)
+
+        for _ in range(3):
+            with patch('random.choice', side_effect=lambda x: x[0]):
+                dense_patient = dense_provider.provide_patient()
+                sparse_patient = sparse_provider.provide_patient()
+
+            self.assertEqual(dense_patient.id, sparse_patient.id)
+            self.assertTrue(sp.issparse(sparse_patient.features))
+            self.assertTrue(np.allclose(dense_patient.features.astype(float), 
+                                        sparse_patient.features.toarray().ravel()))
+
+
+class TestPatientsFromHistoricalStoreProvider(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.historical_data = pd.DataFrame({
+            'equipe': rng.choice(['A', 'B', 'C'], 50),
+            'procedure': rng.choice(['p1', 'p2', 'p3', 'p4'], 50),
+            'age': rng.integers(20, 90, 50),
+            'urgency': rng.integers(0, 3, 50),
+            'days_waiting': rng.integers(0, 60, 50),
+            'target': rng.uniform(30, 300, 50),
+        })
+        # The first rows do not contain all the categories
+        self.historical_data.loc[:9, 'procedure'] = 'p1'
+
+        self.directory = tempfile.TemporaryDirectory()
+        source = os.path.join(self.directory.name, 'history.csv')
+        self.historical_data.to_csv(source, index=False)
+
+        self.store = HistoricalDataStore.build(source, os.path.join(self.directory.name, 'store'), chunksize=7)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_content(self):
+        """ The store keeps all rows and the categories found in every chunk. """
+        self.assertEqual(self.store.num_of_rows, 50)
+        self.assertEqual(self.store.categories['procedure'], ['p1', 'p2', 'p3', 'p4'])
+        self.assertTrue(np.allclose(self.store.column('target'), self.historical_data['target']))
+
+        reopened = HistoricalDataStore(self.store._path)
+        self.assertEqual(reopened.feature_names, self.store.feature_names)
+
+    def test_patients_match_dataframe_provider(self):
+        """ Patients from the store are the same provided from the dataframe. """
+        dataframe_provider = PatientsFromHistoricalDataProvider(historical_data=self.historical_data)
+        store_provider = PatientsFromHistoricalStoreProvider(store=self.store)
+
+        for _ in range(5):
+            with patch('random.choice', side_effect=lambda x: x[0]):
+                expected = dataframe_provider.provide_patient()
+                patient = store_provider.provide_patient()
+
+            self.assertEqual(patient.id, expected.id)
+            self.assertEqual(patient.equipe, expected.equipe)
+            self.assertEqual(patient.urgency, expected.urgency)
+            self.assertAlmostEqual(patient.target, expected.target)
+            self.assertTrue(np.allclose(patient.features, expected.features.astype(float)))
+
+    def test_requested_characteristics(self):
+        """ Requested equipe and urgency are respected, rows are not sampled twice. """
+        provider = PatientsFromHistoricalStoreProvider(store=self.store)
+        expected = ((self.historical_data['equipe'] == 'B') & (self.historical_data['urgency'] == 1)).sum()
+
+        patients = [provider.provide_patient(requested_equipe='B', requested_urgency=1) for _ in range(expected)]
+
+        self.assertTrue(all(x.equipe == 'B' and x.urgency == 1 for x in patients))
+        self.assertEqual(len(set(x.id for x in patients)), expected)
+        self.assertIsNone(provider.provide_patient(requested_equipe='B', requested_urgency=1))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+# Python STL
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Packages
+import numpy as np
+import scipy.sparse as sp
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal
+
+# Objects of test
+from surgeryschedulingunderuncertainty.prediction_cache import PredictionCache, row_hashes
+
+
+def make_patients(quantity, seed = 0):
+    rng = np.random.default_rng(seed)
+    features = rng.uniform(0, 1, (quantity, 3))
+    targets = np.exp(4 + features[:, 0] + rng.normal(0, 0.1, quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=10, features=features[id], target=targets[id])
+            for id in range(quantity)]
+
+
+def double(features):
+    return 2 * np.asarray(features)
+
+
+class TestPredictionCache(unittest.TestCase):
+
+    def test_only_missing_rows_are_computed(self):
+        cache = PredictionCache()
+        features = np.arange(12, dtype=float).reshape(4, 3)
+
+        self.assertTrue(np.allclose(cache.lookup('model', features[:2], double), double(features[:2])))
+
+        with patch(f'{__name__}.double', side_effect=double) as mock_compute:
+            result = cache.lookup('model', features, mock_compute)
+            computed = mock_compute.call_args[0][0]
+
+        self.assertTrue(np.allclose(result, double(features)))
+        self.assertTrue(np.allclose(computed, features[2:]))
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_keys_depend_on_the_model(self):
+        cache = PredictionCache()
+        features = np.ones((1, 3))
+        cache.lookup('model', features, double)
+        self.assertTrue(np.allclose(cache.lookup('other', features, lambda x: 3 * x), 3))
+
+    def test_least_recently_used_are_evicted(self):
+        cache = PredictionCache(max_size=2)
+        rows = np.eye(3)
+        cache.lookup('model', rows[[0]], double)
+        cache.lookup('model', rows[[1]], double)
+        cache.lookup('model', rows[[0]], double)
+        cache.lookup('model', rows[[2]], double)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 1)
+        cache.lookup('model', rows[[0]], double)
+        self.assertEqual(cache.hits, 2)
+
+    def test_disk_tier(self):
+        features = np.random.default_rng(0).uniform(size=(5, 3))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'predictions.sqlite')
+            PredictionCache(path=path).lookup('model', features, double)
+
+            cache = PredictionCache(path=path)
+            result = cache.lookup('model', features, lambda x: self.fail("computed again"))
+            self.assertTrue(np.allclose(result, double(features)))
+            self.assertEqual(cache.hits, 5)
+
+    def test_sparse_rows_hash_as_their_content(self):
+        dense = np.array([[0., 1., 0.], [2., 0., 0.], [0., 1., 0.]])
+        hashes = row_hashes(sp.csr_matrix(dense))
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertNotEqual(hashes[0], hashes[1])
+
+
+class TestCachedPredictions(unittest.TestCase):
+
+    def test_model_runs_only_on_new_patients(self):
+        model = NGBLogNormal(patients=make_patients(60), hyperparameters={'n_estimators': 20})
+        expected = model.predict_batch(make_patients(6, seed=1)).nominal_values
+
+        model.prediction_cache = PredictionCache()
+        model.predict_batch(make_patients(4, seed=1))
+
+        with patch.object(model, '_predict_raw', wraps=model._predict_raw) as mock_predict:
+            batch = model.predict_batch(make_patients(6, seed=1))
+            self.assertEqual(mock_predict.call_args[0][0].shape[0], 2)
+
+        self.assertTrue(np.allclose(batch.nominal_values, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
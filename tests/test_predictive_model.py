@@ -1,3 +1,250 @@
+# Python STL
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
+# Packages
+import numpy as np
+import scipy.sparse as sp
+from sklearn.ensemble import HistGradientBoostingRegressor
 
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+
+# Objects of test
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal, NGBNormal, XGBQuantile, _pinball_loss
+
+
+def make_patients(quantity, sparse = False, seed = 0):
+    rng = np.random.default_rng(seed)
+    patients = []
+    for id in range(quantity):
+        features = np.zeros(6)
+        features[0] = rng.integers(20, 90)
+        features[1 + rng.integers(0, 5)] = 1.0
+        target = np.exp(4 + 0.01 * features[0] + 0.3 * features[2] + rng.normal(0, 0.2))
+        if sparse:
+            features = sp.csr_matrix(features)
+        patients.append(Patient(id=id, equipe='A', urgency=1, days_waiting=10, features=features, target=target))
+    return patients
+
+
+class TestSparseTraining(unittest.TestCase):
+
+    def test_training_features_stay_sparse(self):
+        """ The model is trained and used on CSR features without densifying them. """
+        training = make_patients(60, sparse=True)
+        model = NGBLogNormal(patients=training)
+
+        self.assertTrue(sp.issparse(model._training_features))
+        self.assertEqual(model._training_features.shape, (60, 6))
+
+        patients = model.predict(make_patients(5, sparse=True, seed=1))
+        for patient in patients:
+            self.assertGreater(patient.uncertainty_profile.nominal_value, 0)
+
+
+class TestPredictBatch(unittest.TestCase):
+
+    def test_predict_batch_attaches_profiles(self):
+        """ The batch is attached to the patients, profiles are built when accessed. """
+        model = NGBLogNormal(patients=make_patients(60))
+        patients = make_patients(4, seed=1)
+
+        batch = model.predict_batch(patients)
+
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(batch._profiles, {})
+        for index, patient in enumerate(patients):
+            self.assertAlmostEqual(patient.uncertainty_profile.nominal_value, batch.nominal_values[index])
+            self.assertAlmostEqual(patient.uncertainty_profile.percent_point_function(0.8), 
+                                   batch.percent_point_function(0.8)[index])
+
+
+class TestTrainOnce(unittest.TestCase):
+
+    def setUp(self):
+        self.patients = make_patients(40)
+        self.hyperparameters = {'n_estimators': 20}
+
+    def test_construction_and_training_are_separate(self):
+        """ The model is fitted once, train() does not fit again unless forced. """
+        with patch('ngboost.NGBRegressor.fit') as mock_fit:
+            model = NGBNormal(patients=self.patients, hyperparameters=self.hyperparameters, train=False)
+            self.assertFalse(model.trained)
+            model.train()
+            model.train()
+            self.assertEqual(mock_fit.call_count, 1)
+            model.train(force=True)
+            self.assertEqual(mock_fit.call_count, 2)
+
+    def test_fingerprint(self):
+        """ Fingerprint depends on class, hyperparameters and training data. """
+        model = NGBLogNormal(patients=self.patients, hyperparameters=self.hyperparameters, train=False)
+        same = NGBLogNormal(patients=make_patients(40), hyperparameters=self.hyperparameters, train=False)
+        other_class = NGBNormal(patients=self.patients, hyperparameters=self.hyperparameters, train=False)
+        other_hyperparameters = NGBLogNormal(patients=self.patients, hyperparameters={'n_estimators': 30}, train=False)
+        other_data = NGBLogNormal(patients=make_patients(40, seed=1), hyperparameters=self.hyperparameters, train=False)
+
+        self.assertEqual(model.fingerprint(), same.fingerprint())
+        self.assertNotEqual(model.fingerprint(), other_class.fingerprint())
+        self.assertNotEqual(model.fingerprint(), other_hyperparameters.fingerprint())
+        self.assertNotEqual(model.fingerprint(), other_data.fingerprint())
+
+    def test_save_and_load(self):
+        model = NGBLogNormal(patients=self.patients, hyperparameters=self.hyperparameters)
+        inference_patients = make_patients(3, seed=2)
+        expected = model.predict_batch(inference_patients).nominal_values
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.pkl')
+            model.save(path)
+
+            restored = NGBLogNormal(patients=self.patients, hyperparameters=self.hyperparameters, train=False)
+            restored.load(path)
+            self.assertTrue(restored.trained)
+            self.assertTrue(np.allclose(restored.predict_batch(inference_patients).nominal_values, expected))
+
+            different = NGBLogNormal(patients=make_patients(40, seed=1), hyperparameters=self.hyperparameters, train=False)
+            with self.assertRaises(ValueError):
+                different.load(path)
+
+
+class TestIncrementalUpdate(unittest.TestCase):
+
+    hyperparameters = {'n_estimators': 50}
+
+    def setUp(self):
+        self.model = NGBLogNormal(patients=make_patients(200), hyperparameters=self.hyperparameters)
+
+    def test_warm_start_appends_iterations(self):
+        init_params = self.model._model.init_params.copy()
+        fingerprint = self.model.fingerprint()
+
+        report = self.model.update(make_patients(50, seed=1), additional_iterations=10)
+
+        self.assertEqual(report['mode'], 'warm_start')
+        self.assertEqual(len(self.model._model.base_models), 60)
+        self.assertEqual(self.model._model.n_estimators, 50)
+        # The marginal fit of the first training is kept
+        self.assertTrue(np.allclose(self.model._model.init_params, init_params))
+        self.assertEqual(len(self.model._patients), 250)
+        self.assertNotEqual(self.model.fingerprint(), fingerprint)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.model.save(os.path.join(directory, 'model.pkl'))
+
+    def test_sliding_window(self):
+        report = self.model.update(make_patients(50, seed=1), window=120)
+
+        self.assertEqual(report['mode'], 'window')
+        self.assertEqual(len(self.model._patients), 120)
+        self.assertEqual(len(self.model._model.base_models), 50)
+
+    def test_drift(self):
+        """ Same distribution: no retrain. Longer surgeries: retrain recommended. """
+        self.assertFalse(self.model.drift(make_patients(200, seed=1))['retrain_recommended'])
+
+        shifted = make_patients(200, seed=2)
+        for patient in shifted:
+            patient.target = patient.target * 1.5
+        report = self.model.drift(shifted)
+
+        self.assertTrue(report['retrain_recommended'])
+        self.assertGreater(report['nll_shift'], 0.25)
+        self.assertLess(report['ks_pvalue'], 0.01)
+
+    def test_drift_reference_is_out_of_sample(self):
+        """ The reference is not the fit on the training patients, optimistic for boosting. """
+        model = NGBLogNormal(patients=make_patients(200), hyperparameters={'n_estimators': 500})
+        report = model.drift(make_patients(200, seed=1))
+        self.assertGreater(report['nll_reference'], model.negative_log_likelihood(model._patients) + 0.25)
+
+        validation = make_patients(100, seed=5)
+        model.train(force=True, validation_patients=validation)
+        report = model.drift(make_patients(200, seed=1))
+        self.assertAlmostEqual(report['nll_reference'], model.negative_log_likelihood(validation))
+
+        # Kept by a warm start
+        model.update(make_patients(50, seed=6), additional_iterations=10)
+        self.assertEqual(model.drift(make_patients(200, seed=1))['nll_reference'], report['nll_reference'])
+
+
+class TestXGBQuantile(unittest.TestCase):
+
+    def test_quantiles_are_ordered_and_calibrated(self):
+        training = make_patients(400)
+        model = XGBQuantile(patients=training, hyperparameters={'quantiles': [0.1, 0.5, 0.9], 'max_iter': 50})
+        test = make_patients(400, seed=1)
+
+        batch = model.predict_batch(test)
+        self.assertTrue(np.all(np.diff(batch.values, axis=1) >= 0))
+
+        target = np.array([patient.target for patient in test])
+        coverage = np.mean(target <= batch.percent_point_function(0.9))
+        self.assertGreater(coverage, 0.8)
+        self.assertLess(coverage, 0.97)
+        self.assertTrue(np.isfinite(model.negative_log_likelihood(test)))
+
+    def test_warm_start(self):
+        model = XGBQuantile(patients=make_patients(200), hyperparameters={'quantiles': [0.1, 0.5, 0.9], 'max_iter': 30})
+        fingerprint = model.fingerprint()
+        test = make_patients(20, seed=2)
+        before = model.predict_batch(test).percent_point_function(0.5)
+
+        longer = make_patients(200, seed=1)
+        for patient in longer:
+            patient.target = patient.target * 1.5
+        report = model.update(longer, additional_iterations=10)
+
+        self.assertEqual(report['mode'], 'warm_start')
+        self.assertEqual([regressor.n_iter_ for regressor in model._model.models], [30, 30, 30])
+        self.assertEqual([regressor.n_iter_ for regressor in model._model.corrections[0]], [10, 10, 10])
+        self.assertGreater(np.mean(model.predict_batch(test).percent_point_function(0.5)), np.mean(before))
+        self.assertNotEqual(model.fingerprint(), fingerprint)
+
+    def test_warm_start_keeps_the_fitted_regressors(self):
+        training = make_patients(200)
+        model = XGBQuantile(patients=training, hyperparameters={'quantiles': [0.1, 0.5, 0.9], 'max_iter': 30})
+        features, _ = model._extract_evaluation_data(training)
+        first = model._model.predict(features)
+
+        new = make_patients(100, seed=3)
+        for patient in new:
+            patient.target = patient.target * 1.5
+        model.update(new, additional_iterations=10)
+
+        # The prediction of the first fit plus the one of the added trees
+        added = np.column_stack([regressor.predict(features) for regressor in model._model.corrections[0]])
+        np.testing.assert_allclose(model._model.predict(features) - added, first, rtol=0, atol=1e-9)
+
+    def test_early_stopping_on_the_validation_patients(self):
+        validation = make_patients(100, seed=4)
+        model = XGBQuantile(patients=make_patients(300), hyperparameters={'quantiles': [0.1, 0.5, 0.9], 'max_iter': 200},
+                            train=False)
+        model.train(validation_patients=validation, early_stopping_rounds=5)
+        features, target = model._extract_evaluation_data(validation)
+
+        for regressor in model._model.models:
+            # The validation loss of every iteration, from the same fit without early stopping
+            reference = HistGradientBoostingRegressor(loss='quantile', quantile=regressor.quantile, max_iter=200,
+                                                      random_state=0).fit(model._training_features, 
+                                                                          model._training_target.ravel())
+            predictions = list(reference.staged_predict(features))
+            losses = [_pinball_loss(target, prediction, regressor.quantile) for prediction in predictions]
+            best = regressor.n_iter_
+            self.assertLess(best, 200)
+            # The first minimum of the validation loss, not improved in the next rounds
+            self.assertEqual(np.argmin(losses[:best + 5]), best - 1)
+            np.testing.assert_allclose(regressor.predict(features), predictions[best - 1])
+
+    def test_sparse_features_are_accepted(self):
+        model = XGBQuantile(patients=make_patients(100, sparse=True), hyperparameters={'max_iter': 20})
+        patients = model.predict(make_patients(3, sparse=True, seed=1))
+        for patient in patients:
+            self.assertGreater(patient.uncertainty_profile.nominal_value, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Python STL
+import tempfile
+import unittest
+
+# Packages
+
+# Modules
+from surgeryschedulingunderuncertainty.master import Master
+from surgeryschedulingunderuncertainty.synthetic import synthetic_history, synthetic_master, URGENCY_TO_MAX_WAITING_DAYS
+
+# Objects of test
+from surgeryschedulingunderuncertainty.scheduler import Scheduler
+
+
+def make_scheduler(**arguments):
+    defaults = dict(historical_data=synthetic_history(400, num_of_equipes=2, seed=0),
+                    master_schedule=Master(table=synthetic_master(5, num_of_equipes=2, seed=0)),
+                    num_of_patients=15,
+                    num_patients_training=150,
+                    robustness_risk=0.2,
+                    robustness_overtime=10,
+                    urgency_to_max_waiting_days=URGENCY_TO_MAX_WAITING_DAYS,
+                    hyperparameters={'n_estimators': 50})
+    return Scheduler(**{**defaults, **arguments})
+
+
+def sources(scheduler):
+    return dict(zip(scheduler.stages['stage'], scheduler.stages['source']))
+
+
+def assignment(schedule):
+    return [[patient.id for patient in block.patients] for block in schedule.blocks]
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_run(self):
+        scheduler = make_scheduler()
+        schedule = scheduler.run()
+        self.assertEqual(len(schedule.blocks), 5)
+        self.assertGreater(sum(block.get_num_of_patients() for block in schedule.blocks), 0)
+        self.assertEqual(set(sources(scheduler).values()), {'computed'})
+        self.assertEqual(scheduler.report['iteration'].iloc[0], 1)
+
+    def test_changed_risk_skips_to_the_optimization(self):
+        scheduler = make_scheduler(optimizer_type='budget_set')
+        first = scheduler.run()
+
+        self.assertEqual(assignment(scheduler.run()), assignment(first))
+        self.assertEqual(set(sources(scheduler).values()), {'memory'})
+
+        scheduler.robustness_risk = 0.05
+        scheduler.run()
+        self.assertEqual(sources(scheduler), {'patients': 'memory', 'model': 'memory', 'predictions': 'memory',
+                                              'instance': 'computed', 'schedule': 'computed'})
+
+        # The cached stages are not modified by the later ones
+        scheduler.robustness_risk = 0.2
+        self.assertEqual(assignment(scheduler.run()), assignment(first))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = make_scheduler(optimizer_type='vanilla', cache_dir=directory)
+            schedule = first.run()
+            second = make_scheduler(optimizer_type='vanilla', cache_dir=directory)
+            self.assertEqual(assignment(second.run()), assignment(schedule))
+            self.assertEqual(set(sources(second).values()), {'disk'})
+
+            second.clear_cache(['schedule'])
+            second.max_loops = 3
+            second.run()
+            self.assertEqual(sources(second)['schedule'], 'computed')
+
+    def test_fingerprint(self):
+        scheduler = make_scheduler()
+        fingerprint = scheduler.fingerprint()
+        self.assertEqual(make_scheduler().fingerprint(), fingerprint)
+        self.assertNotEqual(make_scheduler(seed=1).fingerprint(), fingerprint)
+        self.assertNotEqual(make_scheduler(max_loops=5).fingerprint(), fingerprint)
+        self.assertEqual(make_scheduler(max_loops=5).fingerprint(exclude=('max_loops',)),
+                         scheduler.fingerprint(exclude=('max_loops',)))
+        # No stage is computed
+        self.assertEqual(len(scheduler.stages), 0)
+
+    def test_unknown_optimizer(self):
+        with self.assertRaises(ValueError):
+            make_scheduler(optimizer_type='annealing')
+
+
+if __name__ == '__main__':
+    unittest.main()
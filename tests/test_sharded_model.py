@@ -0,0 +1,144 @@
+# Python STL
+import unittest
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBNormal
+from surgeryschedulingunderuncertainty.prediction_cache import PredictionCache
+from surgeryschedulingunderuncertainty.uncertainty_profile import CompositeProfileBatch
+
+# Objects of test
+from surgeryschedulingunderuncertainty.sharded_model import EquipeShardedModel
+
+
+def make_patients(sizes, seed = 0):
+    """ Patients of several equipes, durations are shifted by equipe. """
+    rng = np.random.default_rng(seed)
+    patients = []
+    for shift, (equipe, quantity) in enumerate(sizes.items()):
+        for _ in range(quantity):
+            features = np.array([rng.uniform(0, 1), rng.uniform(0, 1)])
+            target = 60 + 100 * shift + 20 * features[0] + rng.normal(0, 2)
+            patients.append(Patient(id=len(patients), equipe=equipe, urgency=1, days_waiting=0, 
+                                    features=features, target=target))
+    return patients
+
+
+class TestEquipeShardedModel(unittest.TestCase):
+
+    hyperparameters = {'n_estimators': 100}
+
+    def setUp(self):
+        self.model = EquipeShardedModel(patients=make_patients({'A': 60, 'B': 60, 'C': 5}),
+                                        hyperparameters=self.hyperparameters,
+                                        model_class=NGBNormal,
+                                        min_shard_size=20,
+                                        max_workers=2)
+
+    def test_shards_and_fallback(self):
+        self.assertEqual(sorted(self.model.shards), ['A', 'B'])
+        # The fallback is trained on the equipes without a shard only
+        self.assertEqual({patient.equipe for patient in self.model.fallback._patients}, {'C'})
+        self.assertTrue(all(model.trained for model in self.model._model.values()))
+
+    def test_predict_is_routed_by_equipe(self):
+        patients = make_patients({'B': 3, 'A': 3, 'Z': 2}, seed=1)
+        batch = self.model.predict_batch(patients)
+
+        self.assertIsInstance(batch, CompositeProfileBatch)
+        self.assertEqual(len(batch), 8)
+
+        # Each patient gets the prediction of the model of its equipe
+        for patient, nominal_value in zip(patients, batch.nominal_values):
+            model = self.model._model[patient.equipe if patient.equipe in self.model.shards else None]
+            expected = model._predict_profiles(patient.features.reshape(1, -1)).nominal_values[0]
+            self.assertAlmostEqual(nominal_value, expected)
+            self.assertAlmostEqual(patient.uncertainty_profile.nominal_value, expected)
+
+        self.assertEqual(batch.percent_point_function(0.9).shape, (8,))
+        self.assertEqual(batch.sample(size=4).shape, (4, 8))
+
+    def test_forced_train_refits_the_shards(self):
+        """ A forced train refits the trained shards, with the validation patients of their equipe. """
+        self.assertIsNone(self.model.shards['A']._model.best_val_loss_itr)
+
+        validation = make_patients({'A': 20, 'B': 20}, seed=5)
+        self.model.train(force=True, validation_patients=validation, early_stopping_rounds=5)
+
+        for shard in self.model.shards.values():
+            self.assertIsNotNone(shard._model.best_val_loss_itr)
+
+    def test_state_of_parallel_training(self):
+        """ The shards trained in other processes keep the drift reference of their validation patients. """
+        validation = make_patients({'A': 20, 'B': 20}, seed=5)
+        self.model.train(force=True, validation_patients=validation)
+
+        for equipe, shard in self.model.shards.items():
+            patients = [patient for patient in validation if patient.equipe == equipe]
+            self.assertAlmostEqual(shard._reference_nll, shard.negative_log_likelihood(patients))
+            self.assertEqual(shard.drift(patients)['nll_shift'], 0.)
+
+    def test_retrain_shard(self):
+        """ Only the shard of the equipe is refitted, on the new data. """
+        other = self.model.shards['A']._model
+        fallback = self.model.fallback._model
+        fingerprint = self.model.fingerprint()
+
+        self.model.retrain_shard('B', patients=make_patients({'B': 40}, seed=2))
+
+        self.assertIs(self.model.shards['A']._model, other)
+        self.assertIs(self.model.fallback._model, fallback)
+        self.assertEqual(len(self.model.shards['B']._patients), 40)
+        self.assertTrue(self.model.shards['B'].trained)
+        self.assertNotEqual(self.model.fingerprint(), fingerprint)
+
+    def test_cached_predictions_after_update(self):
+        """ After a warm start the cache does not serve the predictions of the old shards. """
+        self.model.prediction_cache = PredictionCache()
+        patients = make_patients({'A': 3, 'C': 2}, seed=1)
+        before = self.model.predict_batch(patients).nominal_values
+
+        # Longer surgeries for A: its shard and the fallback are updated
+        new_patients = make_patients({'A': 40, 'C': 5}, seed=3)
+        for patient in new_patients:
+            patient.target = patient.target + 40
+        self.model.update(new_patients, additional_iterations=50)
+
+        cached = self.model.predict_batch(patients).nominal_values
+        self.model.prediction_cache = None
+        expected = self.model.predict_batch(patients).nominal_values
+
+        self.assertTrue(np.allclose(cached, expected))
+        self.assertFalse(np.allclose(cached, before))
+
+    def test_retrain_small_equipe_refits_fallback(self):
+        shard = self.model.shards['A']._model
+        fallback = self.model.fallback
+
+        self.model.retrain_shard('C', patients=make_patients({'C': 8}, seed=4))
+
+        self.assertIsNot(self.model.fallback, fallback)
+        self.assertTrue(self.model.fallback.trained)
+        self.assertEqual(len(self.model.fallback._patients), 8)
+        self.assertIs(self.model.shards['A']._model, shard)
+
+    def test_fallback_fitted_when_needed(self):
+        """ Every equipe has a shard: the fallback is fitted, on all the patients, for an unseen equipe. """
+        model = EquipeShardedModel(patients=make_patients({'A': 30, 'B': 30}), hyperparameters=self.hyperparameters,
+                                   model_class=NGBNormal, min_shard_size=20, max_workers=1)
+        self.assertTrue(model.trained)
+        self.assertFalse(model.fallback.trained)
+
+        model.predict_batch(make_patients({'A': 2}, seed=1))
+        self.assertFalse(model.fallback.trained)
+
+        model.predict_batch(make_patients({'Z': 2}, seed=1))
+        self.assertTrue(model.fallback.trained)
+        self.assertEqual(len(model.fallback._patients), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
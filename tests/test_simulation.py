@@ -0,0 +1,97 @@
+# Python STL
+import types
+import unittest
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.block import ScheduleBlock
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.uncertainty_profile import NormalDistribution
+
+# Objects of test
+from surgeryschedulingunderuncertainty.simulation import DaySimulator
+
+
+def make_block(order, duration, room, order_in_day, patients, weekday = 1):
+    block = ScheduleBlock(duration=duration, equipes=['E', 'F'], room=room, weekday=weekday, order_in_day=order_in_day,
+                          order_in_week=0, order_in_schedule=order)
+    for patient_id, equipe, nominal in patients:
+        block.add_patient(Patient(id=patient_id, equipe=equipe, urgency=1, days_waiting=0,
+                                  uncertainty_profile=NormalDistribution(param_loc=nominal, param_scale=10)))
+    return block
+
+
+def make_schedule():
+    """
+    Room R1: block 0 (240 minutes, patients 1 and 2 of equipe E) then block 1
+    (120 minutes, patient 3 of equipe F). Room R2: block 2 (240 minutes,
+    patient 4 of equipe E, planned at the same time as patient 1).
+    """
+    return types.SimpleNamespace(blocks=[
+        make_block(0, 240, 'R1', 1, [(1, 'E', 100), (2, 'E', 100)]),
+        make_block(1, 120, 'R1', 2, [(3, 'F', 60)]),
+        make_block(2, 240, 'R2', 3, [(4, 'E', 50)]),
+    ])
+
+
+class TestDaySimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = DaySimulator(make_schedule())
+
+    def test_plan(self):
+        surgeries = self.simulator.surgeries
+        self.assertEqual(list(surgeries['patient']), [1, 4, 2, 3])
+        self.assertEqual(list(surgeries['nominal_start']), [0, 0, 100, 240])
+        self.assertEqual(list(self.simulator._closing), [360, 240])
+
+    def test_equipe_contention(self):
+        trace = self.simulator.trace([100, 50, 100, 60]).set_index('patient')
+        # Patient 4 waits for equipe E, then delays patient 2 in the other room
+        self.assertEqual(trace.loc[4, 'start'], 100)
+        self.assertEqual(trace.loc[2, 'start'], 150)
+        self.assertEqual(trace.loc[3, 'start'], 250)
+        self.assertFalse(trace['cancelled'].any())
+
+    def test_overrun_cancels_and_delays(self):
+        trace = self.simulator.trace([300, 50, 100, 80]).set_index('patient')
+        self.assertTrue(trace.loc[4, 'cancelled'])
+        self.assertTrue(trace.loc[2, 'cancelled'])
+        self.assertFalse(trace.loc[3, 'cancelled'])
+        self.assertEqual(trace.loc[3, 'end'], 380)
+
+        start, cancelled, room_end, busy = self.simulator.simulate(np.array([[300, 50, 100, 80]]))
+        np.testing.assert_array_equal(room_end[0], [380, 0])
+        np.testing.assert_array_equal(busy[0], [380, 0])
+
+    def test_overtime_tolerance(self):
+        simulator = DaySimulator(make_schedule(), overtime_tolerance=60)
+        trace = simulator.trace([300, 50, 100, 80]).set_index('patient')
+        # Patient 2 starts at 300 and ends, nominally, at 400 <= 360 + 60
+        self.assertFalse(trace.loc[2, 'cancelled'])
+
+    def test_batch_matches_single_scenarios(self):
+        rng = np.random.default_rng(0)
+        durations = rng.uniform(30, 250, size=(50, 4))
+        start, cancelled, room_end, _ = self.simulator.simulate(durations)
+        for scenario in range(0, 50, 7):
+            trace = self.simulator.trace(durations[scenario])
+            np.testing.assert_array_equal(trace['start'], start[scenario])
+            np.testing.assert_array_equal(trace['cancelled'], cancelled[scenario])
+
+    def test_run(self):
+        simulator = DaySimulator(make_schedule(), chunk_size=3000, seed=0)
+        room_days = simulator.run(n_scenarios=10000)
+
+        self.assertEqual(list(room_days['room']), ['R1', 'R2'])
+        self.assertTrue(np.all((room_days['overtime_probability'] >= 0) & (room_days['overtime_probability'] <= 1)))
+        # Nominally nothing is cancelled, but patient 2 often starts late
+        self.assertLess(simulator.summary['cancellation_rate'], 0.1)
+        self.assertGreater(simulator.surgeries.set_index('patient').loc[2, 'mean_start_delay'], 40)
+        self.assertAlmostEqual(simulator.summary['expected_idle'], room_days['expected_idle'].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# Python STL
+import types
+import unittest
+
+# Packages
+import numpy as np
+import pyomo.environ as pyo
+
+# Modules
+from surgeryschedulingunderuncertainty.implementor import StandardImplementor, ChanceConstraintsImplementor, BSImplementor
+
+# Objects of test
+from surgeryschedulingunderuncertainty.symmetry import symmetry_pairs
+
+
+def make_instance_data(seed = 0, n_days = 2, n_rooms = 3, n_pats = 14):
+    """ Identical rooms every day, patients from a few classes. """
+    rng = np.random.default_rng(seed)
+    n_blocks = n_days * n_rooms
+    durations = rng.choice([60., 90., 150.], n_pats)
+    urgencies = rng.choice([1., 3.], n_pats)
+    return {None: {
+        'n_days': {None: n_days},
+        'n_rooms': {None: n_rooms},
+        'n_blocks': {None: n_blocks},
+        'n_pats': {None: n_pats},
+        'n_realizations': {None: 0},
+        'c_exclusion': {None: 1},
+        'c_delay': {None: 1},
+        'g': {b + 1: 240 for b in range(n_blocks)},
+        'a': {(b + 1, i + 1): 1 for b in range(n_blocks) for i in range(n_pats)},
+        't': {i + 1: durations[i] for i in range(n_pats)},
+        'u': {i + 1: urgencies[i] for i in range(n_pats)},
+        'w': {i + 1: 0. for i in range(n_pats)},
+        'l': {i + 1: 2. for i in range(n_pats)},
+        'f': {i + 1: 1.2 * durations[i] for i in range(n_pats)},
+        'gamma': {b + 1: 2 for b in range(n_blocks)},
+        'time_increment': {b + 1: 20. for b in range(n_blocks)},
+    }}
+
+
+def objective(solution):
+    return solution.obj() if callable(solution.obj) and not isinstance(solution.obj, pyo.Objective) else pyo.value(solution.obj)
+
+
+class TestSymmetryPairs(unittest.TestCase):
+
+    def test_pairs(self):
+        data = make_instance_data()
+        data[None]['g'][2] = 120
+        data[None]['t'] = {i + 1: [60., 60., 90., 60.][i % 4] for i in range(14)}
+        data[None]['f'] = {i + 1: 1.2 * data[None]['t'][i + 1] for i in range(14)}
+        data[None]['u'] = {i + 1: 1. for i in range(14)}
+        block_pairs, patient_pairs = symmetry_pairs(data)
+
+        # Days of 6 blocks in 2 days, as in YVarDefRule: blocks 1-2 day 1, 3-5 day 2, 6 day 3
+        self.assertEqual(block_pairs, [(3, 4), (4, 5)])
+        # Patients 1, 2, 4, 5, 6, ... have t = 60, patients 3, 7, 11 have t = 90
+        self.assertEqual(patient_pairs[:3], [(1, 2), (2, 4), (4, 5)])
+        self.assertIn((3, 7), patient_pairs)
+        self.assertIn((7, 11), patient_pairs)
+        self.assertNotIn((2, 3), patient_pairs)
+
+    def test_compatibility_separates_classes(self):
+        data = make_instance_data()
+        data[None]['a'][(1, 1)] = 0
+        _, patient_pairs = symmetry_pairs(data)
+        self.assertFalse(any(1 in pair for pair in patient_pairs))
+
+
+class TestSymmetryBreaking(unittest.TestCase):
+
+    def check_same_objective(self, make_implementor):
+        for seed in range(2):
+            data = make_instance_data(seed=seed)
+            implementor = make_implementor(False)
+            implementor.instance_data = data
+            expected = objective(implementor.run())
+
+            for symmetry_breaking in [True, 'blocks', 'patients']:
+                implementor = make_implementor(symmetry_breaking)
+                implementor.instance_data = data
+                self.assertAlmostEqual(objective(implementor.run()), expected, places=6)
+
+    def test_standard(self):
+        for backend in ['pyomo', 'matrix']:
+            self.check_same_objective(lambda symmetry_breaking:
+                                      StandardImplementor(backend=backend, symmetry_breaking=symmetry_breaking))
+
+    def test_chance_constraints(self):
+        task = types.SimpleNamespace(robustness_overtime=10)
+        self.check_same_objective(lambda symmetry_breaking:
+                                  ChanceConstraintsImplementor(task=task, symmetry_breaking=symmetry_breaking))
+
+    def test_budget_set(self):
+        self.check_same_objective(lambda symmetry_breaking:
+                                  BSImplementor(task=None, backend='matrix', symmetry_breaking=symmetry_breaking))
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            StandardImplementor(symmetry_breaking='rooms')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# Python STL
+import unittest
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.master import Master
+from surgeryschedulingunderuncertainty.patients_provider import PatientsFromHistoricalDataProvider
+
+# Objects of test
+from surgeryschedulingunderuncertainty.synthetic import synthetic_equipes, synthetic_history, synthetic_master
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_equipes(self):
+        equipes = synthetic_equipes(28)
+        self.assertEqual(equipes[:3], ['A', 'B', 'C'])
+        self.assertEqual(equipes[25:], ['Z', 'AA', 'AB'])
+
+    def test_history(self):
+        history = synthetic_history(300, num_of_equipes=3, seed=0)
+        self.assertEqual(len(history), 300)
+        self.assertEqual(set(history['equipe']), {'A', 'B', 'C'})
+        self.assertTrue(np.all(history['target'] > 0))
+        self.assertTrue(history.equals(synthetic_history(300, num_of_equipes=3, seed=0)))
+
+        provider = PatientsFromHistoricalDataProvider(historical_data=history)
+        patients, training = provider.provide_sets(quantity=10, quantity_training=50)
+        self.assertEqual(len(patients), 10)
+        self.assertEqual(len(training), 50)
+
+    def test_master(self):
+        table = synthetic_master(23, num_of_equipes=6, seed=0)
+        self.assertEqual(len(table), 23)
+        self.assertEqual(sorted(table['weekday'].value_counts()), [4, 4, 5, 5, 5])
+        equipes = {equipe for equipes in table['equipes'] for equipe in equipes.split(', ')}
+        self.assertEqual(equipes, set(synthetic_equipes(6)))
+        self.assertEqual(Master(table=table).get_num_of_blocks(), 23)
+
+    def test_master_does_not_fit(self):
+        with self.assertRaises(ValueError):
+            synthetic_master(11, num_of_rooms=1)
+        with self.assertRaises(ValueError):
+            synthetic_master(3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# Python STL
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Packages
+import numpy as np
+
+# Modules
+from surgeryschedulingunderuncertainty.patient import Patient
+from surgeryschedulingunderuncertainty.predictive_model import NGBLogNormal
+
+# Objects of test
+from surgeryschedulingunderuncertainty.tuning import HyperparameterSearch, _fold_key
+
+
+def make_patients(quantity, seed = 0):
+    rng = np.random.default_rng(seed)
+    features = rng.uniform(0, 1, (quantity, 3))
+    targets = np.exp(4 + features[:, 0] + rng.normal(0, 0.2, quantity))
+    return [Patient(id=id, equipe='A', urgency=1, days_waiting=10, features=features[id], target=targets[id])
+            for id in range(quantity)]
+
+
+class TestHyperparameterSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.patients = make_patients(60)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_grid_results(self):
+        """ Every configuration of the grid is scored, in parallel processes. """
+        search = HyperparameterSearch(NGBLogNormal, self.patients, 
+                                      param_grid={'n_estimators': [5, 10], 'max_depth': [2]},
+                                      robustness_risk=0.2, num_folds=3, max_workers=2, cache_dir=self.directory.name)
+        results = search.run()
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(list(results['n_estimators']), [5, 10])
+        self.assertTrue(np.all(np.isfinite(results['nll'])))
+        self.assertTrue(np.all((results['coverage'] >= 0) & (results['coverage'] <= 1)))
+        self.assertIn(search.best_configuration(), search.configurations)
+
+        # The calibration error of a fold is the distance of its coverage from 1 - risk, the row has their means
+        data_key = search._data_key(search._folds())
+        for number, configuration in enumerate(search.configurations):
+            scores = [search._load_fold(_fold_key(data_key, NGBLogNormal, configuration, fold, 0.2,
+                                                  search._early_stopping_rounds, search._validation_fraction))
+                      for fold in range(3)]
+            coverages = np.array([score['coverage'] for score in scores])
+            errors = np.array([score['calibration_error'] for score in scores])
+            # 60 patients in 3 folds: the coverage is a fraction of 20 test patients
+            np.testing.assert_allclose(coverages * 20, np.round(coverages * 20), atol=1e-9)
+            np.testing.assert_allclose(errors, abs(coverages - 0.8), rtol=0, atol=1e-12)
+            self.assertAlmostEqual(results.loc[number, 'coverage'], coverages.mean(), places=12)
+            self.assertAlmostEqual(results.loc[number, 'calibration_error'], errors.mean(), places=12)
+
+    def test_early_stopping(self):
+        search = HyperparameterSearch(NGBLogNormal, self.patients, param_grid=[{'n_estimators': 200}],
+                                      robustness_risk=0.2, num_folds=2, max_workers=1, early_stopping_rounds=3)
+        results = search.run()
+        self.assertLess(results.loc[0, 'iterations'], 200)
+
+    def test_cached_folds_are_not_evaluated(self):
+        """ A rerun evaluates only the configurations not in the cache. """
+        arguments = dict(robustness_risk=0.2, num_folds=2, max_workers=1, cache_dir=self.directory.name)
+        first = HyperparameterSearch(NGBLogNormal, self.patients, param_grid={'n_estimators': [5]}, **arguments).run()
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+
+        with patch('surgeryschedulingunderuncertainty.tuning._evaluate_fold',
+                   return_value={'nll': 0.0, 'coverage': 0.8, 'calibration_error': 0.0, 'iterations': 1}) as mock_evaluate:
+            second = HyperparameterSearch(NGBLogNormal, self.patients, param_grid={'n_estimators': [5, 10]}, **arguments).run()
+
+        self.assertEqual(mock_evaluate.call_count, 2)
+        self.assertAlmostEqual(second.loc[0, 'nll'], first.loc[0, 'nll'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,11 @@ from surgeryschedulingunderuncertainty.uncertainty_profile import (
     LogNormalDistribution,
     NormalDistribution,
     HistogramModel,
-    UnbalancedHistogramModel,
+    BalancedHistogramModel,
+    LogNormalDistributionBatch,
+    NormalDistributionBatch,
+    TabulatedQuantileDistribution,
+    TabulatedQuantileDistributionBatch,
 )
 
 
@@ -121,5 +125,73 @@ class TestNormalDistribution(unittest.TestCase):
 
 
 
+class TestDistributionBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.param_s = np.array([10., 25., 40.])
+        self.param_scale = np.array([90., 120., 200.])
+
+    def test_log_normal_batch_matches_profiles(self):
+        """ Vectorized nominal values and percent points match the single profiles. """
+        batch = LogNormalDistributionBatch(self.param_s, self.param_scale)
+        ppf = batch.percent_point_function(0.8)
+
+        self.assertEqual(len(batch), 3)
+        for index in range(3):
+            profile = LogNormalDistribution(self.param_s[index], self.param_scale[index])
+            self.assertAlmostEqual(batch.nominal_values[index], profile.nominal_value)
+            self.assertAlmostEqual(ppf[index], profile.percent_point_function(0.8))
+            self.assertAlmostEqual(batch[index].nominal_value, profile.nominal_value)
+
+    def test_normal_batch_matches_profiles(self):
+        batch = NormalDistributionBatch(self.param_scale, self.param_s)
+        ppf = batch.percent_point_function(0.8)
+
+        for index in range(3):
+            profile = NormalDistribution(self.param_scale[index], self.param_s[index])
+            self.assertAlmostEqual(batch.nominal_values[index], profile.nominal_value)
+            self.assertAlmostEqual(ppf[index], profile.percent_point_function(0.8))
+
+    def test_profiles_are_lazy(self):
+        """ Profile objects are created on access, once. """
+        batch = LogNormalDistributionBatch(self.param_s, self.param_scale)
+        self.assertEqual(batch._profiles, {})
+        self.assertIs(batch[1], batch[1])
+        self.assertEqual(list(batch._profiles.keys()), [1])
+
+    def test_batch_sample_shape(self):
+        batch = NormalDistributionBatch(self.param_scale, self.param_s)
+        self.assertEqual(batch.sample(size = 7).shape, (7, 3))
+
+
+class TestTabulatedQuantileDistribution(unittest.TestCase):
+
+    levels = np.array([0.1, 0.5, 0.9])
+    values = np.array([[80., 100., 150.], [30., 40., 45.]])
+
+    def test_percent_point_function_interpolates(self):
+        profile = TabulatedQuantileDistribution(self.levels, self.values[0])
+        self.assertAlmostEqual(profile.percent_point_function(0.5), 100.)
+        self.assertAlmostEqual(profile.percent_point_function(0.7), 125.)
+        # Outside the tabulated range the extreme quantiles are used
+        self.assertAlmostEqual(profile.percent_point_function(0.99), 150.)
+
+    def test_crossing_quantiles_are_sorted(self):
+        profile = TabulatedQuantileDistribution(self.levels, np.array([100., 80., 150.]))
+        self.assertAlmostEqual(profile.percent_point_function(0.1), 80.)
+
+    def test_batch_matches_profiles(self):
+        batch = TabulatedQuantileDistributionBatch(self.levels, self.values)
+        ppf = batch.percent_point_function(0.8)
+        for index in range(2):
+            profile = TabulatedQuantileDistribution(self.levels, self.values[index])
+            self.assertAlmostEqual(batch.nominal_values[index], profile.nominal_value)
+            self.assertAlmostEqual(ppf[index], profile.percent_point_function(0.8))
+
+        samples = batch.sample(size = 50)
+        self.assertEqual(samples.shape, (50, 2))
+        self.assertTrue(np.all((samples >= self.values[:, 0]) & (samples <= self.values[:, -1])))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file